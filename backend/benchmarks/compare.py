@@ -0,0 +1,70 @@
+"""
+Compare two benchmark result files written by run.py.
+
+    python benchmarks/compare.py results/before.json results/after.json --threshold 10
+
+Prints every measurement present in both runs with the relative change of
+its total time and p95 latency. Exits with status 1 when any of them got
+slower than the threshold (percent), so it can gate CI.
+"""
+import argparse
+import json
+import sys
+from typing import Dict, Tuple
+
+def load(path: str) -> Tuple[dict, Dict[Tuple[str, int], dict]]:
+    with open(path) as f:
+        report = json.load(f)
+    return report.get("environment", {}), {(r["name"], r["scale"]): r for r in report["results"]}
+
+def change(before: float, after: float) -> float:
+    if not before:
+        return 0.0
+    return (after - before) / before * 100
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent")
+    parser.add_argument("--min-ms", type=float, default=1.0, help="Ignore measurements faster than this in both runs")
+    args = parser.parse_args()
+
+    base_env, baseline = load(args.baseline)
+    curr_env, current = load(args.current)
+    print(f"baseline: {base_env.get('commit')} ({base_env.get('timestamp')})")
+    print(f"current:  {curr_env.get('commit')} ({curr_env.get('timestamp')})")
+    print()
+    print(f"{'measurement':<42} {'scale':>7} {'before s':>10} {'after s':>10} {'change':>8} {'p95 change':>11}")
+
+    regressions = []
+    for key in sorted(baseline.keys() & current.keys(), key=lambda k: (k[0], k[1] or 0)):
+        before, after = baseline[key], current[key]
+        total_change = change(before["seconds"], after["seconds"])
+        p95_change = change(before["p95_ms"], after["p95_ms"])
+        significant = max(before["p95_ms"], after["p95_ms"]) >= args.min_ms
+        flag = ""
+        if significant and (total_change > args.threshold or p95_change > args.threshold):
+            regressions.append(key)
+            flag = "  REGRESSION"
+        name, scale = key
+        print(
+            f"{name:<42} {scale if scale is not None else '-':>7} {before['seconds']:>10.3f} {after['seconds']:>10.3f} "
+            f"{total_change:>+7.1f}% {p95_change:>+10.1f}%{flag}"
+        )
+
+    only_baseline = sorted(baseline.keys() - current.keys(), key=str)
+    only_current = sorted(current.keys() - baseline.keys(), key=str)
+    if only_baseline:
+        print(f"\nOnly in baseline: {', '.join(f'{n}@{s}' for n, s in only_baseline)}")
+    if only_current:
+        print(f"Only in current: {', '.join(f'{n}@{s}' for n, s in only_current)}")
+
+    if regressions:
+        print(f"\n{len(regressions)} measurement(s) regressed by more than {args.threshold}%")
+        return 1
+    print("\nNo regressions")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
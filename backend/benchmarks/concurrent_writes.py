@@ -0,0 +1,154 @@
+"""
+Concurrency check for session writes: many writers edit the same images at
+once and no update may be lost.
+
+    python benchmarks/concurrent_writes.py --writers 50 --rounds 20
+    python benchmarks/concurrent_writes.py --writers 50 --processes
+
+Every image is edited by three writers, each owning one field: one sets its
+notes, one its display order and one its status. Each round a writer sends
+one /validate/bulk-update with its three changes. Afterwards every field
+must hold its owner's last value and the per-SKU counters must match the
+records; a read-modify-write that overwrote a concurrent edit shows up as a
+stale field. Exits non-zero on any lost update.
+
+Threads go through the HTTP API (TestClient); --processes calls the session
+store from separate worker processes instead, like several app workers
+sharing one session. tests/test_concurrent_writes.py runs the same check
+over HTTP as part of the test suite.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+EMAIL = "concurrency@example.com"
+SKUS = 5
+
+def image_name(index: int) -> str:
+    return f"IMG_{index:04d}.jpg"
+
+def writer_changes(writer: int, writers: int, round_no: int) -> List[Dict[str, Any]]:
+    """
+    The changes writer sends in round_no: notes of image writer, display
+    order of image writer - 1 and status of image writer - 2 (mod writers).
+    """
+    return [
+        {"image_name": image_name(writer), "notes": f"writer {writer} round {round_no}"},
+        {"image_name": image_name((writer - 1) % writers), "display_order": round_no + 1},
+        {"image_name": image_name((writer - 2) % writers), "status": "Approved"},
+    ]
+
+def expected_record(index: int, rounds: int) -> Dict[str, Any]:
+    return {"notes": f"writer {index} round {rounds - 1}", "display_order": rounds, "status": "Approved"}
+
+def seed(session_path: str, writers: int):
+    from services.data import save_metadata
+    save_metadata(session_path, (
+        {
+            "sku_id": f"SKU{index % SKUS}", "image_name": image_name(index),
+            "status": "Pending", "display_order": None, "notes": "",
+        }
+        for index in range(writers)
+    ))
+
+def _process_writer(args: Tuple[str, int, int, int]) -> int:
+    session_path, writer, writers, rounds = args
+    from services.data import apply_image_updates
+    for round_no in range(rounds):
+        changes = writer_changes(writer, writers, round_no)
+        apply_image_updates(session_path, [
+            (change["image_name"], {k: v for k, v in change.items() if k != "image_name"}) for change in changes
+        ])
+    return rounds
+
+def run_threads(client, writers: int, rounds: int):
+    def write(writer: int):
+        for round_no in range(rounds):
+            response = client.post(
+                "/validate/bulk-update", json={"email": EMAIL, "changes": writer_changes(writer, writers, round_no)}
+            )
+            if response.status_code != 200:
+                raise RuntimeError(f"writer {writer}: {response.status_code} {response.text}")
+
+    with ThreadPoolExecutor(max_workers=writers) as pool:
+        for future in [pool.submit(write, writer) for writer in range(writers)]:
+            future.result()
+
+def run_processes(session_path: str, writers: int, rounds: int):
+    # Spawned workers import the store fresh, sharing nothing but the files
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(writers) as pool:
+        pool.map(_process_writer, [(session_path, writer, writers, rounds) for writer in range(writers)])
+
+def lost_updates(session_path: str, writers: int, rounds: int) -> List[str]:
+    from services.data import load_metadata
+    problems = []
+    records = {record["image_name"]: record for record in load_metadata(session_path)}
+    for index in range(writers):
+        record = records.get(image_name(index), {})
+        for field, value in expected_record(index, rounds).items():
+            if record.get(field) != value:
+                problems.append(f"{image_name(index)}.{field}: expected {value!r}, found {record.get(field)!r}")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=50, help="Concurrent writers (also the number of images)")
+    parser.add_argument("--rounds", type=int, default=20, help="Bulk updates sent by each writer")
+    parser.add_argument("--processes", action="store_true", help="Write from separate processes instead of HTTP threads")
+    parser.add_argument("--workdir", help="Scratch directory (default: a new temporary directory)")
+    args = parser.parse_args()
+    if args.writers < 3:
+        parser.error("--writers must be at least 3")
+
+    work_dir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="image-validator-writes-"))
+    os.makedirs(work_dir, exist_ok=True)
+    os.environ["PIXEL_FILL_BACKGROUND"] = "0"
+    os.chdir(work_dir)
+
+    from fastapi.testclient import TestClient
+    import main as app_main
+    from services.data import check_sku_index, get_state_version
+    from services.session import get_session_path
+
+    with TestClient(app_main.app) as client:
+        client.post("/auth/login", json={"email": EMAIL}).raise_for_status()
+        session_path = os.path.abspath(get_session_path(EMAIL))
+        seed(session_path, args.writers)
+        version = get_state_version(session_path)
+
+        mode = "processes" if args.processes else "threads"
+        print(f"{args.writers} writers x {args.rounds} bulk updates ({mode})", flush=True)
+        start = time.perf_counter()
+        if args.processes:
+            run_processes(session_path, args.writers, args.rounds)
+        else:
+            run_threads(client, args.writers, args.rounds)
+        seconds = time.perf_counter() - start
+
+        writes = args.writers * args.rounds
+        print(f"  {writes} writes in {seconds:.2f}s ({writes / seconds:.0f}/s)")
+        problems = lost_updates(session_path, args.writers, args.rounds)
+        index = check_sku_index(session_path)
+        versions = get_state_version(session_path) - version
+        client.post("/auth/logout", json={"email": EMAIL})
+
+    print(f"  state version advanced by {versions} (expected {writes})")
+    print(f"  SKU counters consistent: {index['consistent']}")
+    for problem in problems[:20]:
+        print(f"  lost update: {problem}")
+    if problems or not index["consistent"] or versions != writes:
+        print(f"FAILED: {len(problems)} lost updates, counters consistent: {index['consistent']}")
+        sys.exit(1)
+    print("OK: no lost updates")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Deterministic synthetic image corpus and manifests for the benchmarks.
+
+    python benchmarks/corpus.py /tmp/corpus --count 200
+
+Every image is derived from (seed, index) alone, so a corpus regenerated on
+another machine is byte-for-byte comparable. Files are named
+SKU<n>_<k>.<ext> with four images per SKU.
+"""
+import argparse
+import os
+import sys
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+# kind -> (file extension, Pillow format)
+CORPUS_KINDS = [
+    ("white_product", "jpg", "JPEG"),
+    ("colored_background", "png", "PNG"),
+    ("transparent", "png", "PNG"),
+    ("cmyk", "jpg", "JPEG"),
+    ("grayscale", "tif", "TIFF"),
+    ("watermark_corners", "webp", "WEBP"),
+    ("watermark_center", "jpg", "JPEG"),
+    ("photo", "webp", "WEBP"),
+]
+DEFAULT_SIZES = [(800, 800), (1200, 900), (2000, 1500)]
+IMAGES_PER_SKU = 4
+
+def corpus_filename(index: int, ext: str) -> str:
+    return f"SKU{index // IMAGES_PER_SKU:06d}_{index % IMAGES_PER_SKU + 1}.{ext}"
+
+def corpus_entry(index: int, sizes: Sequence[Tuple[int, int]] = DEFAULT_SIZES) -> Tuple[str, str, str, Tuple[int, int]]:
+    """(filename, kind, Pillow format, size) of the index-th corpus image."""
+    kind, ext, fmt = CORPUS_KINDS[index % len(CORPUS_KINDS)]
+    size = sizes[(index // len(CORPUS_KINDS)) % len(sizes)]
+    return corpus_filename(index, ext), kind, fmt, size
+
+def render_image(index: int, seed: int = 0, sizes: Sequence[Tuple[int, int]] = DEFAULT_SIZES) -> Tuple[Image.Image, str, str]:
+    """Render the index-th corpus image; returns (image, kind, Pillow format)."""
+    _, kind, fmt, (w, h) = corpus_entry(index, sizes)
+    rs = np.random.RandomState((seed * 1000003 + index) % (2 ** 32))
+    white = kind in ("white_product", "cmyk", "grayscale", "watermark_corners", "watermark_center", "transparent")
+    background = (255, 255, 255) if white else tuple(int(v) for v in rs.randint(0, 256, 3))
+
+    if kind == "photo":
+        noise = (rs.rand(h // 50 + 1, w // 50 + 1, 3) * 255).astype(np.uint8)
+        img = Image.fromarray(noise).resize((w, h), Image.BICUBIC)
+    else:
+        img = Image.new("RGB", (w, h), background)
+    draw = ImageDraw.Draw(img)
+
+    # Product: an ellipse with some texture on it
+    gray = kind == "grayscale"
+    color = (90, 90, 90) if gray else tuple(int(v) for v in rs.randint(0, 256, 3))
+    x0, y0 = int(w * rs.uniform(0.15, 0.3)), int(h * rs.uniform(0.15, 0.3))
+    draw.ellipse([x0, y0, w - x0, h - y0], fill=color)
+    for _ in range(30):
+        cx, cy = rs.randint(x0, w - x0), rs.randint(y0, h - y0)
+        r = rs.randint(5, max(6, w // 40))
+        fill = (int(rs.randint(0, 256)),) * 3 if gray else tuple(int(v) for v in rs.randint(0, 256, 3))
+        draw.ellipse([cx - r, cy - r, cx + r, cy + r], fill=fill)
+
+    if kind.startswith("watermark"):
+        step = max(3, w // 400)
+        regions = [(0.3, 0.3, 0.7, 0.7)] if kind == "watermark_center" else [
+            (0, 0, 0.2, 0.2), (0.8, 0, 1, 0.2), (0, 0.8, 0.2, 1), (0.8, 0.8, 1, 1)
+        ]
+        for fx1, fy1, fx2, fy2 in regions:
+            for y in range(int(h * fy1), int(h * fy2), step * 2):
+                draw.line([int(w * fx1), y, int(w * fx2), y], fill=(128, 128, 128), width=step)
+
+    if kind == "transparent":
+        pixels = np.asarray(img.convert("RGBA")).copy()
+        pixels[: h // 10, :, 3] = 0
+        img = Image.fromarray(pixels, "RGBA")
+    elif kind == "cmyk":
+        img = img.convert("CMYK")
+    elif kind == "grayscale":
+        img = img.convert("L")
+    return img, kind, fmt
+
+def generate_corpus(out_dir: str, count: int, seed: int = 0, sizes: Sequence[Tuple[int, int]] = DEFAULT_SIZES) -> List[str]:
+    """
+    Write count images to out_dir and return their paths. Files that already
+    exist are kept, so a corpus directory can be reused between runs.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for index in range(count):
+        filename = corpus_entry(index, sizes)[0]
+        path = os.path.join(out_dir, filename)
+        if not os.path.exists(path):
+            img, _, fmt = render_image(index, seed, sizes)
+            temp_path = path + ".tmp"
+            img.save(temp_path, fmt, quality=90, dpi=(300, 300))
+            os.replace(temp_path, path)
+        paths.append(path)
+    return paths
+
+def write_manifest(path: str, image_names: Sequence[str], mode: str = "project", image_dir: Optional[str] = None):
+    """
+    Manifest for image_names: 'project' lists Image Name, 'ftp' lists
+    Image Path and Name under image_dir. .csv or .xlsx by extension.
+    """
+    if mode == "ftp":
+        headers = ["Image Provided", "Sku ID", "Image Path and Name"]
+        rows = ([
+            "MFR Image" if i % 2 else "Client Image", name.split("_")[0], os.path.join(image_dir, name)
+        ] for i, name in enumerate(image_names))
+    else:
+        headers = ["Image Provided", "Sku ID", "Image Name"]
+        rows = ([
+            "MFR Image" if i % 2 else "Client Image", name.split("_")[0], name
+        ] for i, name in enumerate(image_names))
+
+    if path.endswith(".csv"):
+        import csv
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(headers)
+            writer.writerows(rows)
+    else:
+        import xlsxwriter
+        workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+        sheet = workbook.add_worksheet("Manifest")
+        sheet.write_row(0, 0, headers)
+        for row_index, row in enumerate(rows, start=1):
+            sheet.write_row(row_index, 0, row)
+        workbook.close()
+
+def record_names(count: int, corpus_paths: Sequence[str]) -> List[str]:
+    """
+    Image names for a session of count records. The first len(corpus_paths)
+    are the corpus files themselves; later ones reuse their extensions.
+    """
+    exts = [os.path.splitext(p)[1][1:] for p in corpus_paths] or ["jpg"]
+    return [corpus_filename(i, exts[i % len(exts)]) for i in range(count)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("out_dir")
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--manifest", choices=("project", "ftp"), help="Also write manifest.xlsx for the corpus")
+    args = parser.parse_args()
+
+    paths = generate_corpus(args.out_dir, args.count, args.seed)
+    if args.manifest:
+        write_manifest(
+            os.path.join(args.out_dir, "manifest.xlsx"), [os.path.basename(p) for p in paths],
+            args.manifest, os.path.abspath(args.out_dir)
+        )
+    print(f"{len(paths)} images in {args.out_dir}")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""
+Memory/time benchmark of the manifest parser on a synthetic manifest.
+
+    python benchmarks/manifest_parser.py --rows 500000 --format xlsx
+
+Generates a manifest with the mapped columns plus --extra-columns unused
+ones, then parses it in a fresh process per parser and reports wall time
+and peak RSS:
+
+- streaming: services.excel_parser.iter_excel, consumed one record at a time
+- pandas: the previous implementation (read the whole sheet, slugify every
+  column, to_dict(orient="records"))
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+HEADERS = ["Image Provided", "Sku ID", "Image Name", "Image Path and Name", "Display Order", "Notes"]
+
+def generate(path: str, rows: int, extra_columns: int):
+    headers = HEADERS + [f"Retailer Attribute {i}" for i in range(extra_columns)]
+
+    def row(i):
+        sku = f"SKU{i // 4:07d}"
+        name = f"{sku}_{i % 4 + 1}.jpg"
+        return [
+            "MFR Image" if i % 3 else "Client Image", sku, name, f"/mnt/nas/images/{sku[:6]}/{name}",
+            i % 4 + 1, "" if i % 5 else "check crop"
+        ] + [f"value {i}-{c}" if c % 2 else i * c for c in range(extra_columns)]
+
+    if path.endswith(".csv"):
+        import csv
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(headers)
+            for i in range(rows):
+                writer.writerow(row(i))
+    else:
+        import xlsxwriter
+        workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+        sheet = workbook.add_worksheet("Manifest")
+        sheet.write_row(0, 0, headers)
+        for i in range(rows):
+            sheet.write_row(i + 1, 0, row(i))
+        workbook.close()
+
+def parse_pandas(path: str) -> int:
+    import pandas as pd
+    df = pd.read_csv(path) if path.endswith(".csv") else pd.read_excel(path)
+    df = df.rename(columns=lambda col: str(col).lower().strip().replace(" ", "_"))
+    return len(df.to_dict(orient="records"))
+
+def parse_streaming(path: str) -> int:
+    from services.excel_parser import iter_excel
+    count = 0
+    for _ in iter_excel(path):
+        count += 1
+    return count
+
+def run_one(parser: str, path: str):
+    start = time.perf_counter()
+    count = parse_streaming(path) if parser == "streaming" else parse_pandas(path)
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"parser": parser, "records": count, "seconds": round(elapsed, 2), "peak_rss_mb": round(peak_mb, 1)}))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--extra-columns", type=int, default=24)
+    parser.add_argument("--format", choices=("xlsx", "csv"), default="xlsx")
+    parser.add_argument("--parsers", default="streaming,pandas")
+    parser.add_argument("--file", help="Reuse an existing manifest instead of generating one")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_one(args.run, args.file)
+        return
+
+    path = args.file
+    if not path:
+        path = os.path.join(tempfile.mkdtemp(), f"manifest_{args.rows}.{args.format}")
+        start = time.perf_counter()
+        generate(path, args.rows, args.extra_columns)
+        print(f"Generated {path} ({os.path.getsize(path) / 1e6:.1f} MB) in {time.perf_counter() - start:.1f}s")
+
+    results = []
+    for name in args.parsers.split(","):
+        # Fresh process per parser so peak RSS is not shared
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run", name, "--file", path],
+            capture_output=True, text=True, cwd=BACKEND_DIR
+        )
+        if out.returncode != 0:
+            print(f"{name}: failed\n{out.stderr}")
+            continue
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print(f"{name:>10}: {result['records']} records in {result['seconds']}s, peak RSS {result['peak_rss_mb']} MB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"file": path, "rows": args.rows, "format": args.format, "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Image batch upload over a slow link: one multipart POST to /upload/images
+against resumable uploads (/upload/resumable), where each finalized file is
+extracted while later files are still being sent.
+
+    python benchmarks/resumable_upload.py --images 40 --mbps 80 --parallel 3
+
+Both runs share one simulated link of --mbps (client-side pacing of every
+request body). The resumable run uploads --parallel files at a time in
+chunks, and is then interrupted at --drop-at of its bytes and resumed; the
+report shows how many bytes the resume had to send again. Exits non-zero
+if a stored image differs from its source.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+EMAIL = "resumable@example.com"
+PORT = 8350
+PIECE = 64 * 1024
+
+class Link:
+    """Paces bytes from all threads to a shared bandwidth."""
+
+    def __init__(self, mbps: float):
+        self.bytes_per_second = mbps * 1e6 / 8
+        self.free_at = time.perf_counter()
+        self.lock = threading.Lock()
+        self.sent = 0
+
+    def pace(self, data: bytes) -> Iterator[bytes]:
+        for start in range(0, len(data), PIECE):
+            piece = data[start:start + PIECE]
+            with self.lock:
+                self.free_at = max(self.free_at, time.perf_counter()) + len(piece) / self.bytes_per_second
+                due = self.free_at
+                self.sent += len(piece)
+            time.sleep(max(0.0, due - time.perf_counter()))
+            yield piece
+
+def start_server(work_dir: str, chunk_size: int) -> subprocess.Popen:
+    # No analysis cache, so the second run extracts as much as the first
+    env = dict(
+        os.environ, PIXEL_FILL_BACKGROUND="0", DERIVATIVES_PREGENERATE="", ANALYSIS_CACHE_MAX_BYTES="0",
+        RESUMABLE_CHUNK_SIZE=str(chunk_size)
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR, "--port", str(PORT), "--log-level", "warning"],
+        cwd=work_dir, env=env
+    )
+    deadline = time.time() + 60
+    while True:
+        try:
+            httpx.get(f"http://127.0.0.1:{PORT}/", timeout=2).raise_for_status()
+            return process
+        except httpx.HTTPError:
+            if process.poll() is not None or time.time() > deadline:
+                process.kill()
+                raise RuntimeError("server did not start")
+            time.sleep(0.2)
+
+def multipart_body(files: Dict[str, bytes], analysis_mode: str):
+    boundary = "benchmark-boundary"
+    parts = [f'--{boundary}\r\nContent-Disposition: form-data; name="email"\r\n\r\n{EMAIL}\r\n'.encode()]
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="analysis_mode"\r\n\r\n{analysis_mode}\r\n'.encode())
+    for name, data in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="files"; filename="{name}"\r\n'
+            f"Content-Type: application/octet-stream\r\n\r\n".encode() + data + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+def upload_multipart(url: str, files: Dict[str, bytes], link: Link, analysis_mode: str) -> float:
+    body, content_type = multipart_body(files, analysis_mode)
+    start = time.perf_counter()
+    response = httpx.post(
+        url + "/upload/images", content=link.pace(body), headers={"Content-Type": content_type}, timeout=None
+    )
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+def send_upload(http: httpx.Client, url: str, status: dict, data: bytes, link: Link, stop_after: float = None) -> bool:
+    """
+    Send the chunks of an upload the server has not received yet, then
+    finalize it. Returns False if it stopped because the link had carried
+    stop_after bytes.
+    """
+    chunk_size = status["chunk_size"]
+    for offset in range(0, len(data), chunk_size):
+        end = min(offset + chunk_size, len(data))
+        if any(start <= offset and end <= stop for start, stop in status["ranges"]):
+            continue
+        if stop_after is not None and link.sent >= stop_after:
+            return False
+        http.put(
+            url + f"/upload/resumable/{status['upload_id']}", params={"email": EMAIL, "offset": offset},
+            content=link.pace(data[offset:end])
+        ).raise_for_status()
+    http.post(url + f"/upload/resumable/{status['upload_id']}/finalize", json={"email": EMAIL}).raise_for_status()
+    return True
+
+def upload_resumable(
+    url: str, files: Dict[str, bytes], link: Link, parallel: int, analysis_mode: str, stop_after: float = None
+) -> Dict[str, str]:
+    """Upload files, parallel at a time; returns the ids of uploads left unfinished by stop_after, by name."""
+    unfinished = {}
+
+    def one(name: str):
+        with httpx.Client(timeout=None) as http:
+            status = http.post(
+                url + "/upload/resumable",
+                json={"email": EMAIL, "filename": name, "size": len(files[name]), "analysis_mode": analysis_mode}
+            ).json()
+            if not send_upload(http, url, status, files[name], link, stop_after):
+                unfinished[name] = status["upload_id"]
+
+    with ThreadPoolExecutor(parallel) as pool:
+        list(pool.map(one, files))
+    return unfinished
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=40, help="Images in the batch")
+    parser.add_argument("--mbps", type=float, default=80, help="Simulated link bandwidth (megabits per second)")
+    parser.add_argument("--parallel", type=int, default=3, help="Files uploaded at once by the resumable client")
+    parser.add_argument("--chunk-size", type=int, default=256 * 1024, help="RESUMABLE_CHUNK_SIZE of the server")
+    parser.add_argument("--drop-at", type=float, default=0.95, help="Share of bytes after which the resumable run is interrupted")
+    parser.add_argument("--analysis-mode", default="full", help="analysis_mode of both uploads")
+    parser.add_argument("--workdir", help="Scratch directory (default: a new temporary directory)")
+    args = parser.parse_args()
+
+    from corpus import generate_corpus
+    from services.session import sanitize_email
+    work_dir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="image-validator-resumable-"))
+    paths = generate_corpus(os.path.join(work_dir, "corpus"), args.images, sizes=((2400, 2400), (3000, 2000)))
+    files = {os.path.basename(path): open(path, "rb").read() for path in paths}
+    total = sum(len(data) for data in files.values())
+    url = f"http://127.0.0.1:{PORT}"
+    print(f"{len(files)} images, {total / 1e6:.1f} MB, {args.mbps:g} Mbit/s link, {os.cpu_count()} CPUs")
+
+    process = start_server(work_dir, args.chunk_size)
+    try:
+        ok = True
+        for name in ("multipart", "resumable"):
+            httpx.post(url + "/auth/login", json={"email": EMAIL}).raise_for_status()
+            link = Link(args.mbps)
+            start = time.perf_counter()
+            if name == "multipart":
+                upload_multipart(url, files, link, args.analysis_mode)
+            else:
+                upload_resumable(url, files, link, args.parallel, args.analysis_mode)
+            elapsed = time.perf_counter() - start
+            transfer = total / link.bytes_per_second
+            print(f"{name:>10}: {elapsed:6.2f} s (transfer alone {transfer:.2f} s, processing after it {elapsed - transfer:5.2f} s)")
+            httpx.post(url + "/auth/logout", json={"email": EMAIL})
+
+        # Interrupted at --drop-at of the bytes, then resumed from the server's ranges
+        httpx.post(url + "/auth/login", json={"email": EMAIL}).raise_for_status()
+        link = Link(args.mbps)
+        unfinished = upload_resumable(url, files, link, args.parallel, args.analysis_mode, stop_after=total * args.drop_at)
+        before = link.sent
+        with httpx.Client(timeout=None) as http:
+            for name, upload_id in unfinished.items():
+                status = http.get(url + f"/upload/resumable/{upload_id}", params={"email": EMAIL}).json()
+                send_upload(http, url, status, files[name], link)
+        print(
+            f"    resume: interrupted after {before / 1e6:.1f} MB with {len(unfinished)} files unfinished, "
+            f"sent {(link.sent - before) / 1e6:.1f} MB more (a multipart retry resends {total / 1e6:.1f} MB)"
+        )
+        images_dir = os.path.join(work_dir, "sessions", sanitize_email(EMAIL), "images")
+        for name, data in files.items():
+            path = os.path.join(images_dir, name)
+            if not os.path.exists(path) or open(path, "rb").read() != data:
+                print(f"    MISMATCH: {name}")
+                ok = False
+        httpx.post(url + "/auth/logout", json={"email": EMAIL})
+    finally:
+        process.terminate()
+        process.wait()
+    if not ok:
+        sys.exit(1)
+    print("OK: every stored image matches its source")
+
+if __name__ == "__main__":
+    main()
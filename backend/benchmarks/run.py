@@ -0,0 +1,343 @@
+"""
+Benchmark suite for extraction, uploads, validation and exports.
+
+    python benchmarks/run.py --scales 1000,10000,100000 --output results/run.json
+    python benchmarks/compare.py results/before.json results/run.json
+
+Runs the FastAPI app in-process (TestClient) in a scratch working
+directory, so sessions, caches and exports never touch the real ones.
+
+- extraction: extract_technical_metadata per image and corpus kind, in
+  every analysis mode, plus extract_many throughput.
+- Per scale (number of session records):
+  - /upload/excel with a manifest of that many rows
+  - /upload/images and /upload/local-path (first scan and re-scan) on up
+    to --image-limit images
+  - every /validate endpoint, with the wire size of the SKU listing plain,
+    compressed, paginated and filtered
+  - every /export endpoint, cold and revalidated (If-None-Match)
+
+Images beyond the --corpus-size unique corpus files are hard links to
+them. The analysis cache is disabled unless --with-cache is given, so
+repeated content is really extracted every time.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.corpus import CORPUS_KINDS, corpus_entry, generate_corpus, write_manifest, record_names  # noqa: E402
+
+EMAIL = "benchmark@example.com"
+
+class Recorder:
+    """Collects measurements as JSON-ready dicts."""
+
+    def __init__(self):
+        self.results: List[Dict[str, Any]] = []
+
+    def add(self, name: str, scale: Optional[int], samples: List[float], items: Optional[int] = None, **extra):
+        """samples are seconds per call; items is the work done by all calls together."""
+        total = sum(samples)
+        result = {
+            "name": name,
+            "scale": scale,
+            "calls": len(samples),
+            "seconds": round(total, 4),
+            "p50_ms": round(statistics.median(samples) * 1000, 2),
+            "p95_ms": round(_percentile(samples, 95) * 1000, 2),
+        }
+        if items is not None:
+            result["items"] = items
+            result["items_per_second"] = round(items / total, 2) if total else None
+        result.update(extra)
+        self.results.append(result)
+        label = f"{name} @ {scale}" if scale is not None else name
+        rate = f", {result['items_per_second']} items/s" if items is not None else ""
+        print(f"  {label}: {result['seconds']}s total, p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms{rate}", flush=True)
+        return result
+
+def _percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def timed(fn: Callable, *args, **kwargs):
+    start = time.perf_counter()
+    value = fn(*args, **kwargs)
+    return time.perf_counter() - start, value
+
+def check(response, *ok):
+    if response.status_code not in (ok or (200,)):
+        raise RuntimeError(f"{response.request.method} {response.request.url} -> {response.status_code}: {response.text[:300]}")
+    return response
+
+def link_images(names: List[str], corpus_paths: List[str], target_dir: str) -> List[str]:
+    """Hard-link (or copy, across filesystems) corpus images under the given names."""
+    import shutil
+    os.makedirs(target_dir, exist_ok=True)
+    paths = []
+    for i, name in enumerate(names):
+        src = corpus_paths[i % len(corpus_paths)]
+        dst = os.path.join(target_dir, name)
+        if not os.path.exists(dst):
+            try:
+                os.link(src, dst)
+            except OSError:
+                shutil.copyfile(src, dst)
+        paths.append(dst)
+    return paths
+
+def bench_extraction(rec: Recorder, corpus_paths: List[str]):
+    from services.image import extract_technical_metadata
+    from services.extraction import extract_many
+
+    print("extraction", flush=True)
+    for mode in ("full", "reduced", "quick"):
+        by_kind: Dict[str, List[float]] = {}
+        for index, path in enumerate(corpus_paths):
+            seconds, _ = timed(extract_technical_metadata, path, mode)
+            by_kind.setdefault(corpus_entry(index)[1], []).append(seconds)
+        for kind, _, _ in CORPUS_KINDS:
+            if kind in by_kind:
+                rec.add(f"extraction.{mode}.{kind}", None, by_kind[kind], items=len(by_kind[kind]))
+        all_samples = [s for samples in by_kind.values() for s in samples]
+        rec.add(f"extraction.{mode}.per_image", None, all_samples, items=len(all_samples))
+        seconds, _ = timed(extract_many, corpus_paths, mode)
+        rec.add(f"extraction.{mode}.extract_many", None, [seconds], items=len(corpus_paths))
+
+def bench_uploads(rec: Recorder, client, scale: int, names: List[str], corpus_paths: List[str], work_dir: str, args):
+    print(f"uploads @ {scale}", flush=True)
+    manifest = os.path.join(work_dir, f"manifest_{scale}.xlsx")
+    write_manifest(manifest, names, "project")
+    with open(manifest, "rb") as f:
+        content = f.read()
+    seconds, response = timed(client.post, "/upload/excel", data={"email": EMAIL}, files={"file": ("manifest.xlsx", content)})
+    check(response)
+    rec.add("upload.excel", scale, [seconds], items=scale)
+
+    image_count = min(scale, args.image_limit)
+    staging = link_images(names[:image_count], corpus_paths, os.path.join(work_dir, f"staging_{scale}"))
+    samples = []
+    for start in range(0, image_count, args.upload_batch):
+        files = []
+        for path in staging[start:start + args.upload_batch]:
+            with open(path, "rb") as f:
+                files.append(("files", (os.path.basename(path), f.read())))
+        seconds, response = timed(client.post, "/upload/images", data={"email": EMAIL, "analysis_mode": args.analysis_mode}, files=files)
+        check(response)
+        samples.append(seconds)
+    rec.add("upload.images", scale, samples, items=image_count, batch=args.upload_batch)
+
+    # Local path: directory of image_count images, manifest listing all `scale` rows
+    ftp_manifest = os.path.join(work_dir, f"manifest_ftp_{scale}.xlsx")
+    local_dir = os.path.dirname(staging[0]) if staging else work_dir
+    write_manifest(ftp_manifest, names, "ftp", local_dir)
+    with open(ftp_manifest, "rb") as f:
+        content = f.read()
+    for name in ("upload.local_path", "upload.local_path_rescan"):
+        seconds, response = timed(
+            client.post, "/upload/local-path",
+            data={"email": EMAIL, "path": local_dir, "analysis_mode": args.analysis_mode},
+            files={"file": ("manifest.xlsx", content)}
+        )
+        check(response)
+        rec.add(name, scale, [seconds], items=scale, images=image_count)
+
+def seed_session(scale: int, names: List[str], corpus_paths: List[str], args) -> List[str]:
+    """Session with `scale` extracted records, a third of them approved; returns SKU ids."""
+    from services.data import save_metadata
+    from services.session import get_session_path
+
+    session_path = get_session_path(EMAIL)
+    image_url = f"/sessions/{os.path.basename(session_path)}/images"
+    # Every third record is approved; only about --zip-limit of them exist on
+    # disk (zips skip missing files) to keep the archive size bounded
+    link_images(names[:args.zip_limit * 3], corpus_paths, os.path.join(session_path, "images"))
+
+    def records():
+        for i, name in enumerate(names):
+            yield {
+                "image_provided_by": "MFR Image" if i % 2 else "Client Image",
+                "sku_id": name.split("_")[0], "image_name": name,
+                "status": "Approved" if i % 3 == 0 else "Pending",
+                "display_order": None, "notes": "",
+                "image_path": f"{image_url}/{name}",
+                "width": 2000, "height": 1500, "resolution": "2000x1500", "dpi": "300 DPI",
+                "size": "512.0 KB", "format": "JPEG", "color_mode": "RGB",
+                "background": "White", "watermark": "No", "extraction_status": "Extraction Complete!"
+            }
+    save_metadata(session_path, records())
+    return sorted({name.split("_")[0] for name in names})
+
+def bench_validate(rec: Recorder, client, scale: int, skus: List[str], names: List[str], args):
+    print(f"validate @ {scale}", flush=True)
+    rng = random.Random(scale)
+    params = {"email": EMAIL}
+    # Wire size (bytes as sent, after compression) and latency of each listing variant
+    listings = [
+        ("validate.skus", "/validate/skus", {}, "identity"),
+        ("validate.skus_gzip", "/validate/skus", {}, "gzip"),
+        ("validate.skus_counts_page", "/validate/skus", {"limit": 500, "fields": "counts"}, "gzip"),
+        ("validate.skus_pending_page", "/validate/skus", {"limit": 500, "status": "pending", "fields": "sku_id,pending"}, "gzip"),
+    ]
+    for name, url, extra, encoding in listings:
+        samples, size = [], 0
+        for _ in range(args.repeat):
+            seconds, response = timed(client.get, url, params={**params, **extra}, headers={"Accept-Encoding": encoding})
+            samples.append(seconds)
+            size = check(response).num_bytes_downloaded
+        rec.add(name, scale, samples, bytes=size)
+    sample = [rng.choice(skus) for _ in range(args.repeat * 5)]
+    rec.add("validate.images", scale, [timed(lambda s=s: check(client.get(f"/validate/images/{s}", params=params)))[0] for s in sample])
+    rec.add("validate.images_card", scale, [
+        timed(lambda s=s: check(client.get(f"/validate/images/{s}", params={**params, "fields": "card"})))[0] for s in sample
+    ])
+    updates = [rng.choice(names) for _ in range(args.repeat * 5)]
+    rec.add("validate.update", scale, [
+        timed(lambda n=n: check(client.put("/validate/update", json={
+            "email": EMAIL, "image_name": n, "status": "Approved", "display_order": 1, "notes": "benchmark"
+        })))[0]
+        for n in updates
+    ])
+    rec.add("validate.reset", scale, [
+        timed(lambda s=s: check(client.post("/validate/reset", json={"email": EMAIL, "sku_id": s})))[0]
+        for s in sample[:args.repeat]
+    ])
+    rec.add("validate.index_check", scale, [timed(lambda: check(client.get("/validate/index-check", params=params)))[0]])
+
+def _download(client, url: str, params: dict, headers: dict = None):
+    with client.stream("GET", url, params=params, headers=headers or {}) as response:
+        size = sum(len(chunk) for chunk in response.iter_bytes())
+        return response, size
+
+def bench_exports(rec: Recorder, client, scale: int, skus: List[str], args):
+    from services.reports import parquet_available
+
+    print(f"export @ {scale}", flush=True)
+    params = {"email": EMAIL}
+    # Validation may have reset some SKUs; zip one that still has approvals
+    counts = check(client.get("/validate/skus", params=params)).json()
+    zip_sku = next((c["sku_id"] for c in counts if c["approved"]), skus[0])
+    endpoints = [
+        ("export.excel", "/export/excel", {}),
+        ("export.excel_csv", "/export/excel", {"format": "csv"}),
+        ("export.approved_excel", "/export/approved-excel", {}),
+        ("export.local_path_excel", "/export/local-path-excel", {}),
+        ("export.approved_zip", "/export/approved-zip", {}),
+        ("export.zip_sku", f"/export/zip/{zip_sku}", {}),
+    ]
+    if parquet_available():
+        endpoints.insert(2, ("export.excel_parquet", "/export/excel", {"format": "parquet"}))
+    for name, url, extra in endpoints:
+        seconds, (response, size) = timed(_download, client, url, {**params, **extra})
+        check(response)
+        rec.add(f"{name}.cold", scale, [seconds], bytes=size)
+        etag = response.headers.get("etag")
+        if etag:
+            seconds, (response, _) = timed(_download, client, url, {**params, **extra}, {"If-None-Match": etag})
+            check(response, 304)
+            rec.add(f"{name}.revalidate", scale, [seconds])
+
+def environment_info(args) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=BACKEND_DIR
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": vars(args),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="1000,10000,100000", help="Comma-separated session sizes (records)")
+    parser.add_argument("--corpus-size", type=int, default=200, help="Unique images in the synthetic corpus")
+    parser.add_argument("--corpus-dir", help="Reuse/keep the corpus here instead of the scratch directory")
+    parser.add_argument("--image-limit", type=int, default=1000, help="Max images uploaded/scanned per scale")
+    parser.add_argument("--upload-batch", type=int, default=100, help="Images per /upload/images request")
+    parser.add_argument("--zip-limit", type=int, default=2000, help="Max approved images present on disk for zip exports")
+    parser.add_argument("--repeat", type=int, default=10, help="Calls per latency measurement")
+    parser.add_argument("--analysis-mode", choices=("full", "reduced", "quick"), default="full")
+    parser.add_argument("--only", help="Comma-separated groups: extraction,uploads,validate,export")
+    parser.add_argument("--with-cache", action="store_true", help="Keep the analysis cache enabled")
+    parser.add_argument("--workdir", help="Scratch directory (default: a new temporary directory)")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    groups = set((args.only or "extraction,uploads,validate,export").split(","))
+    scales = [int(s) for s in args.scales.split(",") if s]
+    output = os.path.abspath(args.output) if args.output else None
+    work_dir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="image-validator-bench-"))
+    corpus_dir = os.path.abspath(args.corpus_dir or os.path.join(work_dir, "corpus"))
+    os.makedirs(work_dir, exist_ok=True)
+
+    # Settings are read at import time, so they go in before the app is loaded
+    if not args.with_cache:
+        os.environ["ANALYSIS_CACHE_MAX_BYTES"] = "0"
+    os.environ["DERIVATIVES_PREGENERATE"] = ""
+    os.environ["PIXEL_FILL_BACKGROUND"] = "0"
+    os.chdir(work_dir)
+
+    print(f"Generating {args.corpus_size} corpus images in {corpus_dir}", flush=True)
+    seconds, corpus_paths = timed(generate_corpus, corpus_dir, args.corpus_size)
+    print(f"  done in {seconds:.1f}s", flush=True)
+
+    from fastapi.testclient import TestClient
+    import main as app_main
+    from services.derivatives import shutdown_derivative_pool
+    from services.extraction import shutdown_executor
+
+    rec = Recorder()
+    try:
+        if "extraction" in groups:
+            bench_extraction(rec, corpus_paths)
+
+        with TestClient(app_main.app) as client:
+            for scale in scales:
+                check(client.post("/auth/login", json={"email": EMAIL}))
+                names = record_names(scale, corpus_paths)
+                if "uploads" in groups:
+                    bench_uploads(rec, client, scale, names, corpus_paths, work_dir, args)
+                if groups & {"validate", "export"}:
+                    print(f"seeding session @ {scale}", flush=True)
+                    seconds, skus = timed(seed_session, scale, names, corpus_paths, args)
+                    rec.add("setup.seed_session", scale, [seconds], items=scale)
+                    if "validate" in groups:
+                        bench_validate(rec, client, scale, skus, names, args)
+                    if "export" in groups:
+                        bench_exports(rec, client, scale, skus, args)
+                check(client.post("/auth/logout", json={"email": EMAIL}))
+    finally:
+        shutdown_executor()
+        shutdown_derivative_pool()
+
+    report = {
+        "environment": environment_info(args),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "results": rec.results,
+    }
+    if output:
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Scale-out check: several app servers, each with several worker processes,
+serve the same sessions at once.
+
+    python benchmarks/scaling.py --topologies 1x1,1x2,2x2 --backend local
+    python benchmarks/scaling.py --topologies 2x2 --backend shared
+
+A topology MxN starts M uvicorn servers (one port each, standing in for M
+hosts) with N worker processes each, all sharing one working directory
+(the storage every host would mount). Client threads spread requests over
+the servers: SKU listings, image pages and bulk updates of images each
+client owns. Afterwards every image must hold its owner's last write and
+the per-SKU counters must match the records. A local-path scan job is
+submitted to the first server and followed (and polled to completion)
+through the last one.
+
+--backend shared keeps all sessions in one SQLite database
+(sqlite:///<workdir>/state.sqlite) standing in for PostgreSQL; pass
+--database-url to use a real one. Exits non-zero on any lost update.
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+EMAIL = "scaling@example.com"
+SKUS = 50
+BASE_PORT = 8300
+
+def image_name(index: int) -> str:
+    return f"IMG_{index:05d}.jpg"
+
+def start_servers(topology: str, work_dir: str, env: Dict[str, str]) -> List[Any]:
+    hosts, workers = (int(part) for part in topology.lower().split("x"))
+    servers = []
+    for host in range(hosts):
+        port = BASE_PORT + host
+        process = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR,
+                "--port", str(port), "--workers", str(workers), "--log-level", "warning",
+            ],
+            cwd=work_dir, env=env
+        )
+        servers.append((process, f"http://127.0.0.1:{port}"))
+    for process, url in servers:
+        deadline = time.time() + 60
+        while True:
+            try:
+                httpx.get(url + "/", timeout=2).raise_for_status()
+                break
+            except httpx.HTTPError:
+                if process.poll() is not None or time.time() > deadline:
+                    stop_servers(servers)
+                    raise RuntimeError(f"server {url} did not start")
+                time.sleep(0.2)
+    return servers
+
+def stop_servers(servers: List[Any]):
+    for process, _ in servers:
+        process.terminate()
+    for process, _ in servers:
+        try:
+            process.wait(timeout=20)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+def run_clients(urls: List[str], clients: int, seconds: float, images: int, write_share: float) -> Dict[str, Any]:
+    """Drive the servers for `seconds`; returns latencies and each image's last written notes."""
+    latencies = {"read": [], "write": []}
+    last_written: Dict[str, str] = {}
+    errors = []
+    lock = threading.Lock()
+    stop_at = time.time() + seconds
+
+    def client(number: int):
+        rng = random.Random(number)
+        owned = [image_name(index) for index in range(number, images, clients)]
+        http = httpx.Client(timeout=60)
+        done = 0
+        try:
+            while time.time() < stop_at:
+                url = urls[done % len(urls)]
+                done += 1
+                start = time.perf_counter()
+                if rng.random() < write_share and owned:
+                    changes = [
+                        {"image_name": name, "notes": f"client {number} op {done}"}
+                        for name in rng.sample(owned, min(3, len(owned)))
+                    ]
+                    response = http.post(url + "/validate/bulk-update", json={"email": EMAIL, "changes": changes})
+                    kind = "write"
+                elif rng.random() < 0.5:
+                    response = http.get(url + "/validate/skus", params={"email": EMAIL, "limit": 20})
+                    kind = "read"
+                else:
+                    sku = f"SKU{rng.randrange(SKUS):03d}"
+                    response = http.get(url + f"/validate/images/{sku}", params={"email": EMAIL, "fields": "card"})
+                    kind = "read"
+                elapsed = time.perf_counter() - start
+                with lock:
+                    if response.status_code != 200:
+                        errors.append(f"{kind} {response.status_code}: {response.text[:200]}")
+                        continue
+                    latencies[kind].append(elapsed)
+                    if kind == "write":
+                        for change in changes:
+                            last_written[change["image_name"]] = change["notes"]
+        finally:
+            http.close()
+
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {"latencies": latencies, "last_written": last_written, "errors": errors}
+
+def follow_job(urls: List[str], work_dir: str) -> Dict[str, Any]:
+    """Scan a few images as a job on the first server and follow it through the last one."""
+    from corpus import generate_corpus
+    image_dir = os.path.join(work_dir, "scan-images")
+    generate_corpus(image_dir, 20)
+    response = httpx.post(
+        urls[0] + "/upload/local-path/jobs", data={"email": EMAIL, "path": image_dir, "analysis_mode": "reduced"},
+        timeout=60
+    )
+    response.raise_for_status()
+    job_id = response.json()["job_id"]
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        status = httpx.get(urls[-1] + f"/upload/jobs/{job_id}", params={"email": EMAIL}, timeout=30)
+        status.raise_for_status()
+        job = status.json()
+        if job["status"] in ("completed", "cancelled", "failed"):
+            return {"status": job["status"], "results": len(job["results"]), "message": job["message"]}
+        time.sleep(0.25)
+    return {"status": "timed out"}
+
+def run_topology(args, topology: str, env: Dict[str, str]) -> bool:
+    from services.data import check_sku_index, load_metadata, save_metadata
+    from services.session import get_session_path
+
+    servers = start_servers(topology, args.workdir, env)
+    urls = [url for _, url in servers]
+    try:
+        httpx.post(urls[0] + "/auth/login", json={"email": EMAIL}).raise_for_status()
+        session_path = get_session_path(EMAIL)
+        save_metadata(session_path, (
+            {
+                "sku_id": f"SKU{index % SKUS:03d}", "image_name": image_name(index),
+                "status": "Pending", "display_order": None, "notes": "",
+            }
+            for index in range(args.images)
+        ))
+
+        run = run_clients(urls, args.clients, args.seconds, args.images, args.write_share)
+        reads, writes = run["latencies"]["read"], run["latencies"]["write"]
+        records = {record["image_name"]: record for record in load_metadata(session_path)}
+        lost = [name for name, notes in run["last_written"].items() if records.get(name, {}).get("notes") != notes]
+        index = check_sku_index(session_path)
+        job = follow_job(urls, args.workdir) if not args.skip_job else None
+        httpx.post(urls[0] + "/auth/logout", json={"email": EMAIL})
+    finally:
+        stop_servers(servers)
+
+    total = len(reads) + len(writes)
+    print(
+        f"{topology:>5}  {total / args.seconds:8.0f} req/s  "
+        f"read p50 {statistics.median(reads or [0]) * 1000:6.1f} ms p95 {percentile(reads, 0.95) * 1000:7.1f} ms  "
+        f"write p50 {statistics.median(writes or [0]) * 1000:6.1f} ms p95 {percentile(writes, 0.95) * 1000:7.1f} ms  "
+        f"lost {len(lost)}  counters {'ok' if index['consistent'] else 'INCONSISTENT'}  errors {len(run['errors'])}",
+        flush=True
+    )
+    if job is not None:
+        print(f"       job via {urls[-1]}: {job}", flush=True)
+    for error in run["errors"][:5]:
+        print(f"       error: {error}")
+    for name in lost[:5]:
+        print(f"       lost update: {name} expected {run['last_written'][name]!r}, found {records.get(name, {}).get('notes')!r}")
+    job_ok = job is None or job["status"] == "completed"
+    return not lost and index["consistent"] and not run["errors"] and job_ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--topologies", default="1x1,1x2,2x2", help="Comma-separated MxN: M servers with N workers each")
+    parser.add_argument("--backend", choices=("local", "shared"), default="local", help="STATE_BACKEND of the servers")
+    parser.add_argument("--database-url", help="STATE_DATABASE_URL for --backend shared (default: SQLite in the workdir)")
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent client threads")
+    parser.add_argument("--seconds", type=float, default=10, help="Load duration per topology")
+    parser.add_argument("--images", type=int, default=2000, help="Records in the session")
+    parser.add_argument("--write-share", type=float, default=0.2, help="Fraction of requests that are bulk updates")
+    parser.add_argument("--skip-job", action="store_true", help="Do not run the cross-server job check")
+    parser.add_argument("--workdir", help="Scratch directory (default: a new temporary directory)")
+    args = parser.parse_args()
+
+    args.workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="image-validator-scaling-"))
+    os.makedirs(args.workdir, exist_ok=True)
+    env = dict(os.environ, STATE_BACKEND=args.backend, PIXEL_FILL_BACKGROUND="0")
+    if args.backend == "shared":
+        env["STATE_DATABASE_URL"] = args.database_url or "sqlite:///" + os.path.join(args.workdir, "state.sqlite")
+    # This process seeds and checks the session through the same backend
+    os.environ.update(env)
+    os.chdir(args.workdir)
+
+    print(f"backend {args.backend}, {args.clients} clients, {args.seconds:g}s per topology, {os.cpu_count()} CPUs")
+    ok = True
+    for topology in args.topologies.split(","):
+        ok = run_topology(args, topology.strip(), env) and ok
+        shutil.rmtree(os.path.join(args.workdir, "sessions"), ignore_errors=True)
+    if not ok:
+        print("FAILED")
+        sys.exit(1)
+    print("OK: no lost updates")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 import os
+from typing import Optional
+from services.metrics import RequestTimingMiddleware, render_metrics
 
 app = FastAPI(title="Image Validator API")
 
@@ -13,6 +17,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestTimingMiddleware)
 
 # Ensure session directory exists
 SESSION_DIR = "sessions"
@@ -26,13 +31,44 @@ app.mount("/sessions", StaticFiles(directory=SESSION_DIR), name="sessions")
 async def root():
     return {"message": "Image Validator API is running"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Request, extraction-stage and storage timings in the Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 from routers import auth, upload, validate, export
+from services.derivatives import shutdown_derivative_pool
+from services.extraction import shutdown_executor
+from services.jobs import cancel_running_jobs
+from services.retention import get_usage, start_sweeper, stop_sweeper
+from services.session import get_session_path
 
 app.include_router(auth.router)
 app.include_router(upload.router)
 app.include_router(validate.router)
 app.include_router(export.router)
 
+@app.get("/usage")
+async def usage(email: Optional[str] = None):
+    """Disk usage of the sessions (or one user's), the quotas and the last retention sweep."""
+    return await run_in_threadpool(get_usage, get_session_path(email) if email else None)
+
+@app.on_event("startup")
+async def startup():
+    start_sweeper()
+
+@app.on_event("shutdown")
+async def shutdown():
+    stop_sweeper()
+    cancel_running_jobs()
+    shutdown_executor()
+    shutdown_derivative_pool()
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8008, reload=True)
+    # Worker processes serving one port; they share sessions through the
+    # state backend (services/state.py). Reloading needs a single worker.
+    workers = int(os.environ.get("WEB_WORKERS", "1"))
+    uvicorn.run(
+        "main:app", host="0.0.0.0", port=int(os.environ.get("PORT", "8008")), workers=workers, reload=workers == 1
+    )
@@ -1,137 +1,135 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Request
+from fastapi.responses import FileResponse, StreamingResponse, Response
+from fastapi.concurrency import run_in_threadpool
 from services.session import get_session_path, cleanup_session, sanitize_email
-from services.data import load_metadata
+from services.data import load_metadata, iter_records, load_sku_records, get_state_version
+from services.reports import (
+    REPORT_FORMATS, VALIDATION_REPORT_COLUMNS, LOCAL_PATH_REPORT_COLUMNS, write_report, parquet_available
+)
+from services.zipstream import stream_zip
+from services.export_cache import get_cached_export, export_etag, etag_matches
 import shutil
 import os
-import pandas as pd
-import zipfile
-from io import BytesIO
 
 router = APIRouter(prefix="/export", tags=["Export"])
 
-def generate_excel_report(data, session_path, filename="Image_Validation_Report.xlsx", filter_approved=False):
-    """Helper to generate Excel report from metadata data."""
-    if not data:
+XLSX_MEDIA_TYPE = REPORT_FORMATS["xlsx"][1]
+
+def check_report_format(format: str):
+    if format not in REPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(REPORT_FORMATS)}")
+    if format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=400, detail="Parquet export requires pyarrow on the server")
+
+def report_filename(stem: str, format: str) -> str:
+    return f"{stem}.{REPORT_FORMATS[format][0]}"
+
+def generate_excel_report(records, output_path, filter_approved=False, format="xlsx"):
+    """Helper to write the validation report for records to output_path, row by row."""
+    seen = 0
+    def rows():
+        nonlocal seen
+        for record in records:
+            seen += 1
+            # Filter approved if requested
+            if not filter_approved or record.get("status") == "Approved":
+                yield record
+
+    written = write_report(rows(), VALIDATION_REPORT_COLUMNS, output_path, format)
+    if not seen:
         raise HTTPException(status_code=400, detail="No data to export")
-        
-    df = pd.DataFrame(data)
-    
-    # Filter approved if requested
-    if filter_approved and "status" in df.columns:
-        df = df[df["status"] == "Approved"]
-        if df.empty:
-            raise HTTPException(status_code=404, detail="No approved images found to export")
-
-    # Capitalize 'image_provided_by' for better presentation (MFR, Client)
-    if "image_provided_by" in df.columns:
-        df["image_provided_by"] = df["image_provided_by"].apply(
-            lambda x: str(x).upper() if str(x).lower() == "mfr" else str(x).capitalize() if x else ""
-        )
-
-    # Clean DPI to show only number (remove ' DPI' and AI info)
-    if "dpi" in df.columns:
-        df["dpi"] = df["dpi"].astype(str).apply(lambda x: x.split(" DPI")[0].strip())
-
-
-    # Filter/Order columns as per requirements
-    columns_order = [
-        "image_provided_by", "sku_id", "image_name", 
-        "size", "resolution", "dpi", 
-        "format", "status", "display_order", "notes"
-    ]
-    
-    # Rename map to match screenshot headers exactly
-    rename_map = {
-        "image_provided_by": "Image Provided By",
-        "sku_id": "Sku ID",
-        "image_name": "Image Name",
-        "size": "Image Size",
-        "resolution": "Image Resolution",
-        "dpi": "DPI",
-        "format": "Image Format",
-        "status": "Approved Status",
-        "display_order": "Display Order",
-        "notes": "Notes"
-    }
-
-    # Ensure columns exist and fill missing with empty string
-    for col in columns_order:
-        if col not in df.columns:
-            df[col] = "" 
-            
-    # Select and Rename
-    df_final = df[columns_order].rename(columns=rename_map)
-    
-    output_path = os.path.join(session_path, f"export_{filename}")
-    df_final.to_excel(output_path, index=False)
-    
-    return FileResponse(
-        path=output_path, 
-        filename=filename, 
-        media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    if not written:
+        raise HTTPException(status_code=404, detail="No approved images found to export")
+
+async def cached_file_response(request, session_path, filename, build, media_type=XLSX_MEDIA_TYPE):
+    """
+    Serve an export generated by build(output_path), reusing the copy built at
+    the session's current state version. Answers 304 when the client already
+    has that version.
+    """
+    version = await run_in_threadpool(get_state_version, session_path)
+    etag = export_etag(version, filename)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    output_path = await run_in_threadpool(get_cached_export, session_path, filename, version, build)
+    return FileResponse(path=output_path, filename=filename, media_type=media_type, headers={"ETag": etag})
+
+def zip_response(images_dir, image_names, zip_filename, etag):
+    """Stream a ZIP of session images as it is built; names appearing twice are zipped once."""
+    files = [(os.path.join(images_dir, name), name) for name in image_names]
+    return StreamingResponse(
+        stream_zip(files),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{zip_filename}"', "ETag": etag}
     )
 
 @router.get("/excel")
-async def export_excel(email: str):
-    """Generate and download full Excel report."""
+async def export_excel(email: str, request: Request, format: str = "xlsx"):
+    """Generate and download full Excel report (or CSV/Parquet with `format`)."""
+    check_report_format(format)
     session_path = get_session_path(email)
     if not os.path.exists(session_path):
         raise HTTPException(status_code=404, detail="Session not found")
         
-    data = load_metadata(session_path)
-    return generate_excel_report(data, session_path, "Image_Validation_Report.xlsx")
+    def build(output_path):
+        generate_excel_report(iter_records(session_path), output_path, format=format)
+    return await cached_file_response(
+        request, session_path, report_filename("Image_Validation_Report", format), build, REPORT_FORMATS[format][1]
+    )
 
 @router.get("/approved-excel")
-async def export_approved_excel(email: str):
-    """Generate and download Excel report for approved images only."""
+async def export_approved_excel(email: str, request: Request, format: str = "xlsx"):
+    """Generate and download Excel report for approved images only (or CSV/Parquet with `format`)."""
+    check_report_format(format)
     session_path = get_session_path(email)
     if not os.path.exists(session_path):
         raise HTTPException(status_code=404, detail="Session not found")
         
-    data = load_metadata(session_path)
-    return generate_excel_report(data, session_path, "Approved_Images_Report.xlsx", filter_approved=True)
+    def build(output_path):
+        generate_excel_report(iter_records(session_path), output_path, filter_approved=True, format=format)
+    return await cached_file_response(
+        request, session_path, report_filename("Approved_Images_Report", format), build, REPORT_FORMATS[format][1]
+    )
 
 @router.get("/zip/{sku_id}")
-async def export_zip(email: str, sku_id: str, background_tasks: BackgroundTasks):
+async def export_zip(email: str, sku_id: str, request: Request):
     """Download approved images for a specific SKU as Zip."""
     session_path = get_session_path(email)
     images_dir = os.path.join(session_path, "images")
-    
-    data = load_metadata(session_path)
+    zip_filename = f"{sku_id}_approved.zip"
+
+    etag = export_etag(await run_in_threadpool(get_state_version, session_path), zip_filename)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
     
     # Filter approved images for SKU
     approved_images = [
         item["image_name"] 
-        for item in data 
-        if str(item.get("sku_id")).strip() == str(sku_id).strip() 
-        and item.get("status") == "Approved"
+        for item in await run_in_threadpool(load_sku_records, session_path, sku_id)
+        if item.get("status") == "Approved"
     ]
     
     if not approved_images:
         raise HTTPException(status_code=404, detail="No approved images found for this SKU")
         
-    zip_filename = f"{sku_id}_approved.zip"
-    zip_path = os.path.join(session_path, zip_filename)
-    
-    with zipfile.ZipFile(zip_path, 'w') as zipf:
-        for img_name in approved_images:
-            src_path = os.path.join(images_dir, img_name)
-            if os.path.exists(src_path):
-                zipf.write(src_path, arcname=img_name)
-                
-    return FileResponse(zip_path, filename=zip_filename, media_type="application/zip")
+    return zip_response(images_dir, approved_images, zip_filename, etag)
 
 @router.get("/approved-zip")
-async def export_all_approved_zip(email: str):
+async def export_all_approved_zip(email: str, request: Request):
     """Download ALL approved images across all SKUs as a single Zip."""
     session_path = get_session_path(email)
     images_dir = os.path.join(session_path, "images")
     
     if not os.path.exists(session_path):
         raise HTTPException(status_code=404, detail="Session not found")
+
+    zip_filename = "all_approved_images.zip"
+    etag = export_etag(await run_in_threadpool(get_state_version, session_path), zip_filename)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
         
-    data = load_metadata(session_path)
+    data = await run_in_threadpool(load_metadata, session_path)
     if not data:
         raise HTTPException(status_code=400, detail="No metadata found")
     
@@ -145,55 +143,24 @@ async def export_all_approved_zip(email: str):
     if not approved_images:
         raise HTTPException(status_code=404, detail="No approved images found across all SKUs")
         
-    zip_filename = "all_approved_images.zip"
-    zip_path = os.path.join(session_path, zip_filename)
-    
-    with zipfile.ZipFile(zip_path, 'w') as zipf:
-        # Track unique names to avoid zipping the same file multiple times if it appears in metadata twice
-        added_files = set()
-        for img_name in approved_images:
-            if img_name in added_files:
-                continue
-            src_path = os.path.join(images_dir, img_name)
-            if os.path.exists(src_path):
-                zipf.write(src_path, arcname=img_name)
-                added_files.add(img_name)
-                
-    return FileResponse(zip_path, filename=zip_filename, media_type="application/zip")
+    return zip_response(images_dir, approved_images, zip_filename, etag)
+
+def generate_local_path_excel(records, output_path, format="xlsx"):
+    """Helper to write the local path template export for records to output_path, row by row."""
+    # Mapping to requested headers: Image Provided, Sku ID, Image Path and Name
+    if not write_report(records, LOCAL_PATH_REPORT_COLUMNS, output_path, format):
+        raise HTTPException(status_code=400, detail="No data to export")
 
 @router.get("/local-path-excel")
-async def export_local_path_excel(email: str):
-    """Generate and download Excel report for local path images."""
+async def export_local_path_excel(email: str, request: Request, format: str = "xlsx"):
+    """Generate and download Excel report for local path images (or CSV/Parquet with `format`)."""
+    check_report_format(format)
     session_path = get_session_path(email)
     if not os.path.exists(session_path):
         raise HTTPException(status_code=404, detail="Session not found")
         
-    data = load_metadata(session_path)
-    if not data:
-        raise HTTPException(status_code=400, detail="No data to export")
-        
-    df = pd.DataFrame(data)
-    
-    # Filter/Order columns for the specifically requested template
-    # Mapping to requested headers: Image Provided, Sku ID, Image Path and Name
-    rename_map = {
-        "image_provided_by": "Image Provided",
-        "sku_id": "Sku ID",
-        "image_path": "Image Path and Name"
-    }
-    
-    # Ensure columns exist
-    for col in rename_map.keys():
-        if col not in df.columns:
-            df[col] = ""
-            
-    df_final = df[list(rename_map.keys())].rename(columns=rename_map)
-    
-    output_path = os.path.join(session_path, "Local_Path_Image_Export.xlsx")
-    df_final.to_excel(output_path, index=False)
-    
-    return FileResponse(
-        path=output_path, 
-        filename="Local_Path_Image_Export.xlsx", 
-        media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    def build(output_path):
+        generate_local_path_excel(iter_records(session_path), output_path, format=format)
+    return await cached_file_response(
+        request, session_path, report_filename("Local_Path_Image_Export", format), build, REPORT_FORMATS[format][1]
     )
@@ -1,17 +1,43 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Body
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Body, BackgroundTasks, Request
 from fastapi.responses import FileResponse, StreamingResponse
-from typing import List
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional, Tuple
 import shutil
 import os
-from services.session import get_session_path
-from services.excel_parser import parse_excel
-from services.data import save_metadata, load_metadata, update_image_record
-from services.image import extract_technical_metadata
+import json
+import asyncio
+import threading
+from services.session import get_session_path, save_upload_file
+from services.excel_parser import iter_excel
+from services.data import save_metadata, load_metadata, update_image_records, link_image_blobs, load_upload, take_upload
+from services.blobs import store_upload, release_blobs
+from services.uploads import (
+    new_upload, upload_path, upload_status, received_bytes, write_chunk, hash_file, receive_multipart
+)
+from services.image import ANALYSIS_MODES
+from services.extraction import extract_many
+from services.local_scan import run_local_scan
+from services.jobs import FINISHED_STATES, submit_job, find_job
+from services.pixel_fill import start_pixel_fill
+from services.retention import quota_exceeded
+from services.analysis_cache import get_analysis_cache
+from services.derivatives import (
+    DERIVATIVE_SIZES, DERIVATIVE_FORMATS, resolve_image_path, get_derivative, pregenerate_derivatives
+)
 import pandas as pd
 import io
 
 router = APIRouter(prefix="/upload", tags=["Upload"])
 
+# Seconds between progress checks of a job event stream
+JOB_EVENT_INTERVAL = 0.5
+
+def check_analysis_mode(analysis_mode: str):
+    """Reject unknown analysis modes; None falls back to the deployment default."""
+    if analysis_mode and analysis_mode not in ANALYSIS_MODES:
+        raise HTTPException(status_code=400, detail=f"analysis_mode must be one of {', '.join(ANALYSIS_MODES)}")
+
 @router.get("/local-image")
 async def serve_local_image(path: str):
     """Serve an image from a local absolute path."""
@@ -24,6 +50,46 @@ async def serve_local_image(path: str):
         
     return FileResponse(path)
 
+@router.get("/derivative")
+async def serve_derivative(path: str, size: str = "thumb", format: str = "webp"):
+    """Serve a cached thumbnail/preview of a session or local image."""
+    if size not in DERIVATIVE_SIZES:
+        raise HTTPException(status_code=400, detail=f"size must be one of {', '.join(DERIVATIVE_SIZES)}")
+    if format not in DERIVATIVE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(DERIVATIVE_FORMATS)}")
+    if not path:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    valid_extensions = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff')
+    if not path.lower().endswith(valid_extensions):
+        raise HTTPException(status_code=400, detail="Invalid file type")
+
+    try:
+        src_path = resolve_image_path(path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        derivative = await run_in_threadpool(get_derivative, src_path, size, format)
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Could not render image: {str(e)}")
+    if derivative is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    return FileResponse(
+        derivative,
+        media_type=DERIVATIVE_FORMATS[format][2],
+        headers={"Cache-Control": "private, max-age=300"}
+    )
+
+@router.get("/analysis-cache")
+async def analysis_cache_stats():
+    """Hit/miss counters and size of the shared analysis cache."""
+    cache = get_analysis_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **await run_in_threadpool(cache.stats)}
+
 @router.get("/template")
 async def get_template(mode: str = "project"):
     """Generate and serve a sample Excel template."""
@@ -48,6 +114,12 @@ async def get_template(mode: str = "project"):
     }
     return StreamingResponse(output, headers=headers, media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
 
+async def check_quota(session_path: str):
+    """Refuse uploads once the session or the server is out of storage quota."""
+    reason = await run_in_threadpool(quota_exceeded, session_path)
+    if reason:
+        raise HTTPException(status_code=507, detail=reason)
+
 @router.post("/excel")
 async def upload_excel(email: str = Form(...), file: UploadFile = File(...)):
     """Upload and parse Excel file."""
@@ -57,15 +129,14 @@ async def upload_excel(email: str = Form(...), file: UploadFile = File(...)):
     session_path = get_session_path(email)
     if not os.path.exists(session_path):
         raise HTTPException(status_code=404, detail="Session not found. Please login first.")
+    await check_quota(session_path)
 
     file_location = os.path.join(session_path, file.filename)
-    with open(file_location, "wb") as f:
-        shutil.copyfileobj(file.file, f)
+    await save_upload_file(file, file_location)
 
-    try:
-        records = parse_excel(file_location)
-        # Initialize default fields
-        for record in records:
+    def excel_records():
+        for record in iter_excel(file_location):
+            # Initialize default fields
             record.update({
                 "status": "Pending",
                 "display_order": None,
@@ -76,60 +147,211 @@ async def upload_excel(email: str = Form(...), file: UploadFile = File(...)):
                 "size": "N/A", "format": "N/A", "color_mode": "N/A", 
                 "background": "N/A", "watermark": "N/A"
             })
-        
-        save_metadata(session_path, records)
-        return {"message": "Excel processed", "count": len(records)}
+            yield record
+
+    try:
+        # Rows are streamed from the file into the session store
+        count = await run_in_threadpool(save_metadata, session_path, excel_records())
+        return {"message": "Excel processed", "count": count}
     except Exception as e:
+        print(f"Error parsing Excel: {e}")
         raise HTTPException(status_code=400, detail=str(e))
 
+async def ingest_images(
+    session_path: str, received: List[Tuple[str, str, str]], analysis_mode: Optional[str],
+    background_tasks: BackgroundTasks
+) -> List[Dict[str, Any]]:
+    """
+    Add received uploads, (filename, temp path, sha256) each, to a session:
+    store and link the files, extract their metadata and merge it into the
+    records. Returns one result per file.
+    """
+    images_dir = os.path.join(session_path, "images")
+    os.makedirs(images_dir, exist_ok=True)
+
+    # Each upload lands in the content-addressed blob store; the session
+    # image is a link to it, so identical content is stored once
+    file_paths = []
+    created = []
+    for index, (filename, temp_path, digest) in enumerate(received):
+        file_path = os.path.join(images_dir, filename)
+        try:
+            created.append(await run_in_threadpool(store_upload, temp_path, digest, file_path))
+        except BaseException:
+            for _, later_path, _ in received[index + 1:]:
+                if os.path.exists(later_path):
+                    os.remove(later_path)
+            raise
+        file_paths.append(file_path)
+    filenames = [filename for filename, _, _ in received]
+    digests = [digest for _, _, digest in received]
+
+    # Names re-uploaded with other content drop their reference to the old blob
+    previous = await run_in_threadpool(link_image_blobs, session_path, list(zip(filenames, digests)))
+    replaced = [old for old, new in zip(previous, digests) if old and old != new]
+    if replaced:
+        await run_in_threadpool(release_blobs, replaced)
+
+    # Extract Metadata on the process pool, off the event loop, once per distinct content
+    unique = dict(zip(reversed(digests), reversed(file_paths)))
+    extracted = dict(zip(unique, await run_in_threadpool(extract_many, list(unique.values()), analysis_mode, list(unique))))
+    metas = [{**extracted[digest], "image_name": filename} for filename, digest in zip(filenames, digests)]
+
+    # Merge with existing records from Excel in one transaction
+    image_url = f"/sessions/{os.path.basename(session_path)}/images"
+    matched = await run_in_threadpool(update_image_records, session_path, [
+        (filename, {**meta, "image_path": f"{image_url}/{filename}"})
+        for filename, meta in zip(filenames, metas)
+    ])
+
+    results = [
+        {
+            "filename": filename,
+            "status": "Merged" if update_success else "Orphaned (No Excel Match)",
+            "stored": "new" if is_new else "deduplicated",
+            "replaced": bool(old and old != digest),
+            "meta": meta
+        }
+        for filename, meta, update_success, is_new, old, digest in zip(filenames, metas, matched, created, previous, digests)
+    ]
+
+    # Thumbnails/previews for the validation page, after the response is sent
+    background_tasks.add_task(pregenerate_derivatives, file_paths)
+    if any(meta.get("pixel_analysis") == "pending" for meta in metas):
+        # Quick mode: pixel checks follow in the background
+        background_tasks.add_task(start_pixel_fill, session_path)
+    return results
+
 @router.post("/images")
-async def upload_images(
-    email: str = Form(...), 
-    files: List[UploadFile] = File(...)
-):
-    """Upload images and extract metadata."""
+async def upload_images(request: Request, background_tasks: BackgroundTasks):
+    """
+    Upload images and extract metadata. The multipart form sends email and
+    an optional analysis_mode before the files; the body is parsed as it
+    arrives and each file written straight to the blob store.
+    """
+    target = {}
+    def before_files(fields: Dict[str, str]):
+        # Runs once the form fields are in, before any file is written
+        if not fields.get("email"):
+            raise HTTPException(status_code=400, detail="email must be sent before the files")
+        check_analysis_mode(fields.get("analysis_mode"))
+        session_path = get_session_path(fields["email"])
+        if not os.path.exists(session_path):
+            raise HTTPException(status_code=404, detail="Session not found")
+        reason = quota_exceeded(session_path)
+        if reason:
+            raise HTTPException(status_code=507, detail=reason)
+        target["session_path"] = session_path
+
+    try:
+        fields, received = await receive_multipart(
+            request.headers.get("content-type", ""), request.stream(), "files", before_files
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not received:
+        raise HTTPException(status_code=422, detail="No files uploaded")
+    analysis_mode = fields.get("analysis_mode") or None
+    return {"results": await ingest_images(target["session_path"], received, analysis_mode, background_tasks)}
+
+class CreateUploadRequest(BaseModel):
+    email: str
+    filename: str
+    size: int
+    analysis_mode: Optional[str] = None
+
+class FinalizeUploadRequest(BaseModel):
+    email: str
+
+def upload_session(email: str) -> str:
     session_path = get_session_path(email)
     if not os.path.exists(session_path):
         raise HTTPException(status_code=404, detail="Session not found")
+    return session_path
 
-    images_dir = os.path.join(session_path, "images")
-    if not os.path.exists(images_dir):
-        os.makedirs(images_dir)
+async def find_upload(session_path: str, upload_id: str) -> Dict[str, Any]:
+    upload = await run_in_threadpool(load_upload, session_path, upload_id)
+    if upload is None or not os.path.exists(upload_path(session_path, upload_id)):
+        raise HTTPException(status_code=404, detail="Upload not found or expired")
+    return upload
 
-    results = []
-    
-    # Process sequentially/parallel (simple loop for now)
-    for file in files:
-        file_path = os.path.join(images_dir, file.filename)
-        with open(file_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
-            
-        # Extract Metadata
-        meta = extract_technical_metadata(file_path)
-        
-        # Merge with existing record from Excel if matches
-        update_success = update_image_record(session_path, file.filename, {
-            **meta,
-            "image_path": f"/sessions/{os.path.basename(session_path)}/images/{file.filename}"
-        })
-        
-        results.append({
-            "filename": file.filename, 
-            "status": "Merged" if update_success else "Orphaned (No Excel Match)",
-            "meta": meta
-        })
+@router.post("/resumable", status_code=201)
+async def create_resumable_upload(request: CreateUploadRequest):
+    """
+    Start a resumable upload of one image. Send its bytes with PUT
+    /upload/resumable/{upload_id}?offset=N (chunks in any order, also in
+    parallel), check progress with GET, then finalize it.
+    """
+    check_analysis_mode(request.analysis_mode)
+    session_path = upload_session(request.email)
+    filename = os.path.basename(request.filename)
+    if not filename or filename != request.filename:
+        raise HTTPException(status_code=400, detail="filename must be a plain file name")
+    if request.size < 0:
+        raise HTTPException(status_code=400, detail="size must be at least 0")
+    await check_quota(session_path)
+    return await run_in_threadpool(new_upload, session_path, filename, request.size, request.analysis_mode)
 
-    return {"results": results}
+@router.get("/resumable/{upload_id}")
+async def get_resumable_upload(upload_id: str, email: str):
+    """Progress of a resumable upload: the contiguous offset and every byte range received."""
+    session_path = upload_session(email)
+    return upload_status(upload_id, await find_upload(session_path, upload_id))
 
-@router.post("/local-path")
-async def upload_local_path(
-    email: str = Form(...), 
-    path: str = Form(None), # Made optional
-    file: UploadFile = File(None)
-):
-    """Scan a local directory and/or use absolute paths from Excel to extract metadata."""
+@router.put("/resumable/{upload_id}")
+async def put_upload_chunk(upload_id: str, email: str, offset: int, request: Request):
+    """Write the request body into the upload at offset."""
+    session_path = upload_session(email)
+    upload = await find_upload(session_path, upload_id)
+    try:
+        ranges = await write_chunk(session_path, upload_id, upload, offset, request.stream())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload not found or expired")
+    if ranges is None:
+        raise HTTPException(status_code=404, detail="Upload not found or expired")
+    return upload_status(upload_id, {**upload, "ranges": ranges})
+
+@router.post("/resumable/{upload_id}/finalize")
+async def finalize_upload(upload_id: str, request: FinalizeUploadRequest, background_tasks: BackgroundTasks):
+    """
+    Finish a complete upload: the image is stored and its metadata extracted
+    and merged as with /upload/images, while other uploads carry on.
+    """
+    session_path = upload_session(request.email)
+    upload = await find_upload(session_path, upload_id)
+    if received_bytes(upload["ranges"]) != upload["size"]:
+        raise HTTPException(status_code=409, detail=upload_status(upload_id, upload))
+    # Whoever removes the upload first finalizes it
+    upload = await run_in_threadpool(take_upload, session_path, upload_id)
+    if upload is None:
+        raise HTTPException(status_code=404, detail="Upload not found or already finalized")
+    path = upload_path(session_path, upload_id)
+    try:
+        digest = await run_in_threadpool(hash_file, path)
+    except BaseException:
+        os.remove(path)
+        raise
+    received = [(upload["filename"], path, digest)]
+    return {"results": await ingest_images(session_path, received, upload["analysis_mode"], background_tasks)}
+
+@router.delete("/resumable/{upload_id}")
+async def abort_upload(upload_id: str, email: str):
+    """Abandon a resumable upload and delete what was received."""
+    session_path = upload_session(email)
+    if await run_in_threadpool(take_upload, session_path, upload_id) is None:
+        raise HTTPException(status_code=404, detail="Upload not found or already finalized")
+    path = upload_path(session_path, upload_id)
+    if os.path.exists(path):
+        os.remove(path)
+    return {"message": "Upload aborted"}
+
+async def prepare_local_scan(email, path, file, analysis_mode):
+    """Validate a local-path request and parse its Excel; returns (session_path, excel_records)."""
     if not email:
         raise HTTPException(status_code=400, detail="Email required")
+    check_analysis_mode(analysis_mode)
     
     print(f"Processing local path upload for {email}")
     print(f"Path: {path}")
@@ -147,101 +369,121 @@ async def upload_local_path(
     excel_records = {} # Map: image_name -> record
     if file:
         temp_excel_path = os.path.join(session_path, f"temp_{file.filename}")
-        with open(temp_excel_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
+        await save_upload_file(file, temp_excel_path)
         
         try:
-            parsed = parse_excel(temp_excel_path)
-            for rec in parsed:
-                img_name = rec.get("image_name")
-                if img_name:
-                    # If multiple rows have same image_name, last one wins or we could handle duplicates
-                    excel_records[img_name] = rec
+            def index_rows():
+                for rec in iter_excel(temp_excel_path):
+                    img_name = rec.get("image_name")
+                    if img_name:
+                        # If multiple rows have same image_name, last one wins or we could handle duplicates
+                        excel_records[img_name] = rec
+            await run_in_threadpool(index_rows)
         except Exception as e:
-            if os.path.exists(temp_excel_path):
-                os.remove(temp_excel_path)
             raise HTTPException(status_code=400, detail=f"Excel parsing failed: {str(e)}")
         finally:
             if os.path.exists(temp_excel_path):
                 os.remove(temp_excel_path)
 
-    # 2. Collect image paths from directory (if path provided)
-    found_paths_by_name = {} # Map: filename -> absolute_path
-    if path:
-        if not os.path.exists(path):
-            raise HTTPException(status_code=400, detail="Provided directory path does not exist")
-        
-        valid_extensions = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff')
-        for root, dirs, files in os.walk(path):
-            for f_name in files:
-                if f_name.lower().endswith(valid_extensions):
-                    found_paths_by_name[f_name] = os.path.join(root, f_name)
-
-    # 3. Collect absolute paths from Excel
-    for img_name, rec in excel_records.items():
-        full_p = rec.get("full_path")
-        if full_p and os.path.exists(str(full_p)):
-            # Excel path takes precedence if it exists
-            found_paths_by_name[img_name] = str(full_p)
-
-    if not found_paths_by_name and not excel_records:
-        raise HTTPException(status_code=404, detail="No images found in path and no metadata in Excel.")
-
-    records = []
-    results = []
-    processed_image_names = set()
-
-    # 4. Process all images we found a path for
-    for filename, file_path in found_paths_by_name.items():
-        processed_image_names.add(filename)
-        
-        # Extract Metadata
-        meta = extract_technical_metadata(file_path)
-        
-        # Get Excel metadata if available
-        excel_meta = excel_records.get(filename, {})
-        
-        # Try to extract SKU ID from filename as fallback
-        sku_fallback = filename.split('_')[0] if '_' in filename else filename.split('.')[0]
-        
-        record = {
-            "image_provided_by": excel_meta.get("image_provided_by", "MFR Image" if "mfr" in file_path.lower() or "mfr" in filename.lower() else "Client Image"),
-            "sku_id": excel_meta.get("sku_id", sku_fallback),
-            "image_name": filename,
-            "status": "Pending",
-            "display_order": excel_meta.get("display_order"),
-            "notes": excel_meta.get("notes", ""),
-            "image_path": file_path,
-            **meta
-        }
-        records.append(record)
-        results.append({
-            "filename": filename, 
-            "status": "Matched" if filename in excel_records else "Scanned",
-            "source": "Excel Path" if excel_records.get(filename, {}).get("full_path") == file_path else "Directory Scan"
-        })
-
-    # 5. Handle records in Excel but NOT found anywhere (Missing Images)
-    for filename, excel_meta in excel_records.items():
-        if filename not in processed_image_names:
-            record = {
-                "image_provided_by": excel_meta.get("image_provided_by", "Unknown"),
-                "sku_id": excel_meta.get("sku_id", "Unknown"),
-                "image_name": filename,
-                "status": "Missing",
-                "display_order": excel_meta.get("display_order"),
-                "notes": excel_meta.get("notes", "Image file not found"),
-                "image_path": None,
-                "width": "N/A", "height": "N/A", "resolution": "N/A", "dpi": "N/A",
-                "size": "0 KB", "format": "N/A", "color_mode": "N/A", 
-                "background": "N/A", "watermark": "N/A"
-            }
-            records.append(record)
-            results.append({"filename": filename, "status": "Missing"})
-
-    save_metadata(session_path, records)
-    return {
-        "message": f"Processed {len(records)} records ({len(processed_image_names)} images found)", 
-        "count": len(records),
-        "results": results
-    }
+    if path and not os.path.exists(path):
+        raise HTTPException(status_code=400, detail="Provided directory path does not exist")
+    return session_path, excel_records
+
+@router.post("/local-path")
+async def upload_local_path(
+    background_tasks: BackgroundTasks,
+    email: str = Form(...), 
+    path: str = Form(None), # Made optional
+    file: UploadFile = File(None),
+    analysis_mode: str = Form(None)
+):
+    """Scan a local directory and/or use absolute paths from Excel to extract metadata."""
+    session_path, excel_records = await prepare_local_scan(email, path, file, analysis_mode)
+
+    try:
+        summary = await run_in_threadpool(run_local_scan, session_path, path, excel_records, analysis_mode)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    # Thumbnails/previews for the validation page, after the response is sent
+    background_tasks.add_task(pregenerate_derivatives, summary.pop("image_paths"))
+    if summary["pixels_pending"]:
+        background_tasks.add_task(start_pixel_fill, session_path)
+    return summary
+
+@router.post("/local-path/jobs", status_code=202)
+async def submit_local_path_job(
+    email: str = Form(...),
+    path: str = Form(None),
+    file: UploadFile = File(None),
+    analysis_mode: str = Form(None)
+):
+    """Start a local-path scan in the background; poll /upload/jobs/{job_id} for progress."""
+    session_path, excel_records = await prepare_local_scan(email, path, file, analysis_mode)
+
+    def work(job):
+        # Errors (e.g. LookupError when nothing is found) fail the job with their message
+        summary = run_local_scan(session_path, path, excel_records, analysis_mode, job=job)
+        # Thumbnails/previews are not part of the job's progress
+        threading.Thread(target=pregenerate_derivatives, args=(summary["image_paths"],), daemon=True).start()
+        if summary["pixels_pending"]:
+            start_pixel_fill(session_path)
+        changes = summary["changes"]
+        return (
+            f"{summary['message']}; since the last scan {changes['added']} added, "
+            f"{changes['changed']} changed, {len(changes['removed'])} removed"
+        )
+
+    job = submit_job("local-path", email, work, session_path)
+    return {"job_id": job.id, "status": job.status}
+
+async def find_user_job(job_id: str, email: str):
+    """The user's job, whichever worker process runs it."""
+    job = await run_in_threadpool(find_job, job_id, email, get_session_path(email))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str, email: str, since: int = 0):
+    """Progress, throughput, ETA and per-file results (from index `since`) of a job."""
+    job = await find_user_job(job_id, email)
+    return await run_in_threadpool(job.snapshot, since)
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, email: str, request: Request):
+    """Server-sent events with the job's progress; each event carries only new results."""
+    job = await find_user_job(job_id, email)
+
+    async def events():
+        sent_revision = -1
+        sent_results = 0
+        while True:
+            await run_in_threadpool(job.refresh)
+            if job.revision != sent_revision:
+                snapshot = await run_in_threadpool(job.snapshot, sent_results)
+                sent_revision = snapshot["revision"]
+                sent_results = snapshot["results_total"]
+                yield f"event: progress\ndata: {json.dumps(snapshot)}\n\n"
+                if snapshot["status"] in FINISHED_STATES:
+                    break
+            if await request.is_disconnected():
+                break
+            await asyncio.sleep(JOB_EVENT_INTERVAL)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+class CancelJobRequest(BaseModel):
+    email: str
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str, request: CancelJobRequest):
+    """Stop a job after its current batch; batches already committed are kept."""
+    job = await find_user_job(job_id, request.email)
+    if not job.finished:
+        await run_in_threadpool(job.cancel)
+    return {"job_id": job.id, "status": job.status, "cancel_requested": job.cancel_requested}
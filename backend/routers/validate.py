@@ -1,8 +1,16 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List, Optional, Any
+from typing import Dict, List, Optional, Any
 from services.session import get_session_path
-from services.data import load_metadata, save_metadata, update_image_record
+from services.data import (
+    update_image_record, apply_image_updates, update_sku_records, load_sku_records, load_sku_counts, check_sku_index,
+    status_bucket, SKU_STATUS_FILTERS, STATUS_BUCKETS
+)
+from services.responses import json_response, decode_cursor, check_page_size, parse_fields, project, page
+from services.pixel_fill import pixels_pending, fill_pixel_metadata
+from services.duplicates import DUPLICATE_MAX_DISTANCE, DUPLICATE_DISTANCE_LIMIT, find_duplicates
+from services.triage import load_rules, run_triage
 import os
 
 router = APIRouter(prefix="/validate", tags=["Validate"])
@@ -14,50 +22,133 @@ class UpdateStatusRequest(BaseModel):
     display_order: Optional[int] = None
     notes: Optional[str] = None
 
+class ImageChange(BaseModel):
+    image_name: str
+    status: Optional[str] = None
+    display_order: Optional[int] = None
+    notes: Optional[str] = None
+
+class BulkUpdateRequest(BaseModel):
+    email: str
+    changes: List[ImageChange]
+
+class TriageRequest(BaseModel):
+    email: str
+    rules: Optional[Dict[str, Any]] = None
+    dry_run: bool = False
+
+# Statuses that leave an image without a display order
+UNORDERED_STATUSES = ("Rejected", "Pending")
+# A status set by hand replaces the auto-triage mark
+CLEAR_TRIAGE = {"triage": None, "triage_reasons": None}
+
+SKU_FIELDS = ("sku_id", "total", "approved", "rejected", "pending")
+SKU_FIELD_PRESETS = {"counts": SKU_FIELDS}
+# Fields the validation page shows on each image card
+IMAGE_FIELD_PRESETS = {
+    "card": (
+        "sku_id", "image_name", "image_path", "image_provided_by", "size", "resolution", "dpi", "format",
+        "status", "display_order", "notes", "triage", "triage_reasons",
+    ),
+}
+
 @router.get("/skus")
-async def get_skus(email: str):
-    """Get list of SKUs and their progress."""
+async def get_skus(
+    email: str, request: Request, limit: Optional[int] = None, cursor: Optional[str] = None,
+    fields: Optional[str] = None, status: Optional[str] = None
+):
+    """
+    Get list of SKUs and their progress. With limit or cursor the SKUs come
+    in pages of {"items", "next_cursor"}; fields projects each entry and
+    status keeps SKUs with images in that bucket (or "complete" ones).
+    """
     session_path = get_session_path(email)
     if not os.path.exists(session_path):
         raise HTTPException(status_code=404, detail="Session not found")
-        
-    data = load_metadata(session_path)
-    if not data:
-        return []
-        
-    skus = {}
-    for item in data:
-        sku = item.get("sku_id")
-        if sku not in skus:
-            skus[sku] = {"sku_id": sku, "total": 0, "approved": 0, "rejected": 0, "pending": 0}
-        
-        skus[sku]["total"] += 1
-        status = item.get("status", "Pending").lower()
-        if status == "approved":
-            skus[sku]["approved"] += 1
-        elif status == "rejected":
-            skus[sku]["rejected"] += 1
-        else:
-            skus[sku]["pending"] += 1
-            
-    return list(skus.values())
+    check_page_size(limit)
+    if status is not None and status not in SKU_STATUS_FILTERS:
+        raise HTTPException(status_code=400, detail=f"status must be one of {', '.join(SKU_STATUS_FILTERS)}")
+    after = None
+    if cursor is not None:
+        key = decode_cursor(cursor)
+        if len(key) != 1 or not isinstance(key[0], int):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        after = key[0]
+
+    # Counters are maintained by every write, so this does not scan the records
+    # One extra row tells whether another page follows
+    counts = await run_in_threadpool(load_sku_counts, session_path, after, limit + 1 if limit else None, status)
+    next_key = None
+    if limit is not None and len(counts) > limit:
+        counts = counts[:limit]
+        next_key = [counts[-1]["first_id"]]
+    items = project(counts, parse_fields(fields, SKU_FIELD_PRESETS) or list(SKU_FIELDS))
+    if limit is None and cursor is None:
+        return await json_response(request, items)
+    return await json_response(request, page(items, next_key))
+
+def _image_sort_key(record):
+    return (record.get("display_order") or 9999, record.get("image_name"))
 
 @router.get("/images/{sku_id}")
-async def get_images_by_sku(email: str, sku_id: str):
-    """Get all images for a specific SKU."""
+async def get_images_by_sku(
+    email: str, sku_id: str, request: Request, limit: Optional[int] = None, cursor: Optional[str] = None,
+    fields: Optional[str] = None, status: Optional[str] = None
+):
+    """
+    Get all images for a specific SKU. With limit or cursor they come in
+    pages of {"items", "next_cursor"}; fields projects each record and
+    status keeps one bucket (approved, rejected or pending).
+    """
+    check_page_size(limit)
+    if status is not None and status not in STATUS_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"status must be one of {', '.join(STATUS_BUCKETS)}")
+    after = None
+    if cursor is not None:
+        after = decode_cursor(cursor)
+        if len(after) != 3:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
     session_path = get_session_path(email)
-    data = load_metadata(session_path)
+    # Only this SKU's records, via the sku index
+    sku_images = await run_in_threadpool(load_sku_records, session_path, sku_id)
     
-    # Filter by SKU (stringify to be safe)
-    sku_images = [
-        item for item in data 
-        if str(item.get("sku_id")).strip() == str(sku_id).strip()
-    ]
-    
-    # Sort: generic sort by name, or display_order if available
-    sku_images.sort(key=lambda x: (x.get("display_order") or 9999, x.get("image_name")))
-    
-    return sku_images
+    # Sort: generic sort by name, or display_order if available. The record's
+    # position in the SKU breaks ties, so the order (and cursors) are total
+    keyed = sorted(
+        ((*_image_sort_key(record), position), record)
+        for position, record in enumerate(sku_images)
+        if status is None or status_bucket(record) == status
+    )
+    if after is not None:
+        try:
+            keyed = [(key, record) for key, record in keyed if key > tuple(after)]
+        except TypeError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    next_key = None
+    if limit is not None and len(keyed) > limit:
+        keyed = keyed[:limit]
+        next_key = list(keyed[-1][0])
+    sku_images = [record for _, record in keyed]
+
+    # Pixel checks skipped by a quick scan run the first time the images are listed
+    if any(pixels_pending(record) for record in sku_images):
+        await run_in_threadpool(fill_pixel_metadata, session_path, sku_images)
+
+    items = project(sku_images, parse_fields(fields, IMAGE_FIELD_PRESETS))
+    if limit is None and cursor is None:
+        return await json_response(request, items)
+    return await json_response(request, page(items, next_key))
+
+@router.get("/duplicates")
+async def get_duplicates(request: Request, email: str, sku_id: Optional[str] = None, max_distance: int = DUPLICATE_MAX_DISTANCE):
+    """Clusters of near-duplicate images (by perceptual hash) in the session or one SKU."""
+    if not 0 <= max_distance <= DUPLICATE_DISTANCE_LIMIT:
+        raise HTTPException(status_code=400, detail=f"max_distance must be between 0 and {DUPLICATE_DISTANCE_LIMIT}")
+    session_path = get_session_path(email)
+    if not os.path.exists(session_path):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return await json_response(request, await run_in_threadpool(find_duplicates, session_path, sku_id, max_distance))
 
 class ResetSkuRequest(BaseModel):
     email: str
@@ -73,19 +164,47 @@ async def update_image(request: UpdateStatusRequest):
     updates = {
         "status": request.status,
         "display_order": request.display_order,
-        "notes": request.notes
+        "notes": request.notes,
+        **CLEAR_TRIAGE
     }
     
     # If rejected or pending, clear order
-    if request.status in ["Rejected", "Pending"]:
+    if request.status in UNORDERED_STATUSES:
         updates["display_order"] = None
         
-    success = update_image_record(session_path, request.image_name, updates)
+    success = await run_in_threadpool(update_image_record, session_path, request.image_name, updates)
     if not success:
         raise HTTPException(status_code=404, detail="Image record not found")
         
     return {"message": "Updated successfully"}
 
+@router.post("/bulk-update")
+async def bulk_update_images(request: BulkUpdateRequest):
+    """
+    Update many images in one atomic write. Each change only sets the fields
+    it names, so concurrent edits of different fields do not overwrite each
+    other. If any image is unknown nothing is changed.
+    """
+    session_path = get_session_path(request.email)
+    if not os.path.exists(session_path):
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    changes = []
+    for change in request.changes:
+        updates = change.model_dump(exclude_unset=True, exclude={"image_name"})
+        if "status" in updates:
+            updates.update(CLEAR_TRIAGE)
+        if updates.get("status") in UNORDERED_STATUSES:
+            updates["display_order"] = None
+        changes.append((change.image_name, updates))
+
+    try:
+        updated = await run_in_threadpool(apply_image_updates, session_path, changes)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=f"Image record not found: {e}")
+
+    return {"message": "Updated successfully", "updated": updated}
+
 @router.post("/reset")
 async def reset_sku(request: ResetSkuRequest):
     """Reset all images for a specific SKU to Pending."""
@@ -95,25 +214,45 @@ async def reset_sku(request: ResetSkuRequest):
         print(f"DEBUG: Session path not found: {session_path}")
         raise HTTPException(status_code=404, detail="Session not found")
         
-    data = load_metadata(session_path)
-    updated = False
+    count = await run_in_threadpool(
+        update_sku_records, session_path, request.sku_id, {"status": "Pending", "display_order": None, **CLEAR_TRIAGE}
+    )
     
-    print(f"DEBUG: Loaded {len(data)} records from metadata.json")
-    
-    # Filter and update in memory
-    for item in data:
-        item_sku = str(item.get("sku_id")).strip()
-        req_sku = str(request.sku_id).strip()
-        if item_sku == req_sku:
-            print(f"DEBUG: Matching SKU found for image {item.get('image_name')}. Resetting...")
-            item["status"] = "Pending"
-            item["display_order"] = None
-            updated = True
-            
-    if updated:
-        save_metadata(session_path, data)
-        print(f"DEBUG: Successfully updated and saved metadata.json")
+    if count:
         return {"message": f"Reset all images for SKU {request.sku_id}"}
     
     print(f"DEBUG: No matching SKU found or no updates needed for {request.sku_id}")
     return {"message": "No changes made"}
+
+@router.get("/index-check")
+async def check_index(email: str, repair: bool = False):
+    """Verify the per-SKU counters against the records, optionally rebuilding them."""
+    session_path = get_session_path(email)
+    if not os.path.exists(session_path):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return await run_in_threadpool(check_sku_index, session_path, repair)
+
+@router.get("/triage/rules")
+async def get_triage_rules():
+    """The auto-triage rule set in effect (defaults and TRIAGE_RULES_PATH)."""
+    try:
+        return load_rules()
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=f"Invalid triage rules: {e}")
+
+@router.post("/triage")
+async def triage_images(request: TriageRequest):
+    """
+    Auto-triage the session's undecided images: those failing a rule are
+    rejected (Auto-Rejected), those a rule cannot decide stay Pending as
+    Needs-Review. rules overrides settings of the configured rule set;
+    dry_run only reports what would change.
+    """
+    session_path = get_session_path(request.email)
+    if not os.path.exists(session_path):
+        raise HTTPException(status_code=404, detail="Session not found")
+    try:
+        rules = load_rules(request.rules)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await run_in_threadpool(run_triage, session_path, rules, request.dry_run)
@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+from services.image import ANALYZER_VERSION
+
+# Shared across sessions and users; relative to the working directory like sessions/
+ANALYSIS_CACHE_PATH = os.environ.get("ANALYSIS_CACHE_PATH", "analysis_cache.sqlite")
+# Size budget for cached results; 0 disables the cache
+ANALYSIS_CACHE_MAX_BYTES = int(os.environ.get("ANALYSIS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    digest TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    data TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (digest, profile)
+);
+CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    digest TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's contents."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def file_key(path: str) -> Optional[Tuple[int, int, int]]:
+    """(size, mtime_ns, inode) of a file, or None if it cannot be stat'ed."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns, st.st_ino)
+
+def with_image_name(meta: Dict[str, Any], image_path: str) -> Dict[str, Any]:
+    """Cached results are stored without image_name; put it back in front."""
+    return {"image_name": os.path.basename(image_path), **meta}
+
+class AnalysisCache:
+    """
+    SQLite cache of extract_technical_metadata results.
+    Results are keyed by (content digest, analysis profile). The files table
+    maps (path, size, mtime, inode) to a digest so unchanged files are found
+    without reading them. Least recently used results are evicted once the
+    stored size exceeds max_bytes.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        conn = self._conn()
+        with conn:
+            conn.executescript(SCHEMA)
+            row = conn.execute("SELECT value FROM meta WHERE key = 'analyzer_version'").fetchone()
+            if row is None or row[0] != ANALYZER_VERSION:
+                # Results from another analyzer version are stale
+                conn.execute("DELETE FROM results")
+                conn.execute("DELETE FROM files")
+                conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('analyzer_version', ?)",
+                    (ANALYZER_VERSION,)
+                )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def lookup_files(self, paths: List[str], profile: str) -> List[Tuple[Any, Optional[str], Optional[Dict[str, Any]]]]:
+        """
+        Stat-based pre-check. Returns (file_key, digest, meta) per path; digest
+        is set when the file is unchanged since it was last hashed, meta when a
+        result for this profile is cached too.
+        """
+        conn = self._conn()
+        found = []
+        for path in paths:
+            key = file_key(path)
+            if key is None:
+                found.append((None, None, None))
+                continue
+            row = conn.execute(
+                "SELECT f.digest, r.data FROM files f "
+                "LEFT JOIN results r ON r.digest = f.digest AND r.profile = ? "
+                "WHERE f.path = ? AND f.size = ? AND f.mtime_ns = ? AND f.inode = ?",
+                (profile, os.path.abspath(path), *key)
+            ).fetchone()
+            if row is None:
+                found.append((key, None, None))
+            else:
+                meta = with_image_name(json.loads(row[1]), path) if row[1] is not None else None
+                found.append((key, row[0], meta))
+        return found
+
+    def get(self, digest: str, profile: str) -> Optional[Dict[str, Any]]:
+        """Cached result for a content digest, without image_name."""
+        row = self._conn().execute(
+            "SELECT data FROM results WHERE digest = ? AND profile = ?", (digest, profile)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, profile: str, entries: List[Tuple[str, Any, Optional[str], Dict[str, Any], bool]]):
+        """
+        Record a batch of lookups. Each entry is (path, file_key, digest, meta, hit).
+        Hits refresh last_used, misses with a successful result are stored.
+        """
+        now = time.time()
+        conn = self._conn()
+        hits = misses = 0
+        stored = False
+        with conn:
+            for path, key, digest, meta, hit in entries:
+                if not digest:
+                    continue
+                if key is not None:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO files (path, size, mtime_ns, inode, digest) VALUES (?, ?, ?, ?, ?)",
+                        (os.path.abspath(path), *key, digest)
+                    )
+                if hit:
+                    hits += 1
+                    conn.execute(
+                        "UPDATE results SET last_used = ? WHERE digest = ? AND profile = ?",
+                        (now, digest, profile)
+                    )
+                    continue
+                misses += 1
+                if meta.get("extraction_status") != "Extraction Complete!":
+                    continue
+                data = json.dumps({k: v for k, v in meta.items() if k != "image_name"})
+                conn.execute(
+                    "INSERT OR REPLACE INTO results (digest, profile, data, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                    (digest, profile, data, len(data) + len(digest) + len(profile), now)
+                )
+                stored = True
+            self._count(conn, "hits", hits)
+            self._count(conn, "misses", misses)
+            if stored:
+                self._evict(conn)
+
+    def _count(self, conn: sqlite3.Connection, name: str, amount: int):
+        if amount:
+            conn.execute(
+                "INSERT INTO counters (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                (name, amount)
+            )
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Drop least recently used results until 90% of max_bytes is left."""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - int(self.max_bytes * 0.9)
+        victims = []
+        for rowid, size in conn.execute("SELECT rowid, size FROM results ORDER BY last_used"):
+            victims.append((rowid,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM results WHERE rowid = ?", victims)
+        conn.execute("DELETE FROM files WHERE digest NOT IN (SELECT digest FROM results)")
+        self._count(conn, "evictions", len(victims))
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size, summed over all processes."""
+        conn = self._conn()
+        counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "evictions": counters.get("evictions", 0),
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "analyzer_version": ANALYZER_VERSION
+        }
+
+_cache = None
+_cache_pid = None
+
+def get_analysis_cache() -> Optional[AnalysisCache]:
+    """Per-process cache handle, or None when the cache is disabled."""
+    global _cache, _cache_pid
+    if ANALYSIS_CACHE_MAX_BYTES <= 0:
+        return None
+    if _cache is None or _cache_pid != os.getpid():
+        _cache = AnalysisCache(ANALYSIS_CACHE_PATH, ANALYSIS_CACHE_MAX_BYTES)
+        _cache_pid = os.getpid()
+    return _cache
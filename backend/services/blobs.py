@@ -0,0 +1,83 @@
+import os
+import shutil
+import uuid
+from typing import Iterable
+
+# Content-addressed store for uploaded images, shared by all sessions. Session
+# image files are hard links into it, so its link count is the reference count.
+BLOB_DIR = os.environ.get("BLOB_DIR", "blobs")
+
+def blob_path(digest: str) -> str:
+    """Location of a blob: sha256 sharded two levels deep (ab/cd/abcd...)."""
+    return os.path.join(BLOB_DIR, digest[:2], digest[2:4], digest)
+
+def new_upload_path() -> str:
+    """Temporary file to receive an upload into, on the blob store's filesystem."""
+    temp_dir = os.path.join(BLOB_DIR, "tmp")
+    os.makedirs(temp_dir, exist_ok=True)
+    return os.path.join(temp_dir, f"{uuid.uuid4().hex}.upload")
+
+def _publish(temp_path: str, digest: str) -> bool:
+    """Add temp_path to the store under digest; False if the blob was already there."""
+    path = blob_path(digest)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        os.link(temp_path, path)
+    except FileExistsError:
+        return False
+    except OSError:
+        # Filesystem without hard links
+        if os.path.exists(path):
+            return False
+        partial = f"{path}.{uuid.uuid4().hex}.partial"
+        shutil.copyfile(temp_path, partial)
+        os.replace(partial, path)
+    return True
+
+def _link(digest: str, dest_path: str):
+    """Point dest_path at a blob, atomically replacing whatever was there."""
+    temp_dest = f"{dest_path}.{uuid.uuid4().hex}.linking"
+    try:
+        os.link(blob_path(digest), temp_dest)
+    except FileNotFoundError:
+        # The blob itself is gone; the caller publishes it again
+        raise
+    except OSError:
+        # Different filesystem or no hard links: fall back to a private copy
+        shutil.copyfile(blob_path(digest), temp_dest)
+    os.replace(temp_dest, dest_path)
+
+def store_upload(temp_path: str, digest: str, dest_path: str) -> bool:
+    """
+    Move a received upload into the store and link it at dest_path. Content
+    that is already stored is not kept twice. Returns whether the blob is new.
+    """
+    try:
+        for _ in range(2):
+            created = _publish(temp_path, digest)
+            try:
+                _link(digest, dest_path)
+                return created
+            except FileNotFoundError:
+                # An unreferenced blob was released between the two steps; publish again
+                continue
+        raise FileNotFoundError(f"Blob {digest} disappeared while linking")
+    finally:
+        os.remove(temp_path)
+
+def release_blobs(digests: Iterable[str]) -> int:
+    """
+    Delete blobs no session links to any more (link count 1: the store's own
+    entry). Cheap enough to run for every reference dropped. Returns how many
+    were deleted.
+    """
+    released = 0
+    for digest in set(digests):
+        path = blob_path(digest)
+        try:
+            if os.stat(path).st_nlink <= 1:
+                os.remove(path)
+                released += 1
+        except OSError:
+            pass
+    return released
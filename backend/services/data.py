@@ -1,40 +1,1017 @@
 import json
+import math
 import os
-from typing import List, Dict, Any
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
+from services.metrics import timed_storage
+from services.state import STORE_FILE, get_state
 
 METADATA_FILE = "metadata.json"
 
+# Record fields copied into columns of the records table (see _columns),
+# for indexed lookups and for reading a few fields of every record without
+# parsing its JSON
+RECORD_COLUMNS = {
+    "image_name": "TEXT", "sku_key": "TEXT", "phash": "TEXT", "status": "TEXT", "triage": "TEXT",
+    "provider": "TEXT", "width": "BIGINT", "height": "BIGINT", "dpi": "BIGINT", "format": "TEXT",
+    "color_mode": "TEXT", "background": "TEXT", "watermark": "TEXT",
+}
+# The perceptual hash is also stored cut into PHASH_BANDS bit ranges, one
+# indexed column each, so the near-duplicate search (services/duplicates.py)
+# reads its multi-index hashing buckets from the store instead of building
+# them per request
+PHASH_BANDS = 5
+RECORD_COLUMNS.update({f"phash_band{band}": "BIGINT" for band in range(PHASH_BANDS)})
+_COLUMN_LIST = ", ".join(RECORD_COLUMNS)
+_COLUMN_UPDATES = ", ".join(f"{column} = ?" for column in RECORD_COLUMNS)
+_COLUMN_PLACEHOLDERS = ", ".join("?" * len(RECORD_COLUMNS))
+
+# Every row carries the key of its session: one store per session for the
+# local backend (key ''), one database for all of them for the shared one.
+# {serial} is filled in per database dialect.
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS records (
+        id {serial},
+        session TEXT NOT NULL DEFAULT '',
+        """ + ",\n        ".join(f"{column} {kind}" for column, kind in RECORD_COLUMNS.items()) + """,
+        data TEXT NOT NULL,
+        unmerged INTEGER NOT NULL DEFAULT 0
+    )""",
+    "CREATE INDEX IF NOT EXISTS records_session_id ON records (session, id)",
+    "CREATE INDEX IF NOT EXISTS records_session_image_name ON records (session, image_name)",
+    "CREATE INDEX IF NOT EXISTS records_session_sku_key ON records (session, sku_key)",
+    # Covering, and partial so records without a hash (e.g. fresh from Excel) cost nothing
+    *(
+        f"CREATE INDEX IF NOT EXISTS records_session_phash_band{band} ON records (session, phash_band{band}, phash) "
+        f"WHERE phash_band{band} IS NOT NULL"
+        for band in range(PHASH_BANDS)
+    ),
+    """CREATE TABLE IF NOT EXISTS sku_counts (
+        session TEXT NOT NULL DEFAULT '',
+        sku_key TEXT NOT NULL,
+        sku_id TEXT NOT NULL,
+        first_id BIGINT NOT NULL,
+        total BIGINT NOT NULL DEFAULT 0,
+        approved BIGINT NOT NULL DEFAULT 0,
+        rejected BIGINT NOT NULL DEFAULT 0,
+        pending BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (session, sku_key)
+    )""",
+    "CREATE INDEX IF NOT EXISTS sku_counts_session_first_id ON sku_counts (session, first_id)",
+    """CREATE TABLE IF NOT EXISTS state (
+        session TEXT NOT NULL DEFAULT '',
+        key TEXT NOT NULL,
+        value BIGINT NOT NULL,
+        PRIMARY KEY (session, key)
+    )""",
+    """CREATE TABLE IF NOT EXISTS image_blobs (
+        session TEXT NOT NULL DEFAULT '',
+        image_name TEXT NOT NULL,
+        digest TEXT NOT NULL,
+        PRIMARY KEY (session, image_name)
+    )""",
+    """CREATE TABLE IF NOT EXISTS scan_snapshot (
+        session TEXT NOT NULL DEFAULT '',
+        path TEXT NOT NULL,
+        size BIGINT NOT NULL,
+        mtime_ns BIGINT NOT NULL,
+        profile TEXT NOT NULL,
+        PRIMARY KEY (session, path)
+    )""",
+    """CREATE TABLE IF NOT EXISTS jobs (
+        session TEXT NOT NULL DEFAULT '',
+        job_id TEXT NOT NULL,
+        state TEXT NOT NULL,
+        cancel_requested INTEGER NOT NULL DEFAULT 0,
+        finished_at DOUBLE PRECISION,
+        updated_at DOUBLE PRECISION NOT NULL,
+        PRIMARY KEY (session, job_id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS job_results (
+        session TEXT NOT NULL DEFAULT '',
+        job_id TEXT NOT NULL,
+        idx BIGINT NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (session, job_id, idx)
+    )""",
+    """CREATE TABLE IF NOT EXISTS uploads (
+        session TEXT NOT NULL DEFAULT '',
+        upload_id TEXT NOT NULL,
+        data TEXT NOT NULL,
+        ranges TEXT NOT NULL,
+        updated_at DOUBLE PRECISION NOT NULL,
+        PRIMARY KEY (session, upload_id)
+    )""",
+]
+# Stored in PRAGMA user_version of a local store once its tables exist
+SCHEMA_VERSION = 1
+# Tables keyed by session, in the order a session's rows are dropped
+SESSION_TABLES = ("uploads", "job_results", "jobs", "scan_snapshot", "image_blobs", "state", "sku_counts", "records")
+
+STATUS_BUCKETS = ("approved", "rejected", "pending")
+
+# session path -> lock held by this process's writers to that session's store
+_write_locks: Dict[str, threading.Lock] = {}
+_write_locks_guard = threading.Lock()
+
 def get_metadata_path(session_path: str) -> str:
+    """Legacy JSON metadata file, read only to migrate old sessions."""
     return os.path.join(session_path, METADATA_FILE)
 
-def load_metadata(session_path: str) -> List[Dict[str, Any]]:
-    """Load metadata from the session's JSON file."""
+def _session(session_path: str) -> str:
+    """Key of the session's rows in the store."""
+    return get_state().session_key(session_path)
+
+def sku_key(sku_id: Any) -> str:
+    """Normalized SKU used for lookups (stringified and stripped)."""
+    return str(sku_id).strip()
+
+def _text(value: Any) -> Optional[str]:
+    return value if isinstance(value, str) else None
+
+def _number(value: Any) -> Optional[int]:
+    """Whole number of a field: ints, and the leading number of strings like "300 DPI"."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value) if math.isfinite(value) else None
+    if isinstance(value, str):
+        head = value.split(" ", 1)[0]
+        return int(head) if head.isdigit() else None
+    return None
+
+def triage_mark(record: Dict[str, Any]) -> Optional[str]:
+    """Auto-triage outcome and reasons of a record as one value, e.g. "Auto-Rejected:dpi,watermark"."""
+    triage = record.get("triage")
+    if not isinstance(triage, str):
+        return None
+    return triage + ":" + ",".join(str(reason) for reason in record.get("triage_reasons") or ())
+
+def hash_bands(count: int) -> List[Tuple[int, int]]:
+    """(shift, width) of count near-equal bit ranges covering a 64-bit hash."""
+    bands = []
+    shift = 0
+    for i in range(count):
+        width = 64 // count + (1 if i < 64 % count else 0)
+        bands.append((shift, width))
+        shift += width
+    return bands
+
+_PHASH_BAND_LAYOUT = hash_bands(PHASH_BANDS)
+
+def _band_keys(phash: Optional[str]) -> Tuple[Optional[int], ...]:
+    """Values of the phash_band columns: each band's bits of the hash."""
+    try:
+        value = int(phash, 16) if phash else None
+    except ValueError:
+        value = None
+    if value is None:
+        return (None,) * PHASH_BANDS
+    return tuple((value >> shift) & ((1 << width) - 1) for shift, width in _PHASH_BAND_LAYOUT)
+
+def _columns(record: Dict[str, Any]) -> Tuple[Any, ...]:
+    """Values of RECORD_COLUMNS for a record, in that order."""
+    phash = _text(record.get("phash"))
+    return (
+        _text(record.get("image_name")),
+        sku_key(record.get("sku_id")),
+        phash,
+        _text(record.get("status")),
+        triage_mark(record),
+        _text(record.get("image_provided_by")),
+        _number(record.get("width")),
+        _number(record.get("height")),
+        _number(record.get("dpi")),
+        _text(record.get("format")),
+        _text(record.get("color_mode")),
+        _text(record.get("background")),
+        _text(record.get("watermark")),
+        *_band_keys(phash),
+    )
+
+# Selected with a record's JSON for _load_record. unmerged is 1 once a bulk
+# auto-triage write (write_triage) set the status and triage columns
+# without touching data; the next write of the record folds them in.
+_RECORD_DATA = "data, unmerged, status, triage"
+
+def _triage_fields(status: Optional[str], mark: Optional[str]) -> Dict[str, Any]:
+    """
+    Fields a write_triage write gives a record, from its status and triage
+    columns (None: removed). Like other status changes to Rejected or
+    Pending, it drops the display order.
+    """
+    triage, _, reasons = mark.partition(":") if mark else (None, "", "")
+    return {
+        "status": status, "display_order": None,
+        "triage": triage, "triage_reasons": (reasons.split(",") if reasons else []) if triage else None,
+    }
+
+def _load_record(data: str, unmerged: Any, status: Optional[str], mark: Optional[str]) -> Dict[str, Any]:
+    """A record from the _RECORD_DATA columns of its row."""
+    record = json.loads(data)
+    if unmerged:
+        for field, value in _triage_fields(status, mark).items():
+            if value is None:
+                record.pop(field, None)
+            else:
+                record[field] = value
+    return record
+
+def status_bucket(record: Dict[str, Any]) -> str:
+    """Progress bucket of a record: anything not approved/rejected counts as pending."""
+    status = str(record.get("status") or "Pending").lower()
+    return status if status in ("approved", "rejected") else "pending"
+
+def _count(conn: sqlite3.Connection, session: str, record_id: int, record: Dict[str, Any], delta: int):
+    """Add (delta=1) or remove (delta=-1) a record from its SKU's counters."""
+    key = sku_key(record.get("sku_id"))
+    bucket = status_bucket(record)
+    conn.execute(
+        "INSERT INTO sku_counts (session, sku_key, sku_id, first_id, total, " + bucket + ") VALUES (?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(session, sku_key) DO UPDATE SET total = sku_counts.total + excluded.total, "
+        + bucket + " = sku_counts." + bucket + " + excluded." + bucket + ", "
+        "first_id = " + get_state().least + "(sku_counts.first_id, excluded.first_id)",
+        (session, key, json.dumps(record.get("sku_id")), record_id, delta, delta)
+    )
+    if delta < 0:
+        conn.execute("DELETE FROM sku_counts WHERE session = ? AND sku_key = ? AND total <= 0", (session, key))
+
+def _insert_records(conn: sqlite3.Connection, session: str, data: Iterable[Dict[str, Any]]) -> int:
+    count = 0
+    for record in data:
+        record_id = conn.execute(
+            f"INSERT INTO records (session, {_COLUMN_LIST}, data) VALUES (?, {_COLUMN_PLACEHOLDERS}, ?) RETURNING id",
+            (session, *_columns(record), json.dumps(record))
+        ).fetchone()[0]
+        _count(conn, session, record_id, record, 1)
+        count += 1
+    return count
+
+def _bump_version(conn: sqlite3.Connection, session: str):
+    """
+    Advance the session's state version; called by every write that changes
+    records. It starts at the clock so a recreated session never reuses
+    versions (and ETags) handed out by a previous one.
+    """
+    conn.execute(
+        "INSERT INTO state (session, key, value) VALUES (?, 'version', ?) "
+        "ON CONFLICT(session, key) DO UPDATE SET value = state.value + 1",
+        (session, time.time_ns() // 1000)
+    )
+
+def _rebuild_sku_counts(conn: sqlite3.Connection, session: str):
+    conn.execute("DELETE FROM sku_counts WHERE session = ?", (session,))
+    for record_id, *row in conn.execute(
+        f"SELECT id, {_RECORD_DATA} FROM records WHERE session = ? ORDER BY id", (session,)
+    ).fetchall():
+        _count(conn, session, record_id, _load_record(*row), 1)
+
+def _create_schema(conn: sqlite3.Connection):
+    for statement in SCHEMA:
+        conn.execute(statement.format(serial=get_state().serial))
+
+def _setup_store(conn: sqlite3.Connection, session_path: str):
+    """Create the tables of a new local store."""
+    if conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION:
+        return
+    with _write(conn, session_path):
+        # Idempotent, so a request that set the store up first does no harm
+        _create_schema(conn)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+def _migrate_json(conn: sqlite3.Connection, session_path: str):
+    """One-time import of a session created before the SQLite store."""
     path = get_metadata_path(session_path)
-    if not os.path.exists(path):
+    with _write(conn, session_path):
+        # Re-check under the write lock in case another request migrated first
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    data = json.load(f)
+            except Exception:
+                data = []
+            session = _session(session_path)
+            _insert_records(conn, session, data)
+            _bump_version(conn, session)
+            os.replace(path, path + ".migrated")
+
+def _write_lock(session_path: str) -> threading.Lock:
+    key = os.path.abspath(session_path)
+    with _write_locks_guard:
+        lock = _write_locks.get(key)
+        if lock is None:
+            lock = _write_locks[key] = threading.Lock()
+        return lock
+
+@contextmanager
+def _write(conn: sqlite3.Connection, session_path: str):
+    """
+    Write transaction on a session's rows. Writers in this process queue on
+    a per-session lock, then the state backend takes the session's write
+    lock (across processes, and hosts for the shared backend) before
+    anything is read, so a read-modify-write cannot interleave with another
+    writer and lose its update. Commits on success and rolls everything
+    back on error.
+    """
+    with _write_lock(session_path):
+        with get_state().transaction(conn, session_path):
+            yield conn
+
+@contextmanager
+def open_store(session_path: str):
+    """Open the session's record store, creating it (and importing a metadata.json) on first use."""
+    state = get_state()
+    with state.connect(session_path) as conn:
+        if state.per_session:
+            _setup_store(conn, session_path)
+        else:
+            state.setup_once(_create_schema)
+        if os.path.exists(get_metadata_path(session_path)):
+            _migrate_json(conn, session_path)
+        yield conn
+
+def _has_store(session_path: str) -> bool:
+    return get_state().has_store(session_path) or os.path.exists(get_metadata_path(session_path))
+
+@timed_storage("load_metadata")
+def load_metadata(session_path: str) -> List[Dict[str, Any]]:
+    """Load all records of the session, in insertion order."""
+    if not _has_store(session_path):
         return []
     try:
-        with open(path, "r") as f:
-            return json.load(f)
+        with open_store(session_path) as conn:
+            return [
+                _load_record(*row)
+                for row in conn.execute(
+                    f"SELECT {_RECORD_DATA} FROM records WHERE session = ? ORDER BY id", (_session(session_path),)
+                )
+            ]
     except Exception:
         return []
 
-def save_metadata(session_path: str, data: List[Dict[str, Any]]):
-    """Save metadata to the session's JSON file."""
-    path = get_metadata_path(session_path)
-    with open(path, "w") as f:
-        json.dump(data, f, indent=2)
+def iter_records(session_path: str) -> Iterator[Dict[str, Any]]:
+    """Stream all records of the session, in insertion order, without loading them all."""
+    if not _has_store(session_path):
+        return
+    with open_store(session_path) as conn:
+        for row in get_state().stream(
+            conn, f"SELECT {_RECORD_DATA} FROM records WHERE session = ? ORDER BY id", (_session(session_path),)
+        ):
+            yield _load_record(*row)
+
+@timed_storage("save_metadata")
+def save_metadata(session_path: str, data: Iterable[Dict[str, Any]]) -> int:
+    """
+    Replace all records of the session in one transaction; returns how many
+    were written. data may be a generator, which is consumed row by row (if
+    it raises, the session is left unchanged).
+    """
+    session = _session(session_path)
+    with open_store(session_path) as conn:
+        with _write(conn, session_path):
+            conn.execute("DELETE FROM records WHERE session = ?", (session,))
+            conn.execute("DELETE FROM sku_counts WHERE session = ?", (session,))
+            count = _insert_records(conn, session, data)
+            _bump_version(conn, session)
+    return count
+
+@timed_storage("append_records")
+def append_records(session_path: str, data: List[Dict[str, Any]]):
+    """Add records after the existing ones in one transaction."""
+    if not data:
+        return
+    session = _session(session_path)
+    with open_store(session_path) as conn:
+        with _write(conn, session_path):
+            _insert_records(conn, session, data)
+            _bump_version(conn, session)
+
+def _update_row(conn: sqlite3.Connection, session: str, record_id: int, record: Dict[str, Any], updates: Dict[str, Any]):
+    _count(conn, session, record_id, record, -1)
+    record.update(updates)
+    _count(conn, session, record_id, record, 1)
+    conn.execute(
+        f"UPDATE records SET {_COLUMN_UPDATES}, data = ?, unmerged = 0 WHERE id = ?",
+        (*_columns(record), json.dumps(record), record_id)
+    )
+
+def _update_one(
+    conn: sqlite3.Connection, session: str, image_name: str, updates: Dict[str, Any],
+    expected: Optional[Dict[str, Any]] = None
+) -> bool:
+    # First record with this image_name, as before
+    row = conn.execute(
+        f"SELECT id, {_RECORD_DATA} FROM records WHERE session = ? AND image_name = ? ORDER BY id LIMIT 1",
+        (session, image_name)
+    ).fetchone()
+    if row is None:
+        return False
+    record = _load_record(*row[1:])
+    if expected and any(record.get(field) != value for field, value in expected.items()):
+        return False
+    _update_row(conn, session, row[0], record, updates)
+    return True
 
 def update_image_record(session_path: str, image_name: str, updates: Dict[str, Any]) -> bool:
     """Update a specific record by image_name."""
-    data = load_metadata(session_path)
-    updated = False
-    for record in data:
-        if record.get("image_name") == image_name: # Using image_name as key for now
-             # Or use a unique ID if generated
-             record.update(updates)
-             updated = True
-             break
-    
-    if updated:
-        save_metadata(session_path, data)
+    return update_image_records(session_path, [(image_name, updates)])[0]
+
+@timed_storage("update_image_records")
+def update_image_records(session_path: str, changes: List[Tuple[str, Dict[str, Any]]]) -> List[bool]:
+    """Apply (image_name, updates) pairs in one transaction; returns which ones matched."""
+    session = _session(session_path)
+    with open_store(session_path) as conn:
+        with _write(conn, session_path):
+            matched = [_update_one(conn, session, image_name, updates) for image_name, updates in changes]
+            if any(matched):
+                _bump_version(conn, session)
+            return matched
+
+@timed_storage("update_image_records_if")
+def update_image_records_if(session_path: str, changes: List[Tuple[str, Dict[str, Any], Dict[str, Any]]]) -> List[bool]:
+    """
+    Apply (image_name, expected, updates) triples in one transaction. A record
+    is only updated while its fields still have the expected values, so work
+    computed from an older state of the record is dropped; returns which
+    records were updated.
+    """
+    session = _session(session_path)
+    with open_store(session_path) as conn:
+        with _write(conn, session_path):
+            matched = [
+                _update_one(conn, session, image_name, updates, expected) for image_name, expected, updates in changes
+            ]
+            if any(matched):
+                _bump_version(conn, session)
+            return matched
+
+@timed_storage("apply_image_updates")
+def apply_image_updates(session_path: str, changes: List[Tuple[str, Dict[str, Any]]]) -> int:
+    """
+    Apply (image_name, updates) pairs all-or-nothing in one transaction. If
+    any image has no record, nothing is written and LookupError names the
+    missing ones. Returns how many updates were applied.
+    """
+    session = _session(session_path)
+    with open_store(session_path) as conn:
+        with _write(conn, session_path):
+            missing = [
+                image_name for image_name, updates in changes if not _update_one(conn, session, image_name, updates)
+            ]
+            if missing:
+                raise LookupError(", ".join(missing))
+            if changes:
+                _bump_version(conn, session)
+            return len(changes)
+
+# Record fields patch_records_if may set
+PATCH_FIELDS = ("status", "triage", "triage_reasons", "display_order", "notes")
+
+def _patch_columns(patch: Dict[str, Any]) -> Dict[str, Any]:
+    columns = {}
+    if "status" in patch:
+        columns["status"] = _text(patch["status"])
+    if "triage" in patch or "triage_reasons" in patch:
+        columns["triage"] = triage_mark(patch)
+    return columns
+
+@timed_storage("patch_records_if")
+def patch_records_if(session_path: str, changes: List[Tuple[int, Dict[str, Any], Dict[str, Any]]]) -> int:
+    """
+    Apply (record id, expected, patch) triples in one transaction, built for
+    large batches. expected maps RECORD_COLUMNS to the values a record must
+    still hold, else it is skipped; patch sets PATCH_FIELDS and is merged
+    into the stored JSON by the database, so no record is parsed here (a
+    field patched to None is removed). The SKU counters get one
+    summed adjustment per SKU. Returns how many records were updated.
+    """
+    session = _session(session_path)
+    state = get_state()
+    checked = {"sku_key", "status", "triage"}
+    for _, expected, patch in changes:
+        checked.update(expected)
+        if any(field not in PATCH_FIELDS for field in patch):
+            raise ValueError(f"Only {', '.join(PATCH_FIELDS)} can be patched")
+    if any(column not in RECORD_COLUMNS for column in checked):
+        raise ValueError(f"Not a record column: {', '.join(sorted(checked - set(RECORD_COLUMNS)))}")
+    checked = sorted(checked)
+    updated = 0
+    with open_store(session_path) as conn:
+        with _write(conn, session_path):
+            groups, deltas = {}, {}
+            for start in range(0, len(changes), 500):
+                batch = {record_id: (expected, patch) for record_id, expected, patch in changes[start:start + 500]}
+                placeholders = ",".join("?" * len(batch))
+                for record_id, unmerged, *values in conn.execute(
+                    f"SELECT id, unmerged, {', '.join(checked)} FROM records WHERE session = ? AND id IN ({placeholders})",
+                    [session, *batch]
+                ).fetchall():
+                    expected, patch = batch[record_id]
+                    current = dict(zip(checked, values))
+                    if any(current[column] != value for column, value in expected.items()):
+                        continue
+                    if unmerged:
+                        # The JSON lags a write_triage write; bring it along
+                        patch = {**_triage_fields(current["status"], current["triage"]), **patch}
+                    columns = _patch_columns(patch)
+                    bucket = status_bucket(current)
+                    if "status" in columns and status_bucket(columns) != bucket:
+                        counts = deltas.setdefault(current["sku_key"], dict.fromkeys(STATUS_BUCKETS, 0))
+                        counts[bucket] -= 1
+                        counts[status_bucket(columns)] += 1
+                    groups.setdefault(tuple(columns), []).append((*columns.values(), json.dumps(patch), record_id))
+            for columns, rows in groups.items():
+                conn.executemany(
+                    f"UPDATE records SET {''.join(column + ' = ?, ' for column in columns)}data = {state.json_patch}, "
+                    "unmerged = 0 WHERE id = ?",
+                    rows
+                )
+                updated += len(rows)
+            conn.executemany(
+                "UPDATE sku_counts SET approved = approved + ?, rejected = rejected + ?, pending = pending + ? "
+                "WHERE session = ? AND sku_key = ?",
+                [(*(counts[bucket] for bucket in STATUS_BUCKETS), session, key) for key, counts in deltas.items()]
+            )
+            if updated:
+                _bump_version(conn, session)
+    return updated
+
+@timed_storage("write_triage")
+def write_triage(session_path: str, changes: Iterable[Tuple[int, Optional[str], Optional[str], str, Optional[str]]]) -> int:
+    """
+    Apply (record id, expected status, expected mark, status, mark) rows of
+    an auto-triage run as one set-based write: the rows go into a temporary
+    table and a single UPDATE ... FROM sets the status and triage columns of
+    every record still holding the expected values (others were edited
+    meanwhile and are skipped). The record JSON is not rewritten; readers
+    apply the columns (_load_record) until the record's next write. The SKU
+    counters get one summed adjustment per SKU. Returns how many records
+    were updated.
+    """
+    session = _session(session_path)
+    state = get_state()
+    matches = (
+        f"records.id = t.id AND records.session = ? AND records.status {state.same} t.expected_status "
+        f"AND records.triage {state.same} t.expected_triage"
+    )
+    with open_store(session_path) as conn:
+        with _write(conn, session_path):
+            conn.execute("DROP TABLE IF EXISTS triage_writes")
+            conn.execute(
+                "CREATE TEMP TABLE triage_writes (id BIGINT, expected_status TEXT, expected_triage TEXT, "
+                "status TEXT, triage TEXT)"
+            )
+            conn.executemany("INSERT INTO triage_writes VALUES (?, ?, ?, ?, ?)", changes)
+            deltas, updated = {}, 0
+            for key, old, new, count in conn.execute(
+                "SELECT records.sku_key, records.status, t.status, COUNT(*) "
+                f"FROM triage_writes AS t CROSS JOIN records WHERE {matches} "
+                "GROUP BY records.sku_key, records.status, t.status",
+                (session,)
+            ).fetchall():
+                updated += count
+                old, new = status_bucket({"status": old}), status_bucket({"status": new})
+                if old != new:
+                    counts = deltas.setdefault(key, dict.fromkeys(STATUS_BUCKETS, 0))
+                    counts[old] -= count
+                    counts[new] += count
+            conn.execute(
+                "UPDATE records SET status = t.status, triage = t.triage, unmerged = 1 "
+                f"FROM triage_writes AS t WHERE {matches}",
+                (session,)
+            )
+            conn.execute("DROP TABLE triage_writes")
+            conn.executemany(
+                "UPDATE sku_counts SET approved = approved + ?, rejected = rejected + ?, pending = pending + ? "
+                "WHERE session = ? AND sku_key = ?",
+                [(*(counts[bucket] for bucket in STATUS_BUCKETS), session, key) for key, counts in deltas.items()]
+            )
+            if updated:
+                _bump_version(conn, session)
     return updated
+
+@timed_storage("update_sku_records")
+def update_sku_records(session_path: str, sku_id: Any, updates: Dict[str, Any]) -> int:
+    """Apply the same updates to every record of a SKU; returns how many changed."""
+    session = _session(session_path)
+    with open_store(session_path) as conn:
+        with _write(conn, session_path):
+            rows = conn.execute(
+                f"SELECT id, {_RECORD_DATA} FROM records WHERE session = ? AND sku_key = ? ORDER BY id",
+                (session, sku_key(sku_id))
+            ).fetchall()
+            for record_id, *row in rows:
+                _update_row(conn, session, record_id, _load_record(*row), updates)
+            if rows:
+                _bump_version(conn, session)
+            return len(rows)
+
+@timed_storage("get_state_version")
+def get_state_version(session_path: str) -> int:
+    """Monotonically increasing counter of record changes in the session."""
+    if not _has_store(session_path):
+        return 0
+    with open_store(session_path) as conn:
+        row = conn.execute(
+            "SELECT value FROM state WHERE session = ? AND key = 'version'", (_session(session_path),)
+        ).fetchone()
+    return row[0] if row else 0
+
+@timed_storage("load_sku_records")
+def load_sku_records(session_path: str, sku_id: Any) -> List[Dict[str, Any]]:
+    """Records of one SKU, via the sku index."""
+    if not _has_store(session_path):
+        return []
+    with open_store(session_path) as conn:
+        return [
+            _load_record(*row)
+            for row in conn.execute(
+                f"SELECT {_RECORD_DATA} FROM records WHERE session = ? AND sku_key = ? ORDER BY id",
+                (_session(session_path), sku_key(sku_id))
+            )
+        ]
+
+def _hash_scope(session_path: str, sku_id: Any) -> Tuple[str, List[Any]]:
+    """WHERE clause and parameters for the session's records, or one SKU's."""
+    where, params = "session = ?", [_session(session_path)]
+    if sku_id is not None:
+        where += " AND sku_key = ?"
+        params.append(sku_key(sku_id))
+    return where, params
+
+@timed_storage("count_unhashed")
+def count_unhashed(session_path: str, sku_id: Any = None) -> int:
+    """Records of the session (or one SKU) that have no perceptual hash yet."""
+    if not _has_store(session_path):
+        return 0
+    where, params = _hash_scope(session_path, sku_id)
+    with open_store(session_path) as conn:
+        return conn.execute(f"SELECT COUNT(*) - COUNT(phash) FROM records WHERE {where}", params).fetchone()[0]
+
+def _hashed_rows(session_path: str, columns: str, band: int, sku_id: Any) -> List[Tuple[Any, ...]]:
+    """
+    columns of the hashed records of the session or one SKU. Naming a band
+    column lets a whole-session read use that band's partial index alone;
+    one SKU is read through the SKU index instead.
+    """
+    if not _has_store(session_path):
+        return []
+    column = f"phash_band{int(band)}"
+    where, params = _hash_scope(session_path, sku_id)
+    if sku_id is None:
+        with open_store(session_path) as conn:
+            return conn.execute(f"SELECT {columns} FROM records WHERE {where} AND {column} IS NOT NULL", params).fetchall()
+    # A hash the bands could not be cut from has no band keys either
+    with open_store(session_path) as conn:
+        rows = conn.execute(f"SELECT {columns}, {column} FROM records WHERE {where} AND phash IS NOT NULL", params).fetchall()
+    return [row[:-1] for row in rows if row[-1] is not None]
+
+@timed_storage("load_hashes")
+def load_hashes(session_path: str, sku_id: Any = None) -> List[Tuple[int, str]]:
+    """(record id, perceptual hash) of the session's hashed records, or of one SKU's."""
+    return _hashed_rows(session_path, "id, phash", 0, sku_id)
+
+@timed_storage("load_hash_band")
+def load_hash_band(session_path: str, band: int, sku_id: Any = None) -> List[Tuple[int, int]]:
+    """(record id, band key) of the same records for one of the PHASH_BANDS, in no particular order."""
+    return _hashed_rows(session_path, f"id, phash_band{int(band)}", band, sku_id)
+
+@timed_storage("load_record_columns")
+def load_record_columns(session_path: str, columns: Iterable[str], undecided: bool = False) -> List[Tuple[Any, ...]]:
+    """
+    (record id, *columns) of the session's records in insertion order, read
+    from RECORD_COLUMNS without parsing the records. With undecided=True
+    only records nobody has approved or rejected by hand: those still
+    pending, and those marked by auto-triage. Missing records (Excel rows
+    without an image) are left out, as there is nothing to check yet.
+    """
+    columns = list(columns)
+    unknown = [column for column in columns if column not in RECORD_COLUMNS]
+    if unknown:
+        raise ValueError(f"Not a record column: {', '.join(unknown)}")
+    if not _has_store(session_path):
+        return []
+    where = "session = ?"
+    if undecided:
+        where += " AND (status IS NULL OR lower(status) NOT IN ('approved', 'rejected', 'missing') OR triage IS NOT NULL)"
+    with open_store(session_path) as conn:
+        return conn.execute(
+            f"SELECT {', '.join(['id', *columns])} FROM records WHERE {where} ORDER BY id", (_session(session_path),)
+        ).fetchall()
+
+@timed_storage("load_records_by_id")
+def load_records_by_id(session_path: str, record_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    """Records with the given ids, keyed by id."""
+    record_ids = list(record_ids)
+    session = _session(session_path)
+    records = {}
+    with open_store(session_path) as conn:
+        # Batched to stay under SQLite's bound-parameter limit
+        for start in range(0, len(record_ids), 500):
+            batch = record_ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            for record_id, *row in conn.execute(
+                f"SELECT id, {_RECORD_DATA} FROM records WHERE session = ? AND id IN ({placeholders})", [session, *batch]
+            ):
+                records[record_id] = _load_record(*row)
+    return records
+
+# ?status= filters of the SKU listing: SKUs with any image in that bucket, or none pending
+SKU_STATUS_FILTERS = {
+    "approved": "approved > 0", "rejected": "rejected > 0", "pending": "pending > 0", "complete": "pending = 0",
+}
+
+@timed_storage("load_sku_counts")
+def load_sku_counts(
+    session_path: str, after: Optional[int] = None, limit: Optional[int] = None, status: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Per-SKU progress counters, in order of each SKU's first record. A page
+    starts after the SKU whose first record id is `after` and holds at most
+    `limit` SKUs, optionally only those matching a SKU_STATUS_FILTERS entry.
+    Each entry carries its first record id as "first_id" (the page cursor).
+    """
+    if not _has_store(session_path):
+        return []
+    conditions, params = ["session = ?"], [_session(session_path)]
+    if after is not None:
+        conditions.append("first_id > ?")
+        params.append(after)
+    if status is not None:
+        conditions.append(SKU_STATUS_FILTERS[status])
+    where = " WHERE " + " AND ".join(conditions)
+    if limit is not None:
+        where += " ORDER BY first_id LIMIT ?"
+        params.append(limit)
+    else:
+        where += " ORDER BY first_id"
+    with open_store(session_path) as conn:
+        rows = conn.execute(
+            "SELECT sku_id, first_id, total, approved, rejected, pending FROM sku_counts" + where, params
+        ).fetchall()
+    return [
+        {
+            "sku_id": json.loads(sku), "first_id": first_id,
+            "total": total, "approved": approved, "rejected": rejected, "pending": pending,
+        }
+        for sku, first_id, total, approved, rejected, pending in rows
+    ]
+
+@timed_storage("check_sku_index")
+def check_sku_index(session_path: str, repair: bool = False) -> Dict[str, Any]:
+    """
+    Recompute the SKU counters from the records and compare them with the
+    maintained ones. With repair=True the counters are rebuilt from scratch.
+    """
+    session = _session(session_path)
+    with open_store(session_path) as conn:
+        expected = {}
+        for row in conn.execute(f"SELECT {_RECORD_DATA} FROM records WHERE session = ?", (session,)):
+            record = _load_record(*row)
+            counts = expected.setdefault(sku_key(record.get("sku_id")), dict.fromkeys(("total",) + STATUS_BUCKETS, 0))
+            counts["total"] += 1
+            counts[status_bucket(record)] += 1
+
+        actual = {
+            key: dict(zip(("total",) + STATUS_BUCKETS, counts))
+            for key, *counts in conn.execute(
+                "SELECT sku_key, total, approved, rejected, pending FROM sku_counts WHERE session = ?", (session,)
+            )
+        }
+        mismatches = sorted(key for key in expected.keys() | actual.keys() if expected.get(key) != actual.get(key))
+
+        if repair and mismatches:
+            # End the read transaction PostgreSQL keeps open before taking the write lock
+            conn.rollback()
+            with _write(conn, session_path):
+                _rebuild_sku_counts(conn, session)
+
+    return {"consistent": not mismatches, "mismatches": mismatches, "repaired": bool(repair and mismatches)}
+
+@timed_storage("link_image_blobs")
+def link_image_blobs(session_path: str, links: List[Tuple[str, str]]) -> List[Optional[str]]:
+    """
+    Record which blob (content digest) each uploaded image name points at.
+    Returns the digest each name pointed at before, or None.
+    """
+    session = _session(session_path)
+    with open_store(session_path) as conn:
+        with _write(conn, session_path):
+            previous = []
+            for image_name, digest in links:
+                row = conn.execute(
+                    "SELECT digest FROM image_blobs WHERE session = ? AND image_name = ?", (session, image_name)
+                ).fetchone()
+                previous.append(row[0] if row else None)
+                conn.execute(
+                    "INSERT INTO image_blobs (session, image_name, digest) VALUES (?, ?, ?) "
+                    "ON CONFLICT(session, image_name) DO UPDATE SET digest = excluded.digest",
+                    (session, image_name, digest)
+                )
+            return previous
+
+@timed_storage("load_image_blobs")
+def load_image_blobs(session_path: str) -> Dict[str, str]:
+    """image name -> blob digest of the session's uploaded images."""
+    if not _has_store(session_path):
+        return {}
+    with open_store(session_path) as conn:
+        return dict(conn.execute(
+            "SELECT image_name, digest FROM image_blobs WHERE session = ?", (_session(session_path),)
+        ).fetchall())
+
+@timed_storage("load_scan_snapshot")
+def load_scan_snapshot(session_path: str) -> Dict[str, Tuple[int, int, str]]:
+    """
+    path -> (size, mtime_ns, analysis profile) of the files processed by the
+    last local-path scan.
+    """
+    if not _has_store(session_path):
+        return {}
+    with open_store(session_path) as conn:
+        return {
+            path: (size, mtime_ns, profile)
+            for path, size, mtime_ns, profile in conn.execute(
+                "SELECT path, size, mtime_ns, profile FROM scan_snapshot WHERE session = ?", (_session(session_path),)
+            )
+        }
+
+@timed_storage("save_scan_snapshot")
+def save_scan_snapshot(session_path: str, files: Dict[str, Tuple[int, int]], profile: str):
+    """Replace the local-path scan snapshot with files (path -> (size, mtime_ns)) analyzed under profile."""
+    session = _session(session_path)
+    with open_store(session_path) as conn:
+        with _write(conn, session_path):
+            conn.execute("DELETE FROM scan_snapshot WHERE session = ?", (session,))
+            conn.executemany(
+                "INSERT INTO scan_snapshot (session, path, size, mtime_ns, profile) VALUES (?, ?, ?, ?, ?)",
+                ((session, path, size, mtime_ns, profile) for path, (size, mtime_ns) in files.items())
+            )
+
+@timed_storage("save_job")
+def save_job(
+    session_path: str, job_id: str, state: Dict[str, Any], results_from: int, results: List[Dict[str, Any]],
+    finished_at: Optional[float] = None, prune_before: Optional[float] = None
+) -> bool:
+    """
+    Publish a background job's progress so workers in other processes can
+    serve it: its state and its results from index results_from on. Jobs of
+    the session that finished before prune_before are dropped. Returns
+    whether cancellation of the job was requested through the store.
+    """
+    session = _session(session_path)
+    with open_store(session_path) as conn:
+        with _write(conn, session_path):
+            if prune_before is not None:
+                conn.execute(
+                    "DELETE FROM job_results WHERE session = ? AND job_id IN "
+                    "(SELECT job_id FROM jobs WHERE session = ? AND finished_at < ?)",
+                    (session, session, prune_before)
+                )
+                conn.execute("DELETE FROM jobs WHERE session = ? AND finished_at < ?", (session, prune_before))
+            row = conn.execute(
+                "INSERT INTO jobs (session, job_id, state, finished_at, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(session, job_id) DO UPDATE SET state = excluded.state, "
+                "finished_at = excluded.finished_at, updated_at = excluded.updated_at RETURNING cancel_requested",
+                (session, job_id, json.dumps(state), finished_at, time.time())
+            ).fetchone()
+            conn.executemany(
+                "INSERT INTO job_results (session, job_id, idx, data) VALUES (?, ?, ?, ?) ON CONFLICT DO NOTHING",
+                [(session, job_id, results_from + i, json.dumps(result)) for i, result in enumerate(results)]
+            )
+            return bool(row[0])
+
+@timed_storage("load_job")
+def load_job(session_path: str, job_id: str, since: Optional[int] = 0) -> Optional[Dict[str, Any]]:
+    """
+    Last published state of a job with its results from index `since` on
+    (none if since is None), plus "cancel_requested" and "updated_at"; None
+    if it was never published.
+    """
+    if not _has_store(session_path):
+        return None
+    session = _session(session_path)
+    with open_store(session_path) as conn:
+        row = conn.execute(
+            "SELECT state, cancel_requested, updated_at FROM jobs WHERE session = ? AND job_id = ?", (session, job_id)
+        ).fetchone()
+        if row is None:
+            return None
+        job = json.loads(row[0])
+        job.update(cancel_requested=bool(row[1]), updated_at=row[2])
+        if since is not None:
+            job["results_since"] = since
+            job["results"] = [
+                json.loads(data)
+                for data, in conn.execute(
+                    "SELECT data FROM job_results WHERE session = ? AND job_id = ? AND idx >= ? ORDER BY idx",
+                    (session, job_id, since)
+                )
+            ]
+    return job
+
+@timed_storage("request_job_cancel")
+def request_job_cancel(session_path: str, job_id: str) -> bool:
+    """Flag an unfinished job for cancellation; its worker sees the flag on its next publish."""
+    session = _session(session_path)
+    with open_store(session_path) as conn:
+        with _write(conn, session_path):
+            row = conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE session = ? AND job_id = ? AND finished_at IS NULL "
+                "RETURNING job_id",
+                (session, job_id)
+            ).fetchone()
+            return row is not None
+
+@timed_storage("has_running_job")
+def has_running_job(session_path: str, updated_after: float) -> bool:
+    """Whether an unfinished job of the session (in any process) published progress after updated_after."""
+    if not _has_store(session_path):
+        return False
+    with open_store(session_path) as conn:
+        row = conn.execute(
+            "SELECT 1 FROM jobs WHERE session = ? AND finished_at IS NULL AND updated_at > ? LIMIT 1",
+            (_session(session_path), updated_after)
+        ).fetchone()
+    return row is not None
+
+def _merge_ranges(ranges: List[List[int]]) -> List[List[int]]:
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+@timed_storage("create_upload")
+def create_upload(session_path: str, upload_id: str, upload: Dict[str, Any]):
+    """Register a resumable upload with nothing received yet."""
+    session = _session(session_path)
+    with open_store(session_path) as conn:
+        with _write(conn, session_path):
+            conn.execute(
+                "INSERT INTO uploads (session, upload_id, data, ranges, updated_at) VALUES (?, ?, ?, '[]', ?)",
+                (session, upload_id, json.dumps(upload), time.time())
+            )
+
+@timed_storage("load_upload")
+def load_upload(session_path: str, upload_id: str) -> Optional[Dict[str, Any]]:
+    """A resumable upload with the byte ranges received so far ([[start, end), ...]), or None."""
+    if not _has_store(session_path):
+        return None
+    with open_store(session_path) as conn:
+        row = conn.execute(
+            "SELECT data, ranges FROM uploads WHERE session = ? AND upload_id = ?", (_session(session_path), upload_id)
+        ).fetchone()
+    return {**json.loads(row[0]), "ranges": json.loads(row[1])} if row else None
+
+@timed_storage("add_upload_range")
+def add_upload_range(session_path: str, upload_id: str, start: int, end: int) -> Optional[List[List[int]]]:
+    """Record bytes [start, end) of an upload as received; returns all ranges received, or None if it is gone."""
+    session = _session(session_path)
+    with open_store(session_path) as conn:
+        with _write(conn, session_path):
+            row = conn.execute(
+                "SELECT ranges FROM uploads WHERE session = ? AND upload_id = ?", (session, upload_id)
+            ).fetchone()
+            if row is None:
+                return None
+            ranges = _merge_ranges(json.loads(row[0]) + [[start, end]])
+            conn.execute(
+                "UPDATE uploads SET ranges = ?, updated_at = ? WHERE session = ? AND upload_id = ?",
+                (json.dumps(ranges), time.time(), session, upload_id)
+            )
+            return ranges
+
+@timed_storage("take_upload")
+def take_upload(session_path: str, upload_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Remove an upload and return it as load_upload would, or None if it is
+    unknown. Only one of several concurrent callers gets it.
+    """
+    if not _has_store(session_path):
+        return None
+    with open_store(session_path) as conn:
+        with _write(conn, session_path):
+            row = conn.execute(
+                "DELETE FROM uploads WHERE session = ? AND upload_id = ? RETURNING data, ranges",
+                (_session(session_path), upload_id)
+            ).fetchone()
+    return {**json.loads(row[0]), "ranges": json.loads(row[1])} if row else None
+
+def drop_session_state(session_path: str):
+    """
+    Delete a session's rows. A local store goes with the session directory;
+    the shared database keeps them until this is called.
+    """
+    if get_state().per_session:
+        return
+    session = _session(session_path)
+    with open_store(session_path) as conn:
+        with _write(conn, session_path):
+            for table in SESSION_TABLES:
+                conn.execute(f"DELETE FROM {table} WHERE session = ?", (session,))
@@ -0,0 +1,203 @@
+import os
+import hashlib
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional
+from PIL import Image, ImageOps
+from services.session import SESSIONS_ROOT
+from services.extraction import EXTRACT_CHUNK_SIZE, new_process_pool
+
+# Long-side pixel size of each derivative
+DERIVATIVE_SIZES = {"thumb": 400, "preview": 1600}
+# format name -> (Pillow format, file extension, media type)
+DERIVATIVE_FORMATS = {
+    "webp": ("WEBP", "webp", "image/webp"),
+    "jpeg": ("JPEG", "jpg", "image/jpeg"),
+}
+DERIVATIVE_QUALITY = 82
+
+# Shared by all sessions; keyed on the source file's inode, size and mtime
+DERIVATIVES_DIR = os.environ.get("DERIVATIVES_DIR", "derivatives")
+DERIVATIVES_MAX_BYTES = int(os.environ.get("DERIVATIVES_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+# Sizes generated ahead of time after uploads and local-path scans ("" disables)
+DERIVATIVES_PREGENERATE = [s for s in os.environ.get("DERIVATIVES_PREGENERATE", "thumb,preview").split(",") if s]
+# Worker processes for pregeneration, kept apart from the extraction pool
+# and run at a lower CPU priority (0 = in the background task's thread)
+DERIVATIVE_WORKERS = int(os.environ.get("DERIVATIVE_WORKERS", "1"))
+# On-demand generations between two eviction passes
+PRUNE_EVERY = 200
+
+_generated = 0
+_generated_lock = threading.Lock()
+_pool = None
+_pool_lock = threading.Lock()
+
+def _lower_priority():
+    """Pool initializer: let extraction and request handling win the CPU."""
+    if hasattr(os, "nice"):
+        os.nice(10)
+
+def get_derivative_pool():
+    """Return the pregeneration pool, starting it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = new_process_pool(DERIVATIVE_WORKERS, initializer=_lower_priority)
+        return _pool
+
+def shutdown_derivative_pool():
+    """Stop the pregeneration pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+def resolve_image_path(path: str) -> str:
+    """
+    Filesystem path of an image referenced by a record: session uploads are
+    stored as /sessions/<user>/images/<name> URLs, local-path images as
+    absolute paths.
+    """
+    if path.startswith("/sessions/"):
+        root = os.path.realpath(SESSIONS_ROOT)
+        resolved = os.path.realpath(os.path.join(root, path[len("/sessions/"):]))
+        if not resolved.startswith(root + os.sep):
+            raise ValueError("Invalid session image path")
+        return resolved
+    return path
+
+def derivative_path(src_path: str, size: str, fmt: str) -> Optional[str]:
+    """Cache location of a derivative, or None if the source does not exist."""
+    try:
+        st = os.stat(src_path)
+    except OSError:
+        return None
+    # Keyed on the file itself rather than its name, so the hard-linked copies
+    # of one uploaded blob share their derivatives
+    key = f"{st.st_dev}:{st.st_ino}|{st.st_size}|{st.st_mtime_ns}|{size}|{fmt}"
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return os.path.join(DERIVATIVES_DIR, digest[:2], f"{digest}.{DERIVATIVE_FORMATS[fmt][1]}")
+
+def _render(src_path: str, out_path: str, size: str, fmt: str):
+    pil_format = DERIVATIVE_FORMATS[fmt][0]
+    max_side = DERIVATIVE_SIZES[size]
+    with Image.open(src_path) as img:
+        # Decode JPEGs at a reduced DCT scale when the target is much smaller
+        img.draft("RGB", (max_side, max_side))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_side, max_side))
+
+        has_alpha = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+        if has_alpha and pil_format == "WEBP":
+            img = img.convert("RGBA")
+        elif has_alpha:
+            rgba = img.convert("RGBA")
+            img = Image.new("RGB", rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel("A"))
+        else:
+            img = img.convert("RGB")
+
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        temp_path = f"{out_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            img.save(temp_path, pil_format, quality=DERIVATIVE_QUALITY)
+            os.replace(temp_path, out_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+def get_derivative(src_path: str, size: str = "thumb", fmt: str = "webp") -> Optional[str]:
+    """
+    Path of a cached derivative of src_path, generating it if needed.
+    Returns None when the source file does not exist.
+    """
+    global _generated
+    out_path = derivative_path(src_path, size, fmt)
+    if out_path is None:
+        return None
+    if os.path.exists(out_path):
+        # mtime doubles as last-access time for LRU eviction
+        try:
+            os.utime(out_path)
+        except OSError:
+            pass
+        return out_path
+
+    _render(src_path, out_path, size, fmt)
+    with _generated_lock:
+        _generated += 1
+        prune = _generated % PRUNE_EVERY == 0
+    if prune:
+        prune_derivatives()
+    return out_path
+
+def _generate_defaults(paths: List[str]):
+    for path in paths:
+        for size in DERIVATIVE_SIZES:
+            if size in DERIVATIVES_PREGENERATE:
+                try:
+                    get_derivative(path, size, "webp")
+                except Exception as e:
+                    print(f"Derivative generation failed for {path}: {e}")
+
+def pregenerate_derivatives(paths: List[str]):
+    """
+    Generate the DERIVATIVES_PREGENERATE sizes for freshly processed images,
+    on the derivative pool when it is enabled, then enforce the size budget.
+    Meant to run as a background task.
+    """
+    if not DERIVATIVES_PREGENERATE or not paths:
+        return
+    if DERIVATIVE_WORKERS <= 0:
+        _generate_defaults(paths)
+    else:
+        executor = get_derivative_pool()
+        chunks = [paths[i:i + EXTRACT_CHUNK_SIZE] for i in range(0, len(paths), EXTRACT_CHUNK_SIZE)]
+        broken = False
+        try:
+            futures = [executor.submit(_generate_defaults, chunk) for chunk in chunks]
+        except BrokenProcessPool as e:
+            print(f"Derivative worker failed: {e}")
+            futures, broken = [], True
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Derivative worker failed: {e}")
+                broken = broken or isinstance(e, BrokenProcessPool)
+        if broken:
+            # A crashed worker poisons the pool; start a fresh one next time
+            shutdown_derivative_pool()
+    prune_derivatives()
+
+def prune_derivatives(max_bytes: int = None):
+    """Delete least recently used derivatives until the cache is within max_bytes."""
+    max_bytes = DERIVATIVES_MAX_BYTES if max_bytes is None else max_bytes
+    if not os.path.isdir(DERIVATIVES_DIR):
+        return
+    entries = []
+    total = 0
+    for shard in os.scandir(DERIVATIVES_DIR):
+        if not shard.is_dir():
+            continue
+        for entry in os.scandir(shard.path):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+    if total <= max_bytes:
+        return
+
+    entries.sort()
+    target = int(max_bytes * 0.9)
+    for _, size, path in entries:
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
@@ -0,0 +1,196 @@
+from typing import Any, Dict, List, Tuple
+import numpy as np
+from services.data import PHASH_BANDS, count_unhashed, hash_bands, load_hash_band, load_hashes, load_records_by_id
+
+# Largest Hamming distance (of 64 bits) at which two images count as copies
+DUPLICATE_MAX_DISTANCE = 4
+# Upper bound accepted from callers; the index slows down as the bands narrow
+DUPLICATE_DISTANCE_LIMIT = 10
+# Pairs compared at once inside one bucket, to bound memory on skewed buckets
+PAIR_BLOCK = 1 << 22
+# Buckets up to this size are searched together, vectorized across buckets
+SMALL_BUCKET = 256
+
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:
+    _BYTE_BITS = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(values):
+        return _BYTE_BITS[values.view(np.uint8).reshape(*values.shape, 8)].sum(axis=-1)
+
+def hash_array(phashes: List[str]) -> np.ndarray:
+    return np.array([int(phash, 16) for phash in phashes], dtype=np.uint64)
+
+def hash_distance(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+def _run_pairs(keys: np.ndarray, positions: np.ndarray, hashes: np.ndarray, max_distance: int) -> List[np.ndarray]:
+    """
+    Pairs of positions (into hashes) within max_distance bits that share a
+    key; keys is sorted and positions follows it, so each bucket is a run.
+    Runs up to SMALL_BUCKET long are compared all at once, each hash with
+    the one 1, 2, ... places after it; longer runs one by one in blocks.
+    """
+    found = []
+    if len(keys) < 2:
+        return found
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    sizes = np.diff(np.append(starts, len(keys)))
+    long_runs = sizes > SMALL_BUCKET
+    in_long_run = np.repeat(long_runs, sizes)
+    values = hashes[positions]
+    for offset in range(1, int(sizes[~long_runs].max(initial=1))):
+        close = (keys[offset:] == keys[:-offset]) & ~in_long_run[offset:]
+        close &= _popcount(values[offset:] ^ values[:-offset]) <= max_distance
+        i = np.flatnonzero(close)
+        if len(i):
+            found.append(np.stack([positions[i], positions[i + offset]], axis=1))
+    for start, size in zip(starts[long_runs].tolist(), sizes[long_runs].tolist()):
+        found.extend(_bucket_pairs(hashes, positions[start:start + size], max_distance))
+    return found
+
+def _unique_pairs(found: List[np.ndarray]) -> np.ndarray:
+    if not found:
+        return np.empty((0, 2), dtype=np.int64)
+    # A pair agreeing on several bands is found once per band
+    return np.unique(np.sort(np.concatenate(found), axis=1), axis=0)
+
+def close_pairs(hashes: np.ndarray, max_distance: int) -> np.ndarray:
+    """
+    All index pairs (i < j) of distinct hashes within max_distance bits, via
+    multi-index hashing: hashes are split into max_distance + 1 bands, and
+    two hashes that close must agree exactly on at least one band
+    (pigeonhole). Only hashes sharing a band value are compared, so the work
+    follows the bucket sizes instead of N squared.
+    """
+    found = []
+    for shift, width in hash_bands(max_distance + 1):
+        keys = (hashes >> np.uint64(shift)) & np.uint64((1 << width) - 1)
+        order = np.argsort(keys, kind="stable")
+        found.extend(_run_pairs(keys[order], order, hashes, max_distance))
+    return _unique_pairs(found)
+
+def stored_close_pairs(
+    session_path: str, sku_id: Any, copies: Dict[str, List[int]], hashes: np.ndarray, max_distance: int
+) -> np.ndarray:
+    """
+    close_pairs over hashes (the distinct hashes of copies, which maps each
+    to its record ids), with the band keys read from the store's columns
+    instead of cut here. Needs max_distance < PHASH_BANDS, so that hashes
+    that close still agree on one band.
+    """
+    record_ids = np.array([record_id for ids in copies.values() for record_id in ids], dtype=np.int64)
+    owners = np.repeat(np.arange(len(copies)), [len(ids) for ids in copies.values()])
+    order = np.argsort(record_ids)
+    record_ids, owners = record_ids[order], owners[order]
+    found = []
+    for band in range(PHASH_BANDS):
+        rows = np.array(load_hash_band(session_path, band, sku_id), dtype=np.int64).reshape(-1, 2)
+        # Records hashed since the hashes were read are left out; a hash
+        # without a key here sits in a bucket of its own
+        at = np.minimum(np.searchsorted(record_ids, rows[:, 0]), max(len(record_ids) - 1, 0))
+        known = record_ids[at] == rows[:, 0] if len(record_ids) else np.zeros(len(rows), dtype=bool)
+        keys = -1 - np.arange(len(hashes), dtype=np.int64)
+        keys[owners[at[known]]] = rows[known, 1]
+        order = np.argsort(keys, kind="stable")
+        found.extend(_run_pairs(keys[order], order, hashes, max_distance))
+    return _unique_pairs(found)
+
+def _bucket_pairs(hashes: np.ndarray, bucket: np.ndarray, max_distance: int) -> List[np.ndarray]:
+    values = hashes[bucket]
+    rows = max(1, PAIR_BLOCK // len(bucket))
+    out = []
+    for start in range(0, len(bucket), rows):
+        block = values[start:start + rows]
+        distances = _popcount(block[:, None] ^ values[None, :])
+        i, j = np.nonzero(distances <= max_distance)
+        i += start
+        upper = i < j
+        if upper.any():
+            out.append(np.stack([bucket[i[upper]], bucket[j[upper]]], axis=1))
+    return out
+
+def _clusters(pairs: np.ndarray) -> List[List[int]]:
+    """
+    Star clusters of the close-pair graph: the hash with the most neighbours
+    claims all its unclaimed neighbours, then the next one, and so on. Every
+    member is within the pair distance of its cluster's center (listed
+    first), so chains of small differences do not merge distinct images the
+    way connected components would.
+    """
+    neighbours: Dict[int, List[int]] = {}
+    for i, j in pairs.tolist():
+        neighbours.setdefault(i, []).append(j)
+        neighbours.setdefault(j, []).append(i)
+    claimed = set()
+    clusters = []
+    for center in sorted(neighbours, key=lambda value: (-len(neighbours[value]), value)):
+        if center in claimed:
+            continue
+        members = [center] + [value for value in neighbours[center] if value not in claimed]
+        if len(members) > 1:
+            claimed.update(members)
+            clusters.append(members)
+    return clusters
+
+def _pixels(record: Dict[str, Any]) -> int:
+    width, height = record.get("width"), record.get("height")
+    return width * height if isinstance(width, int) and isinstance(height, int) else 0
+
+def find_duplicates(session_path: str, sku_id: Any = None, max_distance: int = DUPLICATE_MAX_DISTANCE) -> Dict[str, Any]:
+    """
+    Clusters of near-duplicate images in a session (or one SKU), by
+    perceptual hash. Each cluster names the copy to keep (the largest, then
+    the first listed) and lists every member with its distance to the
+    cluster's center, the hash it was matched against (so never above
+    max_distance). Largest clusters come first.
+    """
+    # Identical hashes are compared once; each value stands for all its copies
+    copies: Dict[str, List[int]] = {}
+    for record_id, phash in load_hashes(session_path, sku_id):
+        copies.setdefault(phash, []).append(record_id)
+    names = list(copies)
+    hashes = hash_array(names)
+    # Distances below PHASH_BANDS are searched through the band columns of the
+    # store, larger ones cut the hashes into more, narrower bands here
+    if max_distance < PHASH_BANDS:
+        pairs = stored_close_pairs(session_path, sku_id, copies, hashes, max_distance)
+    else:
+        pairs = close_pairs(hashes, max_distance)
+    components = [[names[value] for value in component] for component in _clusters(pairs)]
+    paired = {phash for component in components for phash in component}
+    components += [[phash] for phash, record_ids in copies.items() if len(record_ids) > 1 and phash not in paired]
+    records = load_records_by_id(
+        session_path, (record_id for component in components for phash in component for record_id in copies[phash])
+    )
+
+    clusters = []
+    for component in components:
+        center = component[0]
+        members = sorted((record_id, phash) for phash in component for record_id in copies[phash])
+        keep = max((records[record_id] for record_id, _ in members), key=_pixels)
+        clusters.append({
+            "keep": keep.get("image_name"),
+            "images": [
+                {
+                    "image_name": record.get("image_name"),
+                    "sku_id": record.get("sku_id"),
+                    "status": record.get("status"),
+                    "resolution": record.get("resolution"),
+                    "size": record.get("size"),
+                    "format": record.get("format"),
+                    "image_path": record.get("image_path"),
+                    "distance": hash_distance(center, phash),
+                }
+                for record, phash in ((records[record_id], phash) for record_id, phash in members)
+            ],
+        })
+    clusters.sort(key=lambda cluster: -len(cluster["images"]))
+    return {
+        "max_distance": max_distance,
+        "hashed": sum(len(record_ids) for record_ids in copies.values()),
+        "unhashed": count_unhashed(session_path, sku_id),
+        "duplicates": sum(len(cluster["images"]) - 1 for cluster in clusters),
+        "clusters": clusters,
+    }
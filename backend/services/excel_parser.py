@@ -1,60 +1,123 @@
 import pandas as pd
-from typing import List, Dict, Any
-
-def normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
-    """Normalize column names to match expected format."""
-    column_map = {
-        "sku id": "sku_id",
-        "sku": "sku_id",
-        "image name": "image_name",
-        "file name": "image_name",
-        "image path and name": "full_path",
-        "image provided": "image_provided_by",
-        "image provided by": "image_provided_by",
-        "provider": "image_provided_by"
-    }
-    
-    new_cols = {}
-    for col in df.columns:
-        norm_col = str(col).lower().strip()
-        if norm_col in column_map:
-            new_cols[col] = column_map[norm_col]
-        else:
-            # Keep original name but slugified
-            new_cols[col] = norm_col.replace(" ", "_")
-            
-    return df.rename(columns=new_cols)
+import datetime
+from typing import List, Dict, Any, Iterator, Optional
+
+# Header (lower-cased, stripped) -> record field; other columns are not read
+COLUMN_MAP = {
+    "sku id": "sku_id",
+    "sku": "sku_id",
+    "image name": "image_name",
+    "file name": "image_name",
+    "image path and name": "full_path",
+    "image provided": "image_provided_by",
+    "image provided by": "image_provided_by",
+    "provider": "image_provided_by",
+    "display order": "display_order",
+    "notes": "notes"
+}
+
+# Rows per pandas chunk when reading CSV
+CSV_CHUNK_SIZE = 10000
+
+def project_columns(headers: List[Any]) -> Dict[int, str]:
+    """
+    Column index -> record field for the headers COLUMN_MAP knows. When two
+    headers map to the same field the first one is used.
+    """
+    projection = {}
+    for index, header in enumerate(headers):
+        field = COLUMN_MAP.get(str(header).lower().strip()) if header is not None else None
+        if field and field not in projection.values():
+            projection[index] = field
+    # Ensure core columns exist - either image_name OR full_path
+    fields = set(projection.values())
+    if "image_name" not in fields and "full_path" not in fields:
+        raise ValueError("Excel must contain either 'Image Name' or 'Image Path and Name' column.")
+    if "sku_id" not in fields:
+        raise ValueError("Excel must contain 'Sku ID' column.")
+    return projection
+
+def _basename(path_str: Any) -> Optional[str]:
+    if path_str is None: return None
+    s = str(path_str)
+    # Handle both / and \
+    return s.replace('\\', '/').split('/')[-1]
+
+def _cell(value: Any) -> Any:
+    """
+    Cell value as stored in a record: blanks become None, dates ISO strings.
+    Whole floats become ints, as Excel itself stores them, so a CSV column
+    with blanks (read by pandas as float) gives SKU 123 rather than 123.0.
+    """
+    if value is None:
+        return None
+    if isinstance(value, float):
+        if value != value:
+            return None
+        if value.is_integer():
+            return int(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+def _records(rows: Iterator[tuple], projection: Dict[int, str]) -> Iterator[Dict[str, Any]]:
+    derive_name = "image_name" not in projection.values()
+    for row in rows:
+        record = {field: _cell(row[index]) if index < len(row) else None for index, field in projection.items()}
+        if all(value is None for value in record.values()):
+            continue  # blank line
+        if derive_name:
+            # If image_name is missing but full_path is present, extract it
+            record["image_name"] = _basename(record.get("full_path"))
+        yield record
+
+def _iter_xlsx(file_path: str) -> Iterator[Dict[str, Any]]:
+    from openpyxl import load_workbook
+    # read_only streams rows from the sheet XML instead of building the workbook
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        projection = project_columns(list(next(rows, ())))
+        yield from _records(rows, projection)
+    finally:
+        wb.close()
+
+def _iter_workbook(file_path: str) -> Iterator[Dict[str, Any]]:
+    # Legacy formats (.xls, .ods) have no streaming reader; pandas loads the sheet
+    df = pd.read_excel(file_path)
+    projection = project_columns(list(df.columns))
+    yield from _records(df.itertuples(index=False, name=None), projection)
+
+def _iter_csv(file_path: str) -> Iterator[Dict[str, Any]]:
+    # Headers first, so only the mapped columns are parsed
+    headers = list(pd.read_csv(file_path, nrows=0).columns)
+    projection = project_columns(headers)
+    usecols = sorted(projection)
+    chunks = pd.read_csv(file_path, usecols=usecols, chunksize=CSV_CHUNK_SIZE)
+    # usecols keeps file order, so positions in a chunk follow the sorted indexes
+    fields = {position: projection[index] for position, index in enumerate(usecols)}
+    for chunk in chunks:
+        yield from _records(chunk.itertuples(index=False, name=None), fields)
+
+def iter_excel(file_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Stream the records of a manifest (.xlsx, .csv, or another format pandas
+    reads), one at a time. Only the columns in COLUMN_MAP are read, so
+    memory does not grow with the number of rows or unused columns (.xlsx
+    and .csv; legacy formats such as .xls are loaded whole by pandas).
+    Missing required columns raise ValueError on the first iteration.
+    """
+    lower = file_path.lower()
+    if lower.endswith('.csv'):
+        return _iter_csv(file_path)
+    if lower.endswith(('.xlsx', '.xlsm')):
+        return _iter_xlsx(file_path)
+    return _iter_workbook(file_path)
 
 def parse_excel(file_path: str) -> List[Dict[str, Any]]:
     """Parse Excel file and return list of records."""
     try:
-        if file_path.endswith('.csv'):
-            df = pd.read_csv(file_path)
-        else:
-            df = pd.read_excel(file_path)
-            
-        df = normalize_columns(df)
-        
-        # Ensure core columns exist - either image_name OR full_path
-        if "image_name" not in df.columns and "full_path" not in df.columns:
-            raise ValueError("Excel must contain either 'Image Name' or 'Image Path and Name' column.")
-            
-        if "sku_id" not in df.columns:
-            raise ValueError("Excel must contain 'Sku ID' column.")
-
-        # If image_name is missing but full_path is present, extract it
-        if "image_name" not in df.columns and "full_path" in df.columns:
-            def get_basename(path_str):
-                if pd.isnull(path_str): return None
-                s = str(path_str)
-                # Handle both / and \
-                return s.replace('\\', '/').split('/')[-1]
-            df["image_name"] = df["full_path"].apply(get_basename)
-            
-        # Convert to records
-        records = df.to_dict(orient="records")
-        return records
-        
+        return list(iter_excel(file_path))
     except Exception as e:
         print(f"Error parsing Excel: {e}")
         raise e
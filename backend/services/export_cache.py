@@ -0,0 +1,52 @@
+import os
+import re
+import threading
+from typing import Callable
+
+# Generated exports, per session, named by the state version they were built from
+EXPORTS_DIR = "exports"
+
+def export_etag(version: int, name: str) -> str:
+    return f'"{version}-{name}"'
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """True when an If-None-Match header lists the given ETag (or *)."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+def get_cached_export(session_path: str, name: str, version: int, build: Callable[[str], None]) -> str:
+    """
+    Path of the export `name` built at state `version`. It is only generated
+    (via build(output_path)) when no copy for this version exists yet; copies
+    from older versions are removed.
+    """
+    exports_dir = os.path.join(session_path, EXPORTS_DIR)
+    os.makedirs(exports_dir, exist_ok=True)
+    output_path = os.path.join(exports_dir, f"v{version}_{name}")
+    if os.path.exists(output_path):
+        try:
+            # The mtime doubles as last use, for least-recently-used eviction
+            os.utime(output_path)
+        except OSError:
+            pass
+        return output_path
+
+    # Build next to the target and rename, so readers never see a partial file
+    temp_path = os.path.join(exports_dir, f".tmp{os.getpid()}_{threading.get_ident()}_{name}")
+    try:
+        build(temp_path)
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    stale_pattern = re.compile(r"v\d+_" + re.escape(name) + "$")
+    for entry in os.listdir(exports_dir):
+        if stale_pattern.match(entry) and entry != os.path.basename(output_path):
+            try:
+                os.remove(os.path.join(exports_dir, entry))
+            except OSError:
+                pass
+    return output_path
@@ -0,0 +1,139 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Any, Optional, Tuple
+from services.image import extract_technical_metadata, analysis_profile, IMAGE_EXTENSIONS
+from services.analysis_cache import get_analysis_cache, file_digest, with_image_name
+from services.metrics import drain_stage_timings, record_stage_timings, record_images
+
+# Worker processes for metadata extraction (1 = extract in the calling process)
+EXTRACT_WORKERS = int(os.environ.get("EXTRACT_WORKERS", os.cpu_count() or 1))
+# Images handed to a worker per task
+EXTRACT_CHUNK_SIZE = int(os.environ.get("EXTRACT_CHUNK_SIZE", "8"))
+# How worker processes are started. Not "fork": a fork of the threaded
+# server copies locks other threads hold, and the worker can hang on them.
+WORKER_START_METHOD = os.environ.get(
+    "WORKER_START_METHOD", "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+_executor = None
+
+def new_process_pool(workers: int, initializer=None) -> ProcessPoolExecutor:
+    """A process pool whose workers start from a clean process (WORKER_START_METHOD)."""
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context(WORKER_START_METHOD), initializer=initializer
+    )
+
+def get_executor() -> ProcessPoolExecutor:
+    """Return the shared extraction pool, starting it on first use."""
+    global _executor
+    if _executor is None:
+        _executor = new_process_pool(EXTRACT_WORKERS)
+    return _executor
+
+def shutdown_executor():
+    """Stop the shared extraction pool."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def failed_metadata(image_path: str, error: Exception) -> Dict[str, Any]:
+    """Same record extract_technical_metadata returns when extraction raises."""
+    return {
+        "image_name": os.path.basename(image_path) if image_path else "unknown",
+        "width": "N/A", "height": "N/A", "resolution": "N/A", "dpi": "N/A",
+        "size": "N/A", "format": "N/A", "color_mode": "N/A", "background": "N/A", "watermark": "N/A",
+        "extraction_status": f"Error: {str(error)}"
+    }
+
+def _extract_chunk(jobs: List[Tuple[str, Optional[str]]], analysis_mode: Optional[str]) -> List[Tuple[Optional[str], Dict[str, Any], bool]]:
+    """
+    Worker task. jobs are (path, known digest) pairs; returns
+    (digest, meta, cache_hit) per job. Files whose content is already in the
+    analysis cache are not decoded.
+    """
+    cache = get_analysis_cache()
+    profile = analysis_profile(analysis_mode)
+    out = []
+    for path, digest in jobs:
+        if cache is not None and str(path).lower().endswith(IMAGE_EXTENSIONS):
+            try:
+                digest = digest or file_digest(path)
+            except OSError:
+                digest = None
+            meta = cache.get(digest, profile) if digest else None
+            if meta is not None:
+                out.append((digest, with_image_name(meta, path), True))
+                continue
+        out.append((digest, extract_technical_metadata(path, analysis_mode), False))
+    return out
+
+def _extract_chunk_task(jobs: List[Tuple[str, Optional[str]]], analysis_mode: Optional[str]):
+    """Pool entry point: _extract_chunk plus the worker's stage timings, for the parent's metrics."""
+    return _extract_chunk(jobs, analysis_mode), drain_stage_timings()
+
+def extract_many(paths: List[str], analysis_mode: Optional[str] = None, digests: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Extract metadata for many images on the shared process pool.
+    Results are returned in input order. Unchanged files are answered from the
+    analysis cache without being read. digests, when the caller already hashed
+    the files (e.g. while receiving them), saves the workers from re-reading.
+    A chunk whose worker dies gets error records, like any other per-image
+    failure.
+    """
+    paths = list(paths)
+    cache = get_analysis_cache()
+    profile = analysis_profile(analysis_mode)
+
+    if cache is not None:
+        found = cache.lookup_files(paths, profile)
+    else:
+        found = [(None, None, None)] * len(paths)
+    if digests is not None:
+        found = [(key, digest or known, meta) for (key, digest, meta), known in zip(found, digests)]
+    results = [meta for _, _, meta in found]
+    pending = [i for i, meta in enumerate(results) if meta is None]
+    jobs = [(paths[i], found[i][1]) for i in pending]
+
+    if EXTRACT_WORKERS <= 1 or len(jobs) <= 1:
+        outputs = _extract_chunk(jobs, analysis_mode)
+        record_stage_timings(drain_stage_timings())
+    else:
+        outputs = _extract_on_pool(jobs, analysis_mode)
+
+    entries = [(paths[i], found[i][0], found[i][1], meta, True) for i, meta in enumerate(results) if meta is not None]
+    for i, (digest, meta, hit) in zip(pending, outputs):
+        results[i] = meta
+        entries.append((paths[i], found[i][0], digest, meta, hit))
+
+    if cache is not None and entries:
+        cache.save(profile, entries)
+
+    failed = sum(1 for meta in results if str(meta.get("extraction_status", "")).startswith("Error"))
+    cached = sum(1 for *_, hit in entries if hit)
+    record_images({"extracted": len(results) - failed - cached, "cached": cached, "failed": failed})
+    return results
+
+def _extract_on_pool(jobs: List[Tuple[str, Optional[str]]], analysis_mode: Optional[str]) -> List[Tuple[Optional[str], Dict[str, Any], bool]]:
+    executor = get_executor()
+    chunks = [jobs[i:i + EXTRACT_CHUNK_SIZE] for i in range(0, len(jobs), EXTRACT_CHUNK_SIZE)]
+    futures = [executor.submit(_extract_chunk_task, chunk, analysis_mode) for chunk in chunks]
+
+    outputs = []
+    broken = False
+    for chunk, future in zip(chunks, futures):
+        try:
+            chunk_outputs, timings = future.result()
+            outputs.extend(chunk_outputs)
+            record_stage_timings(timings)
+        except Exception as e:
+            print(f"Extraction worker failed: {e}")
+            broken = broken or isinstance(e, BrokenProcessPool)
+            outputs.extend((None, failed_metadata(path, e), False) for path, _ in chunk)
+
+    if broken:
+        # A crashed worker poisons the pool; start a fresh one next time
+        shutdown_executor()
+    return outputs
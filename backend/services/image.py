@@ -1,13 +1,257 @@
 import os
-import json
-from PIL import Image, ImageChops, ImageStat, ImageFilter
+import math
+import numpy as np
+from PIL import Image
+from services.metrics import StageClock
 
-def extract_technical_metadata(image_path):
+# Pixel analysis mode: "full" analyzes the original pixels, "reduced" a
+# downscaled proxy (see README.md for the accuracy/speed trade-off), "quick"
+# reads only the headers and leaves the pixel checks pending
+ANALYSIS_MODES = ("full", "reduced", "quick")
+ANALYSIS_MODE = os.environ.get("ANALYSIS_MODE", "full")
+if ANALYSIS_MODE not in ANALYSIS_MODES:
+    raise ValueError(f"ANALYSIS_MODE must be one of {', '.join(ANALYSIS_MODES)}, not {ANALYSIS_MODE!r}")
+# Longest side of the proxy image used in "reduced" mode
+PROXY_MAX_SIZE = int(os.environ.get("ANALYSIS_PROXY_MAX_SIZE", "1024"))
+# Bump whenever a change alters extraction results; cached results from
+# other versions are discarded
+ANALYZER_VERSION = "3"
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff')
+
+RGB_MODES = ('RGB', 'RGBA', 'RGBX')
+
+# Fields computed from pixels; in "quick" mode they hold PIXELS_PENDING and the
+# record's pixel_analysis is "pending" until they are filled in
+PIXEL_FIELDS = ("color_mode", "background", "watermark")
+PIXELS_PENDING = "Pending"
+
+# Perceptual hash: a (width + 1) x height grayscale thumbnail, one bit per
+# horizontally adjacent pair (dHash), 64 bits stored as 16 hex digits
+PHASH_SIZE = (9, 8)
+
+# Watermark regions as fractions of (w, h): center plus the four corners
+WATERMARK_REGIONS = [
+    (0.25, 0.25, 0.75, 0.75), # Center
+    (0, 0, 0.2, 0.2),         # Top-Left
+    (0.8, 0, 1, 0.2),         # Top-Right
+    (0, 0.8, 0.2, 1),         # Bottom-Left
+    (0.8, 0.8, 1, 1)          # Bottom-Right
+]
+
+def _build_saturation_lut():
+    """
+    Saturation for every (max, max - min) channel pair, computed the way
+    Pillow's rgb2hsv does: float32 division, then truncation of s * 255.0.
+    """
+    mx = np.arange(256, dtype=np.float32)[:, None]
+    diff = np.arange(256, dtype=np.float32)[None, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lut = np.floor((diff / mx).astype(np.float64) * 255.0)
+    lut[~np.isfinite(lut) | (diff > mx)] = 0
+    return lut.astype(np.uint8).ravel()
+
+SATURATION_LUT = _build_saturation_lut()
+
+def _saturation(rgb):
+    """HSV saturation channel of an RGB array, identical to convert('HSV')."""
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    mx = np.maximum(np.maximum(r, g), b)
+    diff = mx - np.minimum(np.minimum(r, g), b)
+    return np.take(SATURATION_LUT, (mx.astype(np.uint16) << 8) | diff)
+
+def _grayscale(img):
+    """Luma array of the already decoded image."""
+    if img.mode == 'L':
+        return np.asarray(img)
+    return np.asarray(img.convert('L'))
+
+def _edge_sum(gray, x1, y1, x2, y2):
+    """
+    Sum of ImageFilter.FIND_EDGES over a box, without filtering the full frame.
+    Pillow leaves the outermost rows and columns untouched, so those pixels
+    contribute their original values.
+    """
+    h, w = gray.shape
+    out = gray[y1:y2, x1:x2].astype(np.int16)
+    iy1, iy2 = max(y1, 1), min(y2, h - 1)
+    ix1, ix2 = max(x1, 1), min(x2, w - 1)
+    if iy2 > iy1 and ix2 > ix1:
+        win = gray[iy1 - 1:iy2 + 1, ix1 - 1:ix2 + 1].astype(np.int16)
+        rows, cols = iy2 - iy1, ix2 - ix1
+        box = np.zeros((rows, cols), dtype=np.int16)
+        for dy in range(3):
+            for dx in range(3):
+                box += win[dy:dy + rows, dx:dx + cols]
+        # 3x3 kernel: 8 at the center, -1 around it
+        edges = 9 * win[1:-1, 1:-1] - box
+        out[iy1 - y1:iy2 - y1, ix1 - x1:ix2 - x1] = np.clip(edges, 0, 255)
+    return int(out.sum(dtype=np.int64))
+
+def perceptual_hash(gray):
+    """
+    dHash of a grayscale array: shrink to PHASH_SIZE with box averaging and
+    set a bit wherever a pixel is brighter than its right neighbour.
+    Re-encoded or resized copies of a photo land within a few bits.
+    """
+    # Sampling every step-th pixel first keeps this cheap on large images;
+    # each cell still averages thousands of samples
+    step = max(1, min(gray.shape) // 256)
+    sampled = np.ascontiguousarray(gray[::step, ::step])
+    small = np.asarray(Image.fromarray(sampled).resize(PHASH_SIZE, Image.BOX), dtype=np.int16)
+    bits = (small[:, :-1] > small[:, 1:]).ravel()
+    return f"{int(np.packbits(bits).view('>u8')[0]):016x}"
+
+def analysis_profile(analysis_mode=None):
+    """Identifies the settings an extraction result depends on, for caching."""
+    analysis_mode = analysis_mode or ANALYSIS_MODE
+    if analysis_mode == "reduced":
+        return f"v{ANALYZER_VERSION}:reduced:{PROXY_MAX_SIZE}"
+    return f"v{ANALYZER_VERSION}:{analysis_mode}"
+
+def pixel_analysis_mode(analysis_mode=None):
+    """Mode used for pixel checks deferred by "quick": the requested or deployment mode, else "full"."""
+    analysis_mode = analysis_mode or ANALYSIS_MODE
+    return "full" if analysis_mode == "quick" else analysis_mode
+
+def analysis_proxy(img, max_size=PROXY_MAX_SIZE):
+    """
+    Returns a reduced-resolution version of an opened image for pixel analysis.
+    JPEGs are decoded at a smaller DCT scale via draft(), then reduce() brings
+    the long side down to at most max_size. Read header fields before calling
+    this, since draft() changes img.size.
+    """
+    w, h = img.size
+    if max(w, h) <= max_size:
+        return img
+
+    if img.format == 'JPEG':
+        scale = max_size / max(w, h)
+        img.draft(img.mode, (math.ceil(w * scale), math.ceil(h * scale)))
+
+    factor = math.ceil(max(img.size) / max_size)
+    if factor > 1:
+        try:
+            return img.reduce(factor)
+        except ValueError:
+            # reduce() does not support 1, P or I;16; analyze at full size
+            return img
+    return img
+
+def analyze_pixels(img):
+    """
+    Runs the color mode, background and watermark heuristics on a decoded image.
+    Decodes once into NumPy arrays and derives every statistic from them.
+    Returns (color_mode, background, watermark, perceptual hash).
+    """
+    clock = StageClock()
+    mode = img.mode
+    w, h = img.size
+    bands = img.getbands()
+
+    arr = np.asarray(img) if mode in RGB_MODES or mode == 'LA' else None
+    if mode == 'RGB':
+        rgb = arr
+    elif mode in RGB_MODES:
+        rgb = arr[..., :3]
+    else:
+        rgb = np.asarray(img.convert('RGB'))
+    sat = _saturation(rgb)
+
+    # Detect Color Mode (Enhanced Accuracy)
+    color_desc = mode
+    if mode in ['L', '1']:
+        color_desc = "B&W"
+    elif 'C' in bands and 'M' in bands and 'Y' in bands and 'K' in bands:
+        color_desc = "CMYK"
+    elif mode == 'CMYK':
+        color_desc = "CMYK"
+    elif mode in ['RGB', 'RGBA', 'RGBX', 'RGBa']:
+        # Use max saturation to detect even small colorful logos
+        if mode == 'RGBa':
+            max_sat = np.asarray(img.convert('HSV'))[..., 1].max(initial=0)
+        else:
+            max_sat = sat.max(initial=0)
+        if max_sat < 30: # If max saturation is very low, it's B&W
+            color_desc = "B&W"
+        else:
+            color_desc = "RGB"
+    clock.lap("color")
+
+    # Detect Background (Robust Border Sampling)
+    # 1. Check for actual transparency
+    is_transparent = False
+    if mode in ['RGBA', 'LA'] or 'transparency' in img.info:
+        if mode in ['RGBA', 'LA']:
+            alpha = arr[..., -1]
+        else:
+            alpha = np.asarray(img.convert('RGBA'))[..., 3]
+        if alpha.min(initial=255) < 255:
+            is_transparent = True
+
+    # 2. Check for solid white background
+    if is_transparent:
+        has_bg = "No"  # Transparent = isolated object with no background
+    else:
+        border_w = max(1, int(w * 0.01))
+        border_h = max(1, int(h * 0.01))
+        edges = [
+            rgb[0:border_h, :],     # Top
+            rgb[h - border_h:h, :], # Bottom
+            rgb[:, 0:border_w],     # Left
+            rgb[:, w - border_w:w]  # Right
+        ]
+
+        white_pixels = 0
+        total_border_pixels = 0
+        for edge in edges:
+            count = edge.shape[0] * edge.shape[1]
+            if count:
+                # Integer sums keep the channel means identical to ImageStat
+                means = [float(int(s)) / count for s in edge.reshape(-1, 3).sum(axis=0, dtype=np.int64)]
+                # "Near white" (RGB > 240)
+                if sum(means) / 3 > 240:
+                    white_pixels += count
+            total_border_pixels += count
+
+        is_solid_white = (white_pixels / total_border_pixels) > 0.9 if total_border_pixels > 0 else False
+        has_bg = "Yes" if is_solid_white else "No"
+    clock.lap("background")
+
+    # 3. Watermark Detection: low-saturation edges in the center or in 3+ corners
+    gray = _grayscale(img)
+    regions_hit = []
+    for i, (fx1, fy1, fx2, fy2) in enumerate(WATERMARK_REGIONS):
+        x1, y1, x2, y2 = int(w * fx1), int(h * fy1), int(w * fx2), int(h * fy2)
+        count = max(0, x2 - x1) * max(0, y2 - y1)
+        if not count:
+            continue
+        if _edge_sum(gray, x1, y1, x2, y2) / count > 40:
+            if sat[y1:y2, x1:x2].max() < 40:
+                regions_hit.append(i)
+
+    if 0 in regions_hit:
+        has_watermark = "Yes"
+    elif len([r for r in regions_hit if r > 0]) >= 3:
+        has_watermark = "Yes"
+    else:
+        has_watermark = "No"
+    clock.lap("watermark")
+
+    phash = perceptual_hash(gray)
+    clock.lap("phash")
+
+    return color_desc, has_bg, has_watermark, phash
+
+def extract_technical_metadata(image_path, analysis_mode=None):
     """
     Extracts technical metadata from an image file using Pillow.
+    analysis_mode selects "full" or "reduced" pixel analysis, or "quick" to
+    skip it, and defaults to ANALYSIS_MODE. Dimensions, DPI, format and size
+    always come from the original file's headers.
     """
-    valid_extensions = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff')
-    if not str(image_path).lower().endswith(valid_extensions):
+    analysis_mode = analysis_mode or ANALYSIS_MODE
+    if not str(image_path).lower().endswith(IMAGE_EXTENSIONS):
         return {
             "image_name": os.path.basename(image_path),
             "width": "N/A", "height": "N/A", "resolution": "N/A", "dpi": "N/A",
@@ -16,11 +260,15 @@ def extract_technical_metadata(image_path):
         }
 
     try:
+        clock = StageClock()
         # Get file size
         filesize = os.path.getsize(image_path)
         filesize_str = f"{filesize / 1024:.2f} KB" if filesize < 1024 * 1024 else f"{filesize / (1024 * 1024):.2f} MB"
         
         with Image.open(image_path) as img:
+            width, height, img_format = img.width, img.height, img.format
+            clock.lap("open")
+
             # --- Robust DPI Extraction ---
             dpi = None
             
@@ -68,122 +316,35 @@ def extract_technical_metadata(image_path):
             else:
                 # Ensure it's a tuple of floats
                 dpi = (float(dpi[0]), float(dpi[1]))
-            
-            # Detect Color Mode (Enhanced Accuracy)
-            mode = img.mode
-            w, h = img.size
-            color_desc = mode
-            bands = img.getbands()
-            
-            if mode in ['L', '1']:
-                color_desc = "B&W"
-            elif 'C' in bands and 'M' in bands and 'Y' in bands and 'K' in bands:
-                color_desc = "CMYK"
-            elif mode == 'CMYK':
-                color_desc = "CMYK"
-            elif mode in ['RGB', 'RGBA', 'RGBX', 'RGBa']:
-                # Use HSV to check for saturation
-                hsv_img = img.convert('HSV')
-                stat = ImageStat.Stat(hsv_img)
-                # Use max saturation to detect even small colorful logos
-                if stat.extrema[1][1] < 30: # If max saturation is very low, it's B&W
-                    color_desc = "B&W"
-                else:
-                    color_desc = "RGB"
-
-            # Detect Background (Robust Border Sampling)
-            has_bg = "Yes"
-            
-            # 1. Check for actual transparency
-            is_transparent = False
-            if mode in ['RGBA', 'LA'] or 'transparency' in img.info:
-                alpha = img.convert('RGBA').getchannel('A')
-                if alpha.getextrema()[0] < 255:
-                    is_transparent = True
-            
-            # 2. Check for solid white background
-            if is_transparent:
-                has_bg = "No"  # Transparent = isolated object with no background
-            else:
-                # Check if it's solid white background (Yes) or anything else (No)
-                rgb_img = img.convert('RGB')
-                border_w = max(1, int(w * 0.01))
-                border_h = max(1, int(h * 0.01))
-                
-                # Check 4 edges
-                edges = [
-                    rgb_img.crop((0, 0, w, border_h)), # Top
-                    rgb_img.crop((0, h - border_h, w, h)), # Bottom
-                    rgb_img.crop((0, 0, border_w, h)), # Left
-                    rgb_img.crop((w - border_w, 0, w, h)) # Right
-                ]
-                
-                white_pixels = 0
-                total_border_pixels = 0
-                for edge in edges:
-                    stat = ImageStat.Stat(edge)
-                    # "Near white" (RGB > 240)
-                    if sum(stat.mean) / 3 > 240:
-                        white_pixels += edge.width * edge.height
-                    total_border_pixels += edge.width * edge.height
-                
-                is_solid_white = (white_pixels / total_border_pixels) > 0.9 if total_border_pixels > 0 else False
-                
-                if is_solid_white:
-                    has_bg = "Yes"  # Only white background = has background
-                else:
-                    has_bg = "No"  # Black, colored, or complex = isolated object
-
-            # 3. Watermark Detection (Enhanced)
-            has_watermark = "No"
-            gray = img.convert('L')
-            edges_img = gray.filter(ImageFilter.FIND_EDGES)
-            
-            regions_coords = [
-                (w*0.25, h*0.25, w*0.75, h*0.75), # Center
-                (0, 0, w*0.2, h*0.2),             # Top-Left
-                (w*0.8, 0, w, h*0.2),             # Top-Right
-                (0, h*0.8, w*0.2, h),             # Bottom-Left
-                (w*0.8, h*0.8, w, h)              # Bottom-Right
-            ]
-            
-            watermark_score = 0
-            regions_hit = []
-            for i, coords in enumerate(regions_coords):
-                x1, y1, x2, y2 = coords
-                edge_region = edges_img.crop((int(x1), int(y1), int(x2), int(y2)))
-                edge_stat = ImageStat.Stat(edge_region)
-                
-                if edge_stat.mean[0] > 40:
-                    color_region = img.crop((int(x1), int(y1), int(x2), int(y2)))
-                    hsv_region = color_region.convert('HSV')
-                    sat_stat = ImageStat.Stat(hsv_region)
-                    max_saturation = sat_stat.extrema[1][1] if len(sat_stat.extrema) > 1 else 0
-                    
-                    if max_saturation < 40: 
-                        watermark_score += 1
-                        regions_hit.append(i) 
-            
-            if 0 in regions_hit:
-                has_watermark = "Yes"
-            elif len([r for r in regions_hit if r > 0]) >= 3:
-                has_watermark = "Yes"
+            clock.lap("dpi")
+
+            # Pixel heuristics: color mode, background and watermark
+            if analysis_mode == "quick":
+                color_desc = has_bg = has_watermark = PIXELS_PENDING
+                phash = None
             else:
-                has_watermark = "No"
+                pixels = analysis_proxy(img) if analysis_mode == "reduced" else img
+                pixels.load()
+                clock.lap("decode")
+                color_desc, has_bg, has_watermark, phash = analyze_pixels(pixels)
 
-            return {
+            meta = {
                 "image_name": os.path.basename(image_path),
-                "width": img.width,
-                "height": img.height,
-                "resolution": f"{img.width}x{img.height}",
+                "width": width,
+                "height": height,
+                "resolution": f"{width}x{height}",
                 "dpi": f"{int(dpi[0])} DPI",
                 "size": filesize_str,
-                "format": img.format,
+                "format": img_format,
                 "color_mode": color_desc,
                 "background": has_bg,
                 "watermark": has_watermark,
+                "phash": phash,
                 "extraction_status": "Extraction Complete!"
             }
+            if analysis_mode == "quick":
+                meta["pixel_analysis"] = "pending"
+            return meta
     except Exception as e:
         return {
             "image_name": os.path.basename(image_path) if image_path else "unknown",
@@ -0,0 +1,288 @@
+import os
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Optional
+from services.data import load_job, request_job_cancel, save_job
+
+# Jobs running at the same time; further submissions wait in queued state
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+# Finished jobs stay queryable for this long
+JOB_RETENTION_SECONDS = int(os.environ.get("JOB_RETENTION_SECONDS", "3600"))
+# Progress is written to the session store at most this often (and on every
+# phase change), for workers in other processes polling the job
+JOB_PUBLISH_SECONDS = float(os.environ.get("JOB_PUBLISH_SECONDS", "0.5"))
+
+FINISHED_STATES = ("completed", "cancelled", "failed")
+
+class JobCancelled(Exception):
+    """Raised inside a job's work function once cancellation was requested."""
+
+class Job:
+    """
+    Progress of a background job. The work function reports through
+    set_total/advance and calls check_cancelled between units of work;
+    readers take consistent copies through snapshot(). A job with a
+    session_path also publishes its progress to the session store, where
+    other worker processes read it (RemoteJob) and can request cancellation.
+    """
+
+    def __init__(self, kind: str, email: str, session_path: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.email = email
+        self.session_path = session_path
+        self.status = "queued"
+        self.phase = None
+        self.message = ""
+        self.total = None
+        self.processed = 0
+        self.results = []
+        self.created_at = time.time()
+        self.started_at = None
+        self.progress_started_at = None
+        self.finished_at = None
+        # Bumped on every change so event streams only send news
+        self.revision = 0
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+        self._published_at = 0.0
+        self._published_results = 0
+
+    def _changed(self):
+        self.revision += 1
+
+    def _publish(self, force: bool = False):
+        """
+        Write the progress made since the last publish to the session store,
+        at most every JOB_PUBLISH_SECONDS unless forced, and pick up a
+        cancellation requested through another worker.
+        """
+        if self.session_path is None:
+            return
+        with self._publish_lock:
+            if not force and time.time() - self._published_at < JOB_PUBLISH_SECONDS:
+                return
+            state = self.snapshot(self._published_results)
+            results = state.pop("results")
+            state["email"] = self.email
+            try:
+                cancel = save_job(
+                    self.session_path, self.id, state, self._published_results, results, self.finished_at,
+                    prune_before=time.time() - JOB_RETENTION_SECONDS if self.finished else None
+                )
+            except Exception as e:
+                print(f"Job {self.id}: could not publish progress: {e}")
+                return
+            self._published_at = time.time()
+            self._published_results += len(results)
+            if cancel:
+                self._cancel.set()
+
+    def set_phase(self, phase: str, message: str = ""):
+        with self._lock:
+            self.phase = phase
+            self.message = message
+            self._changed()
+        self._publish(force=True)
+
+    def set_total(self, total: int):
+        with self._lock:
+            self.total = total
+            self.progress_started_at = time.time()
+            self._changed()
+        self._publish()
+
+    def advance(self, results: List[Dict[str, Any]], processed: int = None):
+        """Record finished units; processed defaults to len(results)."""
+        with self._lock:
+            self.results.extend(results)
+            self.processed += len(results) if processed is None else processed
+            self._changed()
+        self._publish()
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def _finish(self, status: str, message: str):
+        with self._lock:
+            self.status = status
+            self.phase = "done"
+            self.message = message
+            self.finished_at = time.time()
+            self._changed()
+        self._publish(force=True)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def refresh(self):
+        """Nothing to reload; the state lives in this process."""
+
+    def snapshot(self, since: int = 0) -> Dict[str, Any]:
+        """JSON-ready state, with per-item results from index `since` on."""
+        with self._lock:
+            now = self.finished_at or time.time()
+            throughput = eta = None
+            if self.progress_started_at and self.processed:
+                elapsed = max(now - self.progress_started_at, 1e-6)
+                throughput = self.processed / elapsed
+                if self.total is not None and not self.finished:
+                    eta = max(self.total - self.processed, 0) / throughput
+            return {
+                "job_id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "phase": self.phase,
+                "message": self.message,
+                "processed": self.processed,
+                "total": self.total,
+                "throughput": round(throughput, 2) if throughput is not None else None,
+                "eta_seconds": round(eta, 1) if eta is not None else None,
+                "elapsed_seconds": round(now - self.started_at, 1) if self.started_at else 0,
+                "results_total": len(self.results),
+                "results_since": since,
+                "results": self.results[since:],
+                "revision": self.revision
+            }
+
+class RemoteJob:
+    """
+    Read-only view of a job running in another worker process, from the
+    progress it published to the session store. Cancelling sets a flag the
+    owning worker picks up on its next publish.
+    """
+
+    def __init__(self, session_path: str, job_id: str, state: Dict[str, Any]):
+        self.session_path = session_path
+        self.id = job_id
+        self._state = state
+
+    def refresh(self):
+        """Reload the last published state (without results)."""
+        state = load_job(self.session_path, self.id, None)
+        if state is not None:
+            self._state = state
+
+    @property
+    def email(self) -> str:
+        return self._state.get("email")
+
+    @property
+    def status(self) -> str:
+        return self._state["status"]
+
+    @property
+    def revision(self) -> int:
+        return self._state["revision"]
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._state["cancel_requested"]
+
+    def cancel(self):
+        if request_job_cancel(self.session_path, self.id):
+            self._state["cancel_requested"] = True
+
+    def snapshot(self, since: int = 0) -> Dict[str, Any]:
+        """JSON-ready state as last published, with results from index `since` on."""
+        state = load_job(self.session_path, self.id, since) or dict(self._state, results_since=since, results=[])
+        self._state = state
+        return {
+            key: value for key, value in state.items() if key not in ("email", "cancel_requested", "updated_at")
+        }
+
+_jobs: Dict[str, Job] = {}
+_jobs_lock = threading.Lock()
+_executor = None
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+    return _executor
+
+def _run(job: Job, work: Callable[[Job], Optional[str]]):
+    if job.cancel_requested:
+        job._finish("cancelled", "Cancelled before start")
+        return
+    with job._lock:
+        job.status = "running"
+        job.started_at = time.time()
+        job._changed()
+    job._publish(force=True)
+    try:
+        message = work(job)
+        job._finish("completed", message or "Completed")
+    except JobCancelled:
+        job._finish("cancelled", f"Cancelled after {job.processed} items; processed items were kept")
+    except Exception as e:
+        print(f"Job {job.id} ({job.kind}) failed: {e}")
+        job._finish("failed", str(e))
+
+def _prune():
+    cutoff = time.time() - JOB_RETENTION_SECONDS
+    for job_id, job in list(_jobs.items()):
+        if job.finished and job.finished_at < cutoff:
+            del _jobs[job_id]
+
+def submit_job(
+    kind: str, email: str, work: Callable[[Job], Optional[str]], session_path: Optional[str] = None
+) -> Job:
+    """
+    Run work(job) on the job pool. Its return value becomes the final
+    message; raising JobCancelled marks the job cancelled, anything else
+    failed. With a session_path, other worker processes can follow and
+    cancel the job through find_job.
+    """
+    job = Job(kind, email, session_path)
+    with _jobs_lock:
+        _prune()
+        _jobs[job.id] = job
+    job._publish(force=True)
+    _get_executor().submit(_run, job, work)
+    return job
+
+def get_job(job_id: str) -> Optional[Job]:
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+def find_job(job_id: str, email: str, session_path: str):
+    """
+    The user's job: the Job itself when it runs in this process, else a
+    RemoteJob if another worker published it to the session store; None if
+    neither knows it.
+    """
+    job = get_job(job_id)
+    if job is None:
+        state = load_job(session_path, job_id, None)
+        job = RemoteJob(session_path, job_id, state) if state is not None else None
+    if job is None or job.email != email:
+        return None
+    return job
+
+def active_job_emails() -> List[str]:
+    """Emails of the users with a queued or running job."""
+    with _jobs_lock:
+        return [job.email for job in _jobs.values() if not job.finished]
+
+def cancel_running_jobs():
+    """Ask every job to stop; used on shutdown."""
+    with _jobs_lock:
+        for job in _jobs.values():
+            job.cancel()
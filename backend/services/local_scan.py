@@ -0,0 +1,178 @@
+import os
+from typing import List, Dict, Any, Optional, Tuple
+from services.data import save_metadata, append_records, load_metadata, load_scan_snapshot, save_scan_snapshot
+from services.extraction import extract_many
+from services.image import analysis_profile
+from services.jobs import Job
+from services.scanner import FileStats, scan_tree, stat_paths, diff_snapshot
+
+# Images extracted and committed to the session store together
+LOCAL_SCAN_BATCH_SIZE = int(os.environ.get("LOCAL_SCAN_BATCH_SIZE", "256"))
+
+LOCAL_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff')
+
+# Record fields that come from the scan/Excel rather than from extraction
+LOCAL_FIELDS = ("image_provided_by", "sku_id", "image_name", "status", "display_order", "notes", "image_path")
+
+def find_local_images(path: str, excel_records: dict) -> Tuple[dict, FileStats]:
+    """
+    Map image file name -> absolute path from a directory scan and Excel full
+    paths. Also returns path -> (size, mtime_ns) of every mapped file.
+    """
+    # 2. Collect image paths from directory (if path provided)
+    stats = scan_tree(path, LOCAL_IMAGE_EXTENSIONS) if path else {}
+    found_paths_by_name = {} # Map: filename -> absolute_path
+    # Sorted so that, among same-named files, the winner does not depend on thread timing
+    for file_path in sorted(stats):
+        found_paths_by_name[os.path.basename(file_path)] = file_path
+
+    # 3. Collect absolute paths from Excel, stat'ed in parallel batches
+    excel_paths = {
+        img_name: str(rec.get("full_path"))
+        for img_name, rec in excel_records.items() if rec.get("full_path")
+    }
+    excel_stats = stat_paths(excel_paths.values())
+    for img_name, full_p in excel_paths.items():
+        if full_p in excel_stats:
+            # Excel path takes precedence if it exists
+            found_paths_by_name[img_name] = full_p
+    stats.update(excel_stats)
+    return found_paths_by_name, {p: stats[p] for p in found_paths_by_name.values()}
+
+def local_record(filename: str, file_path: str, meta: Dict[str, Any], excel_meta: Dict[str, Any]) -> Dict[str, Any]:
+    """Session record of an image found on disk, merged with its Excel row if any."""
+    # Try to extract SKU ID from filename as fallback
+    sku_fallback = filename.split('_')[0] if '_' in filename else filename.split('.')[0]
+    return {
+        "image_provided_by": excel_meta.get("image_provided_by", "MFR Image" if "mfr" in file_path.lower() or "mfr" in filename.lower() else "Client Image"),
+        "sku_id": excel_meta.get("sku_id", sku_fallback),
+        "image_name": filename,
+        "status": "Pending",
+        "display_order": excel_meta.get("display_order"),
+        "notes": excel_meta.get("notes", ""),
+        "image_path": file_path,
+        **meta
+    }
+
+def _reusable_metadata(session_path: str, snapshot: dict, unchanged: List[str], profile: str) -> Dict[str, Dict[str, Any]]:
+    """Extraction results of the previous scan for files that have not changed since."""
+    reusable = {path for path in unchanged if snapshot[path][2] == profile}
+    if not reusable:
+        return {}
+    metas = {}
+    for record in load_metadata(session_path):
+        image_path = record.get("image_path")
+        if image_path in reusable and record.get("extraction_status") == "Extraction Complete!":
+            metas[image_path] = {k: v for k, v in record.items() if k not in LOCAL_FIELDS}
+    return metas
+
+def missing_record(filename: str, excel_meta: Dict[str, Any]) -> Dict[str, Any]:
+    """Session record of an Excel row whose image was not found anywhere."""
+    return {
+        "image_provided_by": excel_meta.get("image_provided_by", "Unknown"),
+        "sku_id": excel_meta.get("sku_id", "Unknown"),
+        "image_name": filename,
+        "status": "Missing",
+        "display_order": excel_meta.get("display_order"),
+        "notes": excel_meta.get("notes", "Image file not found"),
+        "image_path": None,
+        "width": "N/A", "height": "N/A", "resolution": "N/A", "dpi": "N/A",
+        "size": "0 KB", "format": "N/A", "color_mode": "N/A",
+        "background": "N/A", "watermark": "N/A"
+    }
+
+def run_local_scan(
+    session_path: str,
+    path: Optional[str],
+    excel_records: dict,
+    analysis_mode: Optional[str] = None,
+    job: Optional[Job] = None
+) -> Dict[str, Any]:
+    """
+    Replace the session's records with the images under path and/or the
+    Excel full paths. Images are extracted and committed in batches of
+    LOCAL_SCAN_BATCH_SIZE, so an interrupted scan keeps the batches already
+    done. Files whose size and mtime match the previous scan's snapshot
+    keep their extraction results instead of being re-extracted. When run
+    as a job, progress and per-file results are reported on it and
+    cancellation is honoured between batches.
+    Returns the summary the local-path endpoint responds with (including
+    the added/changed/removed files and how many images still await their
+    quick-mode pixel checks), plus the image paths processed.
+    """
+    if job:
+        job.set_phase("scanning", "Looking for images")
+    found_paths_by_name, stats = find_local_images(path, excel_records)
+    if not found_paths_by_name and not excel_records:
+        raise LookupError("No images found in path and no metadata in Excel.")
+
+    profile = analysis_profile(analysis_mode)
+    snapshot = load_scan_snapshot(session_path)
+    changes = diff_snapshot(snapshot, stats)
+    reused = _reusable_metadata(session_path, snapshot, changes["unchanged"], profile)
+    change_of = dict.fromkeys(changes["added"], "added")
+    change_of.update(dict.fromkeys(changes["changed"], "changed"))
+
+    missing = [name for name in excel_records if name not in found_paths_by_name]
+    items = list(found_paths_by_name.items())
+    if job:
+        job.set_total(len(items) + len(missing))
+        job.set_phase("extracting", f"Extracting {len(items)} images")
+        job.check_cancelled()
+
+    # Start from an empty session; each batch is appended as it completes
+    save_metadata(session_path, [])
+    count = 0
+    pixels_pending = 0
+    results = []
+
+    # 4. Process all images we found a path for
+    for start in range(0, len(items), LOCAL_SCAN_BATCH_SIZE):
+        batch = items[start:start + LOCAL_SCAN_BATCH_SIZE]
+        to_extract = [file_path for _, file_path in batch if file_path not in reused]
+        extracted = dict(zip(to_extract, extract_many(to_extract, analysis_mode))) if to_extract else {}
+        metas = [reused.get(file_path) or extracted[file_path] for _, file_path in batch]
+
+        records = []
+        batch_results = []
+        for (filename, file_path), meta in zip(batch, metas):
+            excel_meta = excel_records.get(filename, {})
+            records.append(local_record(filename, file_path, meta, excel_meta))
+            batch_results.append({
+                "filename": filename,
+                "status": "Matched" if filename in excel_records else "Scanned",
+                "source": "Excel Path" if excel_meta.get("full_path") == file_path else "Directory Scan",
+                "change": change_of.get(file_path, "unchanged")
+            })
+        append_records(session_path, records)
+        count += len(records)
+        pixels_pending += sum(1 for meta in metas if meta.get("pixel_analysis") == "pending")
+        results.extend(batch_results)
+        if job:
+            job.advance(batch_results)
+            job.check_cancelled()
+
+    # 5. Handle records in Excel but NOT found anywhere (Missing Images)
+    records = [missing_record(filename, excel_records[filename]) for filename in missing]
+    append_records(session_path, records)
+    count += len(records)
+    missing_results = [{"filename": filename, "status": "Missing"} for filename in missing]
+    results.extend(missing_results)
+    if job:
+        job.advance(missing_results)
+
+    save_scan_snapshot(session_path, stats, profile)
+    return {
+        "message": f"Processed {count} records ({len(items)} images found)",
+        "count": count,
+        "results": results,
+        "changes": {
+            "added": len(changes["added"]),
+            "changed": len(changes["changed"]),
+            "removed": changes["removed"],
+            "unchanged": len(changes["unchanged"]),
+            "reextracted": len(items) - len(reused)
+        },
+        "pixels_pending": pixels_pending,
+        "image_paths": [file_path for _, file_path in items]
+    }
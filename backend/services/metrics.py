@@ -0,0 +1,237 @@
+import os
+import threading
+import time
+from collections import deque
+from functools import wraps
+from typing import Dict, List, Sequence, Tuple
+
+# Set METRICS_ENABLED=0 to turn off every timer (the /metrics page stays, empty)
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+# Window (seconds) of the images-per-second gauge
+THROUGHPUT_WINDOW_SECONDS = 60
+
+# Histogram bucket upper bounds, in seconds
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _le(bound) -> str:
+    return 'le="' + str(bound) + '"'
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label combination."""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # bucket counts, then sum and count
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, _le(bound))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, _le('+Inf'))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(series[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+class Counter:
+    """Monotonic counter with one series per label combination."""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str]):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels: str):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._series.items())
+        lines.extend(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in items)
+        return lines
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "image_validator_http_request_duration_seconds", "HTTP request latency by route template.",
+    ("method", "route", "status"), REQUEST_BUCKETS
+)
+ANALYSIS_STAGE_SECONDS = Histogram(
+    "image_validator_analysis_stage_duration_seconds", "Time per image spent in each extraction stage.",
+    ("stage",), STAGE_BUCKETS
+)
+STORAGE_SECONDS = Histogram(
+    "image_validator_storage_operation_duration_seconds", "Session store operation latency.",
+    ("operation",), STAGE_BUCKETS
+)
+IMAGES_TOTAL = Counter(
+    "image_validator_images_total", "Images processed by extraction, by outcome (extracted, cached, failed).",
+    ("result",)
+)
+_METRICS = [HTTP_REQUEST_SECONDS, ANALYSIS_STAGE_SECONDS, STORAGE_SECONDS, IMAGES_TOTAL]
+
+# (monotonic time, images) of recent extraction batches, for the throughput gauge
+_recent_images = deque()
+_recent_lock = threading.Lock()
+
+# Stage timings not yet merged into ANALYSIS_STAGE_SECONDS, per thread.
+# Extraction workers run in other processes, so they hand these back with
+# their results.
+_pending = threading.local()
+
+def _pending_stages() -> List[Tuple[str, float]]:
+    stages = getattr(_pending, "stages", None)
+    if stages is None:
+        stages = _pending.stages = []
+    return stages
+
+class StageClock:
+    """
+    Times consecutive extraction stages of one image: lap(stage) records the
+    time since the clock started or since the previous lap.
+    """
+
+    def __init__(self):
+        self.last = time.perf_counter()
+
+    def lap(self, stage: str):
+        if not METRICS_ENABLED:
+            return
+        now = time.perf_counter()
+        _pending_stages().append((stage, now - self.last))
+        self.last = now
+
+def drain_stage_timings() -> List[Tuple[str, float]]:
+    """Take the stage timings recorded by this thread since the last drain."""
+    timings = _pending_stages()
+    _pending.stages = []
+    return timings
+
+def record_stage_timings(timings: List[Tuple[str, float]]):
+    for stage, seconds in timings:
+        ANALYSIS_STAGE_SECONDS.observe(seconds, stage)
+
+def record_images(results: Dict[str, int]):
+    """Count a batch of extracted images; results maps outcome -> images."""
+    total = 0
+    for result, count in results.items():
+        if count:
+            IMAGES_TOTAL.inc(count, result)
+            total += count
+    if total:
+        now = time.monotonic()
+        with _recent_lock:
+            _recent_images.append((now, total))
+            _trim_recent(now)
+
+def _trim_recent(now: float):
+    while _recent_images and _recent_images[0][0] < now - THROUGHPUT_WINDOW_SECONDS:
+        _recent_images.popleft()
+
+def images_per_second() -> float:
+    """Images processed per second over the last THROUGHPUT_WINDOW_SECONDS."""
+    with _recent_lock:
+        _trim_recent(time.monotonic())
+        total = sum(count for _, count in _recent_images)
+    return total / THROUGHPUT_WINDOW_SECONDS
+
+def timed_storage(operation: str):
+    """Decorator recording a session store function's latency."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not METRICS_ENABLED:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                STORAGE_SECONDS.observe(time.perf_counter() - start, operation)
+        return wrapper
+    return decorator
+
+def observe_request(method: str, route: str, status: int, seconds: float):
+    if METRICS_ENABLED:
+        HTTP_REQUEST_SECONDS.observe(seconds, method, route, str(status))
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    lines.append("# HELP image_validator_images_per_second Images processed per second over the last minute.")
+    lines.append("# TYPE image_validator_images_per_second gauge")
+    lines.append(f"image_validator_images_per_second {_number(images_per_second())}")
+    return "\n".join(lines) + "\n"
+
+class RequestTimingMiddleware:
+    """
+    ASGI middleware timing every HTTP request from receipt to the last body
+    byte, labeled by route template (e.g. /upload/jobs/{job_id}) so ids do
+    not create new series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            observe_request(scope["method"], _route_label(scope), status, time.perf_counter() - start)
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    # Mounted apps (the /sessions static files) set their prefix as root_path
+    return scope.get("root_path") or "unmatched"
@@ -0,0 +1,89 @@
+import os
+import threading
+from typing import Any, Dict, List
+from services.data import iter_records, update_image_records_if
+from services.derivatives import resolve_image_path
+from services.extraction import extract_many
+from services.image import PIXEL_FIELDS, pixel_analysis_mode
+
+# Run the pixel checks deferred by quick scans in the background ("0" leaves
+# them until each SKU is opened in /validate/images)
+PIXEL_FILL_BACKGROUND = os.environ.get("PIXEL_FILL_BACKGROUND", "1") != "0"
+# Images analyzed and committed together by the background filler
+PIXEL_FILL_BATCH_SIZE = int(os.environ.get("PIXEL_FILL_BATCH_SIZE", "64"))
+
+# session path -> whether another pass was requested while the filler runs
+_fillers: Dict[str, bool] = {}
+_fillers_lock = threading.Lock()
+
+def pixels_pending(record: Dict[str, Any]) -> bool:
+    """Whether a record was quick-scanned and still lacks its pixel checks."""
+    return record.get("pixel_analysis") == "pending" and bool(record.get("image_path"))
+
+def fill_pixel_metadata(session_path: str, records: List[Dict[str, Any]]) -> int:
+    """
+    Run the deferred pixel checks for the pending ones among records and
+    persist them. records are updated in place. A record that was replaced
+    or filled in the meantime is left alone. Returns how many were stored.
+    """
+    pending = [record for record in records if pixels_pending(record)]
+    if not pending:
+        return 0
+
+    paths = []
+    for record in pending:
+        try:
+            paths.append(resolve_image_path(record["image_path"]))
+        except ValueError:
+            # Fails extraction like any other unreadable file
+            paths.append(record["image_path"])
+    metas = extract_many(paths, pixel_analysis_mode())
+
+    changes = []
+    for record, meta in zip(pending, metas):
+        if meta.get("extraction_status") == "Extraction Complete!":
+            updates = {field: meta[field] for field in PIXEL_FIELDS}
+            updates.update({"phash": meta.get("phash"), "pixel_analysis": "complete"})
+        else:
+            updates = dict.fromkeys(PIXEL_FIELDS, "N/A")
+            updates.update({"pixel_analysis": "failed", "extraction_status": meta.get("extraction_status")})
+        expected = {"image_path": record["image_path"], "pixel_analysis": "pending"}
+        changes.append((record["image_name"], expected, updates))
+        record.update(updates)
+
+    return sum(update_image_records_if(session_path, changes))
+
+def _fill_session(session_path: str):
+    try:
+        while True:
+            with _fillers_lock:
+                _fillers[session_path] = False
+            pending = [record for record in iter_records(session_path) if pixels_pending(record)]
+            for start in range(0, len(pending), PIXEL_FILL_BATCH_SIZE):
+                if not os.path.exists(session_path):
+                    # Logged out; nothing left to fill
+                    return
+                fill_pixel_metadata(session_path, pending[start:start + PIXEL_FILL_BATCH_SIZE])
+            with _fillers_lock:
+                if not _fillers[session_path]:
+                    return
+    except Exception as e:
+        print(f"Background pixel analysis failed for {session_path}: {e}")
+    finally:
+        with _fillers_lock:
+            _fillers.pop(session_path, None)
+
+def start_pixel_fill(session_path: str):
+    """
+    Fill a session's pending pixel checks on a background thread. A session
+    has at most one filler; asking again while it runs makes it look for
+    new pending records once it is done.
+    """
+    if not PIXEL_FILL_BACKGROUND:
+        return
+    with _fillers_lock:
+        if session_path in _fillers:
+            _fillers[session_path] = True
+            return
+        _fillers[session_path] = False
+    threading.Thread(target=_fill_session, args=(session_path,), daemon=True).start()
@@ -0,0 +1,129 @@
+import csv
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Output format -> (file extension, media type)
+REPORT_FORMATS = {
+    "xlsx": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "csv": ("csv", "text/csv"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+# Rows per Parquet row group
+PARQUET_BATCH_SIZE = 10000
+
+def provided_by_label(value: Any) -> str:
+    """Capitalize 'image_provided_by' for better presentation (MFR, Client)."""
+    if not value:
+        return ""
+    return str(value).upper() if str(value).lower() == "mfr" else str(value).capitalize()
+
+def dpi_number(value: Any) -> str:
+    """Clean DPI to show only number (remove ' DPI' and AI info)."""
+    if value is None:
+        return ""
+    return str(value).split(" DPI")[0].strip()
+
+# (record field, header, optional cell formatter)
+Column = Tuple[str, str, Optional[Callable[[Any], Any]]]
+
+VALIDATION_REPORT_COLUMNS: List[Column] = [
+    ("image_provided_by", "Image Provided By", provided_by_label),
+    ("sku_id", "Sku ID", None),
+    ("image_name", "Image Name", None),
+    ("size", "Image Size", None),
+    ("resolution", "Image Resolution", None),
+    ("dpi", "DPI", dpi_number),
+    ("format", "Image Format", None),
+    ("status", "Approved Status", None),
+    ("display_order", "Display Order", None),
+    ("notes", "Notes", None),
+]
+
+LOCAL_PATH_REPORT_COLUMNS: List[Column] = [
+    ("image_provided_by", "Image Provided", None),
+    ("sku_id", "Sku ID", None),
+    ("image_path", "Image Path and Name", None),
+]
+
+def report_rows(records: Iterable[Dict[str, Any]], columns: List[Column]) -> Iterator[list]:
+    """Project records onto the report columns; missing fields are empty."""
+    for record in records:
+        row = []
+        for field, _, formatter in columns:
+            value = record.get(field)
+            if formatter is not None:
+                value = formatter(value)
+            row.append("" if value is None else value)
+        yield row
+
+def _write_xlsx(rows: Iterator[list], headers: List[str], output_path: str) -> int:
+    import xlsxwriter
+    # constant_memory flushes each row to disk once the next one starts
+    workbook = xlsxwriter.Workbook(output_path, {
+        "constant_memory": True,
+        "strings_to_formulas": False,
+        "strings_to_urls": False,
+    })
+    try:
+        sheet = workbook.add_worksheet("Sheet1")
+        # Same header look as pandas' to_excel
+        header_format = workbook.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+        sheet.write_row(0, 0, headers, header_format)
+        count = 0
+        for count, row in enumerate(rows, start=1):
+            sheet.write_row(count, 0, row)
+    finally:
+        workbook.close()
+    return count
+
+def _write_csv(rows: Iterator[list], headers: List[str], output_path: str) -> int:
+    count = 0
+    with open(output_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        for count, row in enumerate(rows, start=1):
+            writer.writerow(row)
+    return count
+
+def _write_parquet(rows: Iterator[list], headers: List[str], output_path: str) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    # Report cells mix numbers and text, so every column is stored as a string
+    schema = pa.schema([(header, pa.string()) for header in headers])
+    count = 0
+    with pq.ParquetWriter(output_path, schema) as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= PARQUET_BATCH_SIZE:
+                writer.write_table(_parquet_table(pa, schema, batch))
+                count += len(batch)
+                batch = []
+        if batch or not count:
+            writer.write_table(_parquet_table(pa, schema, batch))
+            count += len(batch)
+    return count
+
+def _parquet_table(pa, schema, batch: List[list]):
+    columns = list(zip(*batch)) if batch else [() for _ in schema]
+    return pa.Table.from_arrays(
+        [pa.array([str(value) for value in values], type=pa.string()) for values in columns], schema=schema
+    )
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+WRITERS = {"xlsx": _write_xlsx, "csv": _write_csv, "parquet": _write_parquet}
+
+def write_report(records: Iterable[Dict[str, Any]], columns: List[Column], output_path: str, fmt: str = "xlsx") -> int:
+    """
+    Write records as a report with the given columns, streaming row by row,
+    in any of REPORT_FORMATS. All formats share the column order and
+    headers. Returns the number of data rows written.
+    """
+    headers = [header for _, header, _ in columns]
+    return WRITERS[fmt](report_rows(records, columns), headers, output_path)
@@ -0,0 +1,108 @@
+import base64
+import gzip
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from fastapi import HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# JSON bodies at least this large are compressed for clients that accept it
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Largest page a paginated listing hands out
+PAGE_SIZE_LIMIT = 5000
+
+def dump_json(content: Any) -> bytes:
+    """Serialize with orjson when installed, else compact stdlib json."""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def accepted_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Best supported content coding the client accepts: br (if brotli is installed), then gzip."""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        coding, _, param = part.partition(";")
+        name, _, value = param.partition("=")
+        if name.strip() == "q":
+            try:
+                if float(value) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    if brotli is not None and ("br" in accepted or "*" in accepted):
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+def _encode(content: Any, encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    body = dump_json(content)
+    if encoding is None or len(body) < COMPRESS_MIN_BYTES:
+        return body, None
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY), encoding
+    return gzip.compress(body, compresslevel=GZIP_LEVEL), encoding
+
+async def json_response(request: Request, content: Any) -> Response:
+    """
+    JSON response serialized off the event loop and compressed (br or gzip)
+    when it is large enough and the client accepts it.
+    """
+    body, encoding = await run_in_threadpool(_encode, content, accepted_encoding(request.headers.get("accept-encoding")))
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type="application/json", headers=headers)
+
+def encode_cursor(key: List[Any]) -> str:
+    """Opaque pagination cursor for a sort key."""
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(",", ":")).encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> List[Any]:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        key = None
+    if not isinstance(key, list):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return key
+
+def check_page_size(limit: Optional[int]):
+    if limit is not None and not 1 <= limit <= PAGE_SIZE_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {PAGE_SIZE_LIMIT}")
+
+def parse_fields(fields: Optional[str], presets: Dict[str, Iterable[str]]) -> Optional[List[str]]:
+    """
+    Field names from a comma-separated ?fields= value; a preset name expands
+    to its fields. None means every field.
+    """
+    if not fields:
+        return None
+    names = []
+    for name in (part.strip() for part in fields.split(",")):
+        for field in presets.get(name, (name,)):
+            if field and field not in names:
+                names.append(field)
+    return names
+
+def project(items: List[Dict[str, Any]], fields: Optional[List[str]]) -> List[Dict[str, Any]]:
+    """Keep only the given fields (those present) of each item."""
+    if fields is None:
+        return items
+    return [{field: item[field] for field in fields if field in item} for item in items]
+
+def page(items: List[Dict[str, Any]], next_key: Optional[List[Any]]) -> Dict[str, Any]:
+    """Envelope of a paginated listing."""
+    return {"items": items, "next_cursor": encode_cursor(next_key) if next_key is not None else None}
@@ -0,0 +1,349 @@
+import fnmatch
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from services.blobs import BLOB_DIR
+from services.data import STORE_FILE, has_running_job
+from services.export_cache import EXPORTS_DIR
+from services.jobs import active_job_emails
+from services.session import SESSIONS_ROOT, sanitize_email, remove_session
+from services.state import get_state
+from services.uploads import UPLOADS_DIR, RESUMABLE_EXPIRE_SECONDS
+
+# Seconds between background sweeps ("0" turns the sweeper off)
+RETENTION_SWEEP_SECONDS = int(os.environ.get("RETENTION_SWEEP_SECONDS", "300"))
+# Sessions idle this long are deleted ("0" keeps them until logout)
+SESSION_IDLE_TTL_SECONDS = int(os.environ.get("SESSION_IDLE_TTL_SECONDS", str(7 * 24 * 3600)))
+# Disk budget of all sessions together, and of each one ("0" for no limit)
+SESSIONS_MAX_BYTES = int(os.environ.get("SESSIONS_MAX_BYTES", "0"))
+SESSION_QUOTA_BYTES = int(os.environ.get("SESSION_QUOTA_BYTES", "0"))
+# Sessions used more recently than this are never evicted to meet a quota
+RETENTION_MIN_IDLE_SECONDS = int(os.environ.get("RETENTION_MIN_IDLE_SECONDS", "3600"))
+# Temporary files older than this were left behind by an interrupted request
+STALE_TEMP_SECONDS = 3600
+# Eviction stops this far under a quota, so the next upload does not trigger it again
+QUOTA_TARGET = 0.9
+# A job in another worker that has not published progress for this long
+# died with it, and no longer keeps its session from being deleted
+RUNNING_JOB_STALE_SECONDS = 900
+
+# Session-root files written by older export code; rebuilt on demand like exports/
+LEGACY_EXPORT_PATTERNS = ("export_*", "*_approved.zip")
+TEMP_PATTERNS = ("temp_*", "*.part", "*.partial", "*.linking", "*.upload")
+
+# images directory -> (mtime_ns, {(st_dev, st_ino): size}, bytes of all entries).
+# A directory whose mtime has not moved has the same entries, so it is not listed again.
+_image_dirs: Dict[str, Tuple[int, Dict[Tuple[int, int], int], int]] = {}
+_sweep_lock = threading.Lock()
+_last_sweep: Dict[str, Any] = {}
+_stop = threading.Event()
+_sweeper = None
+
+def _matches(name: str, patterns) -> bool:
+    return any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+
+def _image_usage(path: str, mtime_ns: int) -> Tuple[Dict[Tuple[int, int], int], int]:
+    cached = _image_dirs.get(path)
+    if cached and cached[0] == mtime_ns:
+        return cached[1], cached[2]
+    inodes = {}
+    total = 0
+    for entry in os.scandir(path):
+        try:
+            st = entry.stat(follow_symlinks=False)
+        except OSError:
+            continue
+        inodes[(st.st_dev, st.st_ino)] = st.st_size
+        total += st.st_size
+    _image_dirs[path] = (mtime_ns, inodes, total)
+    return inodes, total
+
+def _tree_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+def _scan_session(path: str, now: float) -> Dict[str, Any]:
+    """
+    Usage of one session. Only the session root and exports/ are listed on
+    every pass; images/ is listed again only after it changed.
+    """
+    session = {
+        "session": os.path.basename(path), "path": path,
+        "last_activity": os.stat(path).st_mtime,
+        "images_bytes": 0, "store_bytes": 0, "derived_bytes": 0, "other_bytes": 0,
+        "inodes": {}, "artifacts": [], "temp": [],
+    }
+    for entry in os.scandir(path):
+        try:
+            st = entry.stat(follow_symlinks=False)
+        except OSError:
+            continue
+        session["last_activity"] = max(session["last_activity"], st.st_mtime)
+        if entry.is_dir(follow_symlinks=False):
+            if entry.name == "images":
+                session["inodes"], session["images_bytes"] = _image_usage(entry.path, st.st_mtime_ns)
+            elif entry.name == EXPORTS_DIR:
+                for export in os.scandir(entry.path):
+                    try:
+                        export_st = export.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    session["artifacts"].append((export_st.st_mtime, export_st.st_size, export.path))
+                    session["derived_bytes"] += export_st.st_size
+            elif entry.name == UPLOADS_DIR:
+                # Resumable uploads: every chunk written moves the mtime
+                for upload in os.scandir(entry.path):
+                    try:
+                        upload_st = upload.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if now - upload_st.st_mtime > RESUMABLE_EXPIRE_SECONDS:
+                        session["temp"].append((upload_st.st_mtime, upload_st.st_size, upload.path))
+                    session["other_bytes"] += upload_st.st_size
+            else:
+                session["other_bytes"] += _tree_bytes(entry.path)
+        elif _matches(entry.name, TEMP_PATTERNS):
+            if now - st.st_mtime > STALE_TEMP_SECONDS:
+                session["temp"].append((st.st_mtime, st.st_size, entry.path))
+            session["other_bytes"] += st.st_size
+        elif _matches(entry.name, LEGACY_EXPORT_PATTERNS):
+            session["artifacts"].append((st.st_mtime, st.st_size, entry.path))
+            session["derived_bytes"] += st.st_size
+        elif entry.name.startswith(STORE_FILE):
+            session["store_bytes"] += st.st_size
+        else:
+            session["other_bytes"] += st.st_size
+    return session
+
+def _scan() -> Tuple[List[Dict[str, Any]], List[Tuple[float, int, str]], float]:
+    """(sessions, stale blob-store temp files, now)."""
+    now = time.time()
+    sessions = []
+    if os.path.isdir(SESSIONS_ROOT):
+        for entry in os.scandir(SESSIONS_ROOT):
+            if entry.is_dir(follow_symlinks=False):
+                try:
+                    sessions.append(_scan_session(entry.path, now))
+                except OSError:
+                    # Removed while scanning
+                    continue
+    live = {session["path"] for session in sessions}
+    for path in list(_image_dirs):
+        if os.path.dirname(path) not in live:
+            del _image_dirs[path]
+
+    blob_temp = []
+    temp_dir = os.path.join(BLOB_DIR, "tmp")
+    if os.path.isdir(temp_dir):
+        for entry in os.scandir(temp_dir):
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if now - st.st_mtime > STALE_TEMP_SECONDS:
+                blob_temp.append((st.st_mtime, st.st_size, entry.path))
+    return sessions, blob_temp, now
+
+def _session_bytes(session: Dict[str, Any]) -> int:
+    return session["images_bytes"] + session["store_bytes"] + session["derived_bytes"] + session["other_bytes"]
+
+def _total_bytes(sessions: List[Dict[str, Any]]) -> int:
+    """Bytes on disk: an image linked from several sessions (one blob) counts once."""
+    inodes = {}
+    for session in sessions:
+        inodes.update(session["inodes"])
+    return sum(inodes.values()) + sum(_session_bytes(session) - session["images_bytes"] for session in sessions)
+
+def _remove_file(path: str) -> bool:
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
+
+def _evict_artifacts(artifacts: List[Tuple[float, int, str]], excess: int) -> Tuple[int, int]:
+    """Delete least recently used artifacts until excess bytes are gone; returns (files, bytes)."""
+    removed = freed = 0
+    for _, size, path in sorted(artifacts):
+        if freed >= excess:
+            break
+        if _remove_file(path):
+            removed += 1
+            freed += size
+    return removed, freed
+
+def _over(total: int, limit: int) -> int:
+    """Bytes to free to get back to QUOTA_TARGET of limit, or 0 within the limit."""
+    if not limit or total <= limit:
+        return 0
+    return total - int(limit * QUOTA_TARGET)
+
+def sweep() -> Dict[str, Any]:
+    """
+    One retention pass, cheapest deletions first:
+    1. temporary files left by interrupted requests, and resumable uploads
+       idle longer than RESUMABLE_EXPIRE_SECONDS;
+    2. sessions idle longer than SESSION_IDLE_TTL_SECONDS;
+    3. derived artifacts (cached exports) of sessions over SESSION_QUOTA_BYTES,
+       least recently used first;
+    4. over SESSIONS_MAX_BYTES: derived artifacts of all sessions, then whole
+       sessions idle at least RETENTION_MIN_IDLE_SECONDS, least recently used
+       first.
+    Sessions with a queued or running job (in any worker) are never
+    deleted. Only one worker process sweeps at a time; the others skip the
+    pass. Returns what was removed.
+    """
+    global _last_sweep
+    with _sweep_lock, get_state().try_lock("retention-sweep") as acquired:
+        if not acquired:
+            return {"skipped": True}
+        start = time.perf_counter()
+        sessions, blob_temp, now = _scan()
+        running = {sanitize_email(email) for email in active_job_emails()}
+
+        def busy(session):
+            return session["session"] in running or has_running_job(session["path"], now - RUNNING_JOB_STALE_SECONDS)
+
+        report = {"temp_files": 0, "artifacts": 0, "sessions": [], "bytes_freed": 0}
+
+        for _, size, path in blob_temp + [temp for session in sessions for temp in session["temp"]]:
+            if _remove_file(path):
+                report["temp_files"] += 1
+                report["bytes_freed"] += size
+        for session in sessions:
+            session["other_bytes"] -= sum(size for _, size, _ in session["temp"])
+
+        def drop_session(session):
+            # Bytes freed: everything but images still linked from other sessions
+            shared = {inode for other in sessions if other is not session for inode in other["inodes"]}
+            freed = _session_bytes(session) - sum(size for inode, size in session["inodes"].items() if inode in shared)
+            remove_session(session["path"])
+            sessions.remove(session)
+            report["sessions"].append(session["session"])
+            report["bytes_freed"] += freed
+
+        if SESSION_IDLE_TTL_SECONDS:
+            for session in list(sessions):
+                if now - session["last_activity"] > SESSION_IDLE_TTL_SECONDS and not busy(session):
+                    drop_session(session)
+
+        for session in sessions:
+            excess = _over(_session_bytes(session), SESSION_QUOTA_BYTES)
+            if excess and session["artifacts"]:
+                removed, freed = _evict_artifacts(session["artifacts"], excess)
+                session["derived_bytes"] -= freed
+                session["artifacts"] = [artifact for artifact in session["artifacts"] if os.path.exists(artifact[2])]
+                report["artifacts"] += removed
+                report["bytes_freed"] += freed
+
+        excess = _over(_total_bytes(sessions), SESSIONS_MAX_BYTES)
+        if excess:
+            artifacts = [(artifact, session) for session in sessions for artifact in session["artifacts"]]
+            for (_, size, path), session in sorted(artifacts, key=lambda item: item[0]):
+                if excess <= 0:
+                    break
+                if _remove_file(path):
+                    session["derived_bytes"] -= size
+                    report["artifacts"] += 1
+                    report["bytes_freed"] += size
+                    excess -= size
+            if excess > 0:
+                idle = [session for session in sessions if now - session["last_activity"] >= RETENTION_MIN_IDLE_SECONDS]
+                for session in sorted(idle, key=lambda session: session["last_activity"]):
+                    if _over(_total_bytes(sessions), SESSIONS_MAX_BYTES) <= 0:
+                        break
+                    if not busy(session):
+                        drop_session(session)
+
+        report["seconds"] = round(time.perf_counter() - start, 4)
+        report["finished_at"] = now
+        if report["temp_files"] or report["artifacts"] or report["sessions"]:
+            print(
+                f"Retention sweep: removed {len(report['sessions'])} sessions, {report['artifacts']} artifacts, "
+                f"{report['temp_files']} temp files ({report['bytes_freed']} bytes)"
+            )
+        _last_sweep = report
+        return report
+
+def _summary(session: Dict[str, Any], now: float) -> Dict[str, Any]:
+    return {
+        "session": session["session"],
+        "bytes": _session_bytes(session),
+        "images_bytes": session["images_bytes"],
+        "store_bytes": session["store_bytes"],
+        "derived_bytes": session["derived_bytes"],
+        "other_bytes": session["other_bytes"],
+        "idle_seconds": round(max(now - session["last_activity"], 0)),
+    }
+
+def get_usage(session_path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Disk usage of all sessions (or of one), with the configured limits and
+    the result of the last sweep. Image bytes are counted in full for each
+    session that links them, and once in total_bytes.
+    """
+    with _sweep_lock:
+        sessions, _, now = _scan()
+    if session_path is not None:
+        name = os.path.basename(os.path.normpath(session_path))
+        shown = [session for session in sessions if session["session"] == name]
+    else:
+        shown = sorted(sessions, key=lambda session: -_session_bytes(session))
+    return {
+        "total_bytes": _total_bytes(sessions),
+        "sessions_max_bytes": SESSIONS_MAX_BYTES or None,
+        "session_quota_bytes": SESSION_QUOTA_BYTES or None,
+        "session_idle_ttl_seconds": SESSION_IDLE_TTL_SECONDS or None,
+        "sessions": [_summary(session, now) for session in shown],
+        "last_sweep": _last_sweep or None,
+    }
+
+def quota_exceeded(session_path: str) -> Optional[str]:
+    """
+    Why the session cannot take more uploads (over its own quota or the
+    total one), or None. When over, a sweep runs first to make room.
+    """
+    if not (SESSION_QUOTA_BYTES or SESSIONS_MAX_BYTES):
+        return None
+    name = os.path.basename(os.path.normpath(session_path))
+    for attempt in range(2):
+        with _sweep_lock:
+            sessions, _, _ = _scan()
+        own = next((session for session in sessions if session["session"] == name), None)
+        if SESSION_QUOTA_BYTES and own and _session_bytes(own) >= SESSION_QUOTA_BYTES:
+            reason = f"Session storage quota of {SESSION_QUOTA_BYTES} bytes reached"
+        elif SESSIONS_MAX_BYTES and _total_bytes(sessions) >= SESSIONS_MAX_BYTES:
+            reason = "Server storage quota reached"
+        else:
+            return None
+        if attempt:
+            return reason
+        sweep()
+
+def _run_sweeper():
+    while True:
+        try:
+            sweep()
+        except Exception as e:
+            print(f"Retention sweep failed: {e}")
+        if _stop.wait(RETENTION_SWEEP_SECONDS):
+            return
+
+def start_sweeper():
+    """Sweep now and then every RETENTION_SWEEP_SECONDS on a background thread."""
+    global _sweeper
+    if RETENTION_SWEEP_SECONDS <= 0 or (_sweeper is not None and _sweeper.is_alive()):
+        return
+    _stop.clear()
+    _sweeper = threading.Thread(target=_run_sweeper, name="retention-sweeper", daemon=True)
+    _sweeper.start()
+
+def stop_sweeper():
+    _stop.set()
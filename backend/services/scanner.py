@@ -0,0 +1,92 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Iterable, List, Tuple
+
+# Threads listing directories / stat'ing files; these calls mostly wait on
+# the file server, so this can be well above the CPU count on NAS mounts
+SCAN_WORKERS = int(os.environ.get("SCAN_WORKERS", "16"))
+# Excel paths stat'ed per task
+STAT_BATCH_SIZE = 256
+
+# path -> (size, mtime_ns)
+FileStats = Dict[str, Tuple[int, int]]
+
+def _scan_dir(path: str, extensions: Tuple[str, ...]) -> Tuple[FileStats, List[str]]:
+    """List one directory: matching files with their stats, and subdirectories to descend into."""
+    files = {}
+    subdirs = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir():
+                        # Like os.walk, symlinked directories are not followed
+                        if not entry.is_symlink():
+                            subdirs.append(entry.path)
+                    elif entry.name.lower().endswith(extensions):
+                        st = entry.stat()
+                        files[entry.path] = (st.st_size, st.st_mtime_ns)
+                except OSError:
+                    continue
+    except OSError:
+        # Unreadable directories are skipped, as os.walk does
+        pass
+    return files, subdirs
+
+def scan_tree(root: str, extensions: Tuple[str, ...], workers: int = None) -> FileStats:
+    """
+    Find files under root whose names end with one of extensions.
+    Directories are listed concurrently, each subtree as soon as its parent
+    has been read, so latency-bound network mounts are walked in parallel.
+    """
+    files = {}
+    with ThreadPoolExecutor(max_workers=workers or SCAN_WORKERS, thread_name_prefix="scan") as pool:
+        pending = {pool.submit(_scan_dir, root, extensions)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                found, subdirs = future.result()
+                files.update(found)
+                pending.update(pool.submit(_scan_dir, subdir, extensions) for subdir in subdirs)
+    return files
+
+def _stat_batch(paths: List[str]) -> FileStats:
+    stats = {}
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except (OSError, ValueError):
+            continue
+        stats[path] = (st.st_size, st.st_mtime_ns)
+    return stats
+
+def stat_paths(paths: Iterable[str], workers: int = None) -> FileStats:
+    """Stats of the given paths that exist, checked in parallel batches."""
+    paths = list(dict.fromkeys(paths))
+    if not paths:
+        return {}
+    batches = [paths[i:i + STAT_BATCH_SIZE] for i in range(0, len(paths), STAT_BATCH_SIZE)]
+    if len(batches) == 1:
+        return _stat_batch(paths)
+    stats = {}
+    with ThreadPoolExecutor(max_workers=workers or SCAN_WORKERS, thread_name_prefix="scan") as pool:
+        for found in pool.map(_stat_batch, batches):
+            stats.update(found)
+    return stats
+
+def diff_snapshot(previous: FileStats, current: FileStats) -> Dict[str, List[str]]:
+    """
+    Paths added, changed (size or mtime) and removed between two scans, plus
+    unchanged ones. Only the first two fields of each stat are compared.
+    """
+    added, changed, unchanged = [], [], []
+    for path, stat in current.items():
+        old = previous.get(path)
+        if old is None:
+            added.append(path)
+        elif tuple(old[:2]) != tuple(stat[:2]):
+            changed.append(path)
+        else:
+            unchanged.append(path)
+    removed = [path for path in previous if path not in current]
+    return {"added": added, "changed": changed, "removed": removed, "unchanged": unchanged}
@@ -1,8 +1,21 @@
 import os
 import shutil
 import re
+import hashlib
+import time
+import uuid
+import aiofiles
+from services.blobs import release_blobs
+from services.data import load_image_blobs, drop_session_state
 
 SESSIONS_ROOT = "sessions"
+# Upload bodies are copied to disk this many bytes at a time
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# A session's last activity is its directory's mtime, refreshed at most this often
+ACTIVITY_RESOLUTION_SECONDS = 60
+
+# session path -> when its activity was last recorded by this process
+_last_touched = {}
 
 def sanitize_email(email: str) -> str:
     """Sanitize email to be safe for directory names."""
@@ -17,16 +30,39 @@ def create_session(email: str) -> str:
     return session_path
 
 def get_session_path(email: str) -> str:
-    """Get the session directory for the user."""
+    """Get the session directory for the user, recording activity on it."""
     safe_email = sanitize_email(email)
-    return os.path.join(SESSIONS_ROOT, safe_email)
+    session_path = os.path.join(SESSIONS_ROOT, safe_email)
+    touch_session(session_path)
+    return session_path
+
+def touch_session(session_path: str):
+    """Mark the session as in use now, so the retention sweeper keeps it."""
+    now = time.time()
+    if now - _last_touched.get(session_path, 0) < ACTIVITY_RESOLUTION_SECONDS:
+        return
+    try:
+        os.utime(session_path)
+        _last_touched[session_path] = now
+    except OSError:
+        pass
 
 def cleanup_session(email: str):
     """Delete the session directory for the user."""
-    safe_email = sanitize_email(email)
-    session_path = os.path.join(SESSIONS_ROOT, safe_email)
+    remove_session(os.path.join(SESSIONS_ROOT, sanitize_email(email)))
+
+def remove_session(session_path: str):
+    """
+    Delete a session directory. Uploaded images are links into the blob
+    store, so this only drops references; blobs no other session links to
+    are deleted with them. Its rows in a shared state database go too.
+    """
+    _last_touched.pop(session_path, None)
     if os.path.exists(session_path):
+        digests = load_image_blobs(session_path).values()
+        drop_session_state(session_path)
         shutil.rmtree(session_path)
+        release_blobs(digests)
 
 def save_file_to_session(email: str, filename: str, content: bytes):
     """Save a file to the user's session directory."""
@@ -35,6 +71,46 @@ def save_file_to_session(email: str, filename: str, content: bytes):
         os.makedirs(session_path)
     
     file_path = os.path.join(session_path, filename)
-    with open(file_path, "wb") as f:
-        f.write(content)
+    partial = _partial_path(file_path)
+    try:
+        with open(partial, "wb") as f:
+            f.write(content)
+        os.replace(partial, file_path)
+    except BaseException:
+        _discard(partial)
+        raise
     return file_path
+
+def _partial_path(file_path: str) -> str:
+    """Private name a file is written under before being renamed into place."""
+    return f"{file_path}.{uuid.uuid4().hex}.part"
+
+def _discard(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+async def save_upload_file(upload, file_path: str) -> str:
+    """
+    Stream an UploadFile to disk in bounded chunks without blocking the event
+    loop. Returns the SHA-256 of the contents, computed on the fly. The file
+    appears at file_path only once complete (written aside, then renamed), so
+    readers never see a partial upload and concurrent uploads of one name
+    cannot interleave.
+    """
+    h = hashlib.sha256()
+    partial = _partial_path(file_path)
+    try:
+        async with aiofiles.open(partial, "wb") as f:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                h.update(chunk)
+                await f.write(chunk)
+        os.replace(partial, file_path)
+    except BaseException:
+        _discard(partial)
+        raise
+    return h.hexdigest()
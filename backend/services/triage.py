@@ -0,0 +1,217 @@
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from services.data import load_record_columns, triage_mark, write_triage
+from services.image import PIXELS_PENDING
+
+# JSON file with this deployment's rule set, applied over DEFAULT_RULES;
+# each triage request may override it again
+TRIAGE_RULES_PATH = os.environ.get("TRIAGE_RULES_PATH", "")
+
+AUTO_REJECTED = "Auto-Rejected"
+NEEDS_REVIEW = "Needs-Review"
+ACTIONS = ("reject", "review")
+
+# A setting of None turns its rule off. "actions" maps a rule to what
+# failing it does ("reject" unless set to "review"); "providers" maps an
+# "Image Provided" value to overrides of the other settings for its images.
+DEFAULT_RULES = {
+    "min_width": 1000,
+    "min_height": 1000,
+    "min_dpi": 300,
+    "formats": ["JPEG", "PNG", "TIFF"],
+    "background": "Yes",
+    "watermark": "No",
+    "reject_color_modes": ["CMYK"],
+    "actions": {},
+    "providers": {},
+}
+# Rule -> the settings it reads, in the order reasons are listed
+RULES = {
+    "resolution": ("min_width", "min_height"),
+    "dpi": ("min_dpi",),
+    "format": ("formats",),
+    "background": ("background",),
+    "watermark": ("watermark",),
+    "color_mode": ("reject_color_modes",),
+}
+# Values of a field that could not be determined (yet): extraction errors,
+# and pixel checks deferred by a quick scan
+UNKNOWN_VALUES = ("N/A", PIXELS_PENDING)
+
+def _check(settings: Dict[str, Any], where: str = ""):
+    for key, value in settings.items():
+        if key == "actions":
+            if not isinstance(value, dict):
+                raise ValueError(f"{where}actions must map rules to {' or '.join(ACTIONS)}")
+            for rule, action in value.items():
+                if rule not in RULES or action not in ACTIONS:
+                    raise ValueError(f"{where}actions: {rule!r} must be one of {', '.join(RULES)} set to {' or '.join(ACTIONS)}")
+        elif key not in DEFAULT_RULES or (key == "providers" and where):
+            raise ValueError(f"Unknown triage setting {where}{key!r}")
+        elif value is None or key == "providers":
+            continue
+        elif key.startswith("min_"):
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+                raise ValueError(f"{where}{key} must be a number of at least 0")
+        elif key in ("background", "watermark"):
+            if value not in ("Yes", "No"):
+                raise ValueError(f"{where}{key} must be 'Yes' or 'No'")
+        elif not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+            raise ValueError(f"{where}{key} must be a list of names")
+
+def load_rules(overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Effective rule set: DEFAULT_RULES, then TRIAGE_RULES_PATH, then
+    overrides, each replacing whole top-level settings. Raises ValueError
+    on unknown or malformed settings.
+    """
+    rules = dict(DEFAULT_RULES)
+    layers = []
+    if TRIAGE_RULES_PATH:
+        with open(TRIAGE_RULES_PATH, "r") as f:
+            layers.append(json.load(f))
+    if overrides:
+        layers.append(overrides)
+    for layer in layers:
+        if not isinstance(layer, dict):
+            raise ValueError("A triage rule set must be a JSON object")
+        _check(layer)
+        rules.update(layer)
+    if not isinstance(rules["providers"], dict):
+        raise ValueError("providers must map provider names to settings")
+    for provider, settings in rules["providers"].items():
+        if not isinstance(settings, dict):
+            raise ValueError(f"providers[{provider!r}] must be an object")
+        _check(settings, f"providers[{provider!r}].")
+    return rules
+
+def _numbers(values: Tuple[Any, ...]) -> np.ndarray:
+    return np.array(values, dtype=float)
+
+def _rule_masks(settings: Dict[str, Any], columns: Dict[str, Any]) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """rule -> (failed, unknown) over every record, for one set of settings; rules turned off are left out."""
+    masks = {}
+    if settings["min_width"] is not None or settings["min_height"] is not None:
+        width, height = columns["width"], columns["height"]
+        unknown = np.isnan(width) | np.isnan(height)
+        failed = (width < (settings["min_width"] or 0)) | (height < (settings["min_height"] or 0))
+        masks["resolution"] = (failed & ~unknown, unknown)
+    if settings["min_dpi"] is not None:
+        dpi = columns["dpi"]
+        # Images without DPI metadata are stored as "0 DPI"
+        unknown = np.isnan(dpi) | (dpi <= 0)
+        masks["dpi"] = ((dpi < settings["min_dpi"]) & ~unknown, unknown)
+    if settings["formats"] is not None:
+        values = columns["format"]
+        unknown = (values.isna() | values.isin(UNKNOWN_VALUES)).to_numpy()
+        allowed = values.isin([name.upper() for name in settings["formats"]]).to_numpy()
+        masks["format"] = (~allowed & ~unknown, unknown)
+    for rule in ("background", "watermark"):
+        if settings[rule] is not None:
+            values = columns[rule]
+            unknown = (~values.isin(("Yes", "No"))).to_numpy()
+            masks[rule] = ((values != settings[rule]).to_numpy() & ~unknown, unknown)
+    if settings["reject_color_modes"] is not None:
+        values = columns["color_mode"]
+        unknown = (values.isna() | values.isin(UNKNOWN_VALUES)).to_numpy()
+        masks["color_mode"] = (values.isin(settings["reject_color_modes"]).to_numpy() & ~unknown, unknown)
+    return masks
+
+def evaluate(rules: Dict[str, Any], columns: Dict[str, Any], count: int) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    """
+    Vectorized rule evaluation over record columns. Returns rule -> records
+    it rejects, and rule -> records it sends to review (failed with a
+    "review" action, or not checkable).
+    """
+    rejects = {rule: np.zeros(count, dtype=bool) for rule in RULES}
+    reviews = {rule: np.zeros(count, dtype=bool) for rule in RULES}
+    providers = rules["providers"]
+    groups = [(rules, ~columns["provider"].isin(list(providers)).to_numpy() if providers else np.ones(count, dtype=bool))]
+    for provider, overrides in providers.items():
+        groups.append(({**rules, **overrides}, (columns["provider"] == provider).to_numpy()))
+    for settings, members in groups:
+        if not members.any():
+            continue
+        for rule, (failed, unknown) in _rule_masks(settings, columns).items():
+            failed &= members
+            if settings["actions"].get(rule, "reject") == "reject":
+                rejects[rule] |= failed
+            else:
+                reviews[rule] |= failed
+            reviews[rule] |= unknown & members
+    return rejects, reviews
+
+def run_triage(session_path: str, rules: Dict[str, Any], dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Apply the rules to every record nobody has decided on yet (pending, or
+    marked by an earlier run; not missing). A record failing a rejecting rule becomes
+    Rejected and Auto-Rejected; one failing only review rules, or one a rule
+    cannot check, stays Pending and is marked Needs-Review. Records that now
+    pass lose an earlier mark. The changes are written in one set-based
+    write that skips records edited meanwhile. Returns per-rule hit counts.
+    """
+    timings = {}
+    start = time.perf_counter()
+    names = ["status", "triage", "width", "height", "dpi", "format", "color_mode", "background", "watermark"]
+    if rules["providers"]:
+        names.append("provider")
+    rows = load_record_columns(session_path, names, undecided=True)
+    count = len(rows)
+    raw = dict(zip(["id", *names], zip(*rows))) if rows else {name: () for name in ["id", *names]}
+    columns = {name: _numbers(raw[name]) for name in ("width", "height", "dpi")}
+    for name in ("format", "color_mode", "background", "watermark", "provider"):
+        columns[name] = pd.Series(raw.get(name, ()), dtype=object)
+    timings["load"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rejects, reviews = evaluate(rules, columns, count)
+    rejected = np.zeros(count, dtype=bool)
+    reasons = np.zeros(count, dtype=np.int64)
+    for bit, rule in enumerate(RULES):
+        rejected |= rejects[rule]
+        reasons |= (rejects[rule] | reviews[rule]).astype(np.int64) << bit
+    outcome = np.where(rejected, 2, np.where(reasons != 0, 1, 0))
+    # Each distinct (outcome, reasons) pair gets its mark once
+    codes, inverse = np.unique((outcome << len(RULES)) | reasons, return_inverse=True)
+    rule_names = list(RULES)
+    decoded = []
+    for code in codes.tolist():
+        triage = (None, NEEDS_REVIEW, AUTO_REJECTED)[code >> len(RULES)]
+        listed = [rule for bit, rule in enumerate(rule_names) if code >> bit & 1]
+        decoded.append(triage_mark({"triage": triage, "triage_reasons": listed}))
+    marks = np.array(decoded, dtype=object)[inverse]
+    current_marks = np.array(raw["triage"], dtype=object)
+    status = np.array(raw["status"], dtype=object)
+    marked = pd.Series(current_marks, dtype=object).notna().to_numpy()
+    new_status = np.where(outcome == 2, "Rejected", np.where((outcome == 1) | marked, "Pending", status))
+    changed = np.flatnonzero((marks != current_marks) | (new_status != status))
+    timings["evaluate"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    updated = 0
+    if not dry_run and len(changed):
+        updated = write_triage(session_path, zip(
+            np.array(raw["id"])[changed].tolist(), status[changed].tolist(), current_marks[changed].tolist(),
+            new_status[changed].tolist(), marks[changed].tolist(),
+        ))
+    timings["write"] = time.perf_counter() - start
+
+    report = {
+        "dry_run": dry_run,
+        "evaluated": count,
+        "auto_rejected": int((outcome == 2).sum()),
+        "needs_review": int((outcome == 1).sum()),
+        "passed": int((outcome == 0).sum()),
+        "changed": len(changed),
+        "updated": updated,
+        "conflicts": 0 if dry_run else len(changed) - updated,
+        "rules": {
+            rule: {"rejected": int(rejects[rule].sum()), "review": int(reviews[rule].sum())} for rule in RULES
+        },
+        "seconds": {name: round(value, 4) for name, value in timings.items()},
+    }
+    return report
@@ -0,0 +1,216 @@
+import hashlib
+import os
+import uuid
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+import aiofiles
+from fastapi.concurrency import run_in_threadpool
+from python_multipart.multipart import MultipartParser, parse_options_header
+from services.blobs import new_upload_path
+from services.data import create_upload, add_upload_range
+from services.session import UPLOAD_CHUNK_SIZE
+
+# Chunk size suggested to clients of resumable uploads (any size is accepted)
+RESUMABLE_CHUNK_SIZE = int(os.environ.get("RESUMABLE_CHUNK_SIZE", str(8 * 1024 * 1024)))
+# Resumable uploads nobody has sent a chunk to for this long are deleted
+RESUMABLE_EXPIRE_SECONDS = int(os.environ.get("RESUMABLE_EXPIRE_SECONDS", str(24 * 3600)))
+
+# Partial files of resumable uploads, inside the session so they count
+# towards its quota and go with it
+UPLOADS_DIR = "uploads"
+# Largest plain (non-file) field of a streamed multipart body
+MAX_FORM_FIELD_SIZE = 64 * 1024
+
+def upload_path(session_path: str, upload_id: str) -> str:
+    return os.path.join(session_path, UPLOADS_DIR, f"{upload_id}.upload")
+
+def received_bytes(ranges: List[List[int]]) -> int:
+    return sum(end - start for start, end in ranges)
+
+def upload_status(upload_id: str, upload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    What a client needs to resume: offset is where the contiguous data from
+    the start ends, ranges lists every byte range received ([start, end)).
+    """
+    ranges = upload["ranges"]
+    return {
+        "upload_id": upload_id,
+        "filename": upload["filename"],
+        "size": upload["size"],
+        "offset": ranges[0][1] if ranges and ranges[0][0] == 0 else 0,
+        "received": received_bytes(ranges),
+        "ranges": ranges,
+        "complete": received_bytes(ranges) == upload["size"],
+        "chunk_size": RESUMABLE_CHUNK_SIZE,
+    }
+
+def new_upload(session_path: str, filename: str, size: int, analysis_mode: Optional[str]) -> Dict[str, Any]:
+    """Start a resumable upload: a file of the final size that chunks are written into."""
+    upload_id = uuid.uuid4().hex
+    path = upload_path(session_path, upload_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.truncate(size)
+    upload = {"filename": filename, "size": size, "analysis_mode": analysis_mode}
+    try:
+        create_upload(session_path, upload_id, upload)
+    except BaseException:
+        os.remove(path)
+        raise
+    return upload_status(upload_id, {**upload, "ranges": []})
+
+async def write_chunk(
+    session_path: str, upload_id: str, upload: Dict[str, Any], offset: int, chunks: AsyncIterator[bytes]
+) -> Optional[List[List[int]]]:
+    """
+    Write a request body into the upload at offset and record it as received.
+    Bytes written before the client went away are kept, so a retry can
+    start after them. Raises ValueError if the chunk reaches past the end
+    of the file; returns the ranges received, or None if the upload is gone.
+    """
+    size = upload["size"]
+    if offset < 0 or offset > size:
+        raise ValueError(f"Offset must be between 0 and {size}")
+    written = 0
+    try:
+        async with aiofiles.open(upload_path(session_path, upload_id), "r+b") as f:
+            await f.seek(offset)
+            async for chunk in chunks:
+                if offset + written + len(chunk) > size:
+                    raise ValueError(f"Chunk at {offset} runs past the end of the {size}-byte file")
+                await f.write(chunk)
+                written += len(chunk)
+    finally:
+        if written:
+            ranges = await run_in_threadpool(add_upload_range, session_path, upload_id, offset, offset + written)
+    return ranges if written else upload["ranges"]
+
+def hash_file(path: str) -> str:
+    """SHA-256 of a file, the digest it is stored under in the blob store."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(UPLOAD_CHUNK_SIZE)
+            if not block:
+                return h.hexdigest()
+            h.update(block)
+
+class _MultipartReceiver:
+    """
+    python-multipart callbacks for receive_multipart: file parts go straight
+    to temporary files in the blob store, hashed as they are written; other
+    parts are collected as form fields.
+    """
+    def __init__(self, file_field: str, before_files: Callable[[Dict[str, str]], None]):
+        self.file_field = file_field
+        self.before_files = before_files
+        self.fields: Dict[str, str] = {}
+        self.files: List[Tuple[str, str, str]] = []
+        self.paths: List[str] = []
+        self.ended = False
+        self._checked = False
+        self._headers: Dict[bytes, bytes] = {}
+        self._header = [b"", b""]
+        self._name = None
+        self._value = None
+        self._file = None
+
+    def callbacks(self) -> Dict[str, Callable]:
+        return {
+            "on_part_begin": self._part_begin,
+            "on_header_field": lambda data, start, end: self._add_header(0, data[start:end]),
+            "on_header_value": lambda data, start, end: self._add_header(1, data[start:end]),
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+            "on_end": self._end,
+        }
+
+    def _part_begin(self):
+        self._headers = {}
+        self._name = self._value = self._file = None
+
+    def _add_header(self, index: int, data: bytes):
+        self._header[index] += data
+
+    def _header_end(self):
+        self._headers[self._header[0].lower()] = self._header[1]
+        self._header = [b"", b""]
+
+    def _headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition"))
+        self._name = options.get(b"name", b"").decode()
+        filename = options.get(b"filename")
+        if filename is None:
+            self._value = bytearray()
+        elif self._name == self.file_field:
+            if not self._checked:
+                self.before_files(self.fields)
+                self._checked = True
+            path = new_upload_path()
+            self.paths.append(path)
+            self._file = (filename.decode(), path, open(path, "wb"), hashlib.sha256())
+
+    def _part_data(self, data: bytes, start: int, end: int):
+        if self._file is not None:
+            _, _, f, h = self._file
+            f.write(data[start:end])
+            h.update(data[start:end])
+        elif self._value is not None:
+            self._value += data[start:end]
+            if len(self._value) > MAX_FORM_FIELD_SIZE:
+                raise ValueError(f"Form field {self._name!r} is larger than {MAX_FORM_FIELD_SIZE} bytes")
+
+    def _part_end(self):
+        if self._file is not None:
+            filename, path, f, h = self._file
+            f.close()
+            self.files.append((filename, path, h.hexdigest()))
+            self._file = None
+        elif self._value is not None:
+            self.fields[self._name] = self._value.decode()
+
+    def _end(self):
+        self.ended = True
+
+    def discard(self):
+        if self._file is not None:
+            self._file[2].close()
+        for path in self.paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+async def receive_multipart(
+    content_type: str, chunks: AsyncIterator[bytes], file_field: str, before_files: Callable[[Dict[str, str]], None]
+) -> Tuple[Dict[str, str], List[Tuple[str, str, str]]]:
+    """
+    Parse a multipart/form-data body as it arrives. Parts named file_field
+    are written straight to temporary files of the blob store
+    (new_upload_path) and hashed on the way, so a file is written to disk
+    once and nothing is spooled first; other parts are returned as form
+    fields. before_files(fields) runs once, before the first file byte is
+    written, and may raise to turn the upload away. Parsing and writing run
+    in the threadpool, UPLOAD_CHUNK_SIZE at a time. Returns (fields,
+    [(filename, temp path, sha256)]); on any error the files written so far
+    are removed. Raises ValueError if the body is not well-formed.
+    """
+    kind, options = parse_options_header(content_type)
+    if kind != b"multipart/form-data" or not options.get(b"boundary"):
+        raise ValueError("Expected a multipart/form-data body")
+    receiver = _MultipartReceiver(file_field, before_files)
+    parser = MultipartParser(options[b"boundary"], receiver.callbacks())
+    try:
+        pending = bytearray()
+        async for chunk in chunks:
+            pending += chunk
+            if len(pending) >= UPLOAD_CHUNK_SIZE:
+                await run_in_threadpool(parser.write, bytes(pending))
+                pending.clear()
+        await run_in_threadpool(parser.write, bytes(pending))
+        parser.finalize()
+        if not receiver.ended:
+            raise ValueError("The multipart body ended early")
+    except BaseException:
+        receiver.discard()
+        raise
+    return receiver.fields, receiver.files
@@ -0,0 +1,114 @@
+import os
+import io
+import queue
+import time
+import threading
+import zipfile
+from typing import Iterator, List, Tuple
+
+# Already-compressed formats are stored as-is; deflating them only costs CPU
+STORED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+ZIP_CHUNK_SIZE = 1024 * 1024
+# Chunks read ahead of the zip writer (bounds memory to ~PREFETCH_CHUNKS MB)
+PREFETCH_CHUNKS = 8
+
+class _StreamSink(io.RawIOBase):
+    """Unseekable write target; ZipFile falls back to data descriptors and ZIP64 as needed."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _prefetch(files: List[Tuple[str, str]], out: queue.Queue, stop: threading.Event):
+    """Read files in chunks ahead of the zip writer."""
+    def put(item):
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        for src_path, arcname in files:
+            try:
+                f = open(src_path, "rb")
+            except OSError:
+                continue
+            with f:
+                st = os.fstat(f.fileno())
+                if not put(("file", arcname, st)):
+                    return
+                for chunk in iter(lambda: f.read(ZIP_CHUNK_SIZE), b""):
+                    if not put(("data", chunk)):
+                        return
+    finally:
+        put(("done",))
+
+def stream_zip(files: List[Tuple[str, str]]) -> Iterator[bytes]:
+    """
+    Generate a ZIP archive of (src_path, arcname) pairs as it is written.
+    Missing files and repeated arcnames are skipped. Nothing is written to disk.
+    """
+    seen = set()
+    unique = []
+    for src_path, arcname in files:
+        if arcname not in seen:
+            seen.add(arcname)
+            unique.append((src_path, arcname))
+
+    chunks = queue.Queue(maxsize=PREFETCH_CHUNKS)
+    stop = threading.Event()
+    reader = threading.Thread(target=_prefetch, args=(unique, chunks, stop), daemon=True)
+    reader.start()
+
+    sink = _StreamSink()
+    try:
+        with zipfile.ZipFile(sink, "w") as zf:
+            entry = None
+            try:
+                while True:
+                    item = chunks.get()
+                    if item[0] == "data":
+                        entry.write(item[1])
+                        data = sink.drain()
+                        if data:
+                            yield data
+                        continue
+
+                    if entry is not None:
+                        entry.close()
+                        entry = None
+                    if item[0] == "done":
+                        break
+
+                    _, arcname, st = item
+                    # ZIP timestamps cannot predate 1980
+                    date_time = max(time.localtime(st.st_mtime)[:6], (1980, 1, 1, 0, 0, 0))
+                    zinfo = zipfile.ZipInfo(arcname, date_time=date_time)
+                    zinfo.external_attr = (st.st_mode & 0xFFFF) << 16
+                    zinfo.file_size = st.st_size  # lets zipfile decide on ZIP64 up front
+                    if arcname.lower().endswith(STORED_EXTENSIONS):
+                        zinfo.compress_type = zipfile.ZIP_STORED
+                    else:
+                        zinfo.compress_type = zipfile.ZIP_DEFLATED
+                    entry = zf.open(zinfo, "w")
+            finally:
+                # Leaves a valid archive even if the client goes away mid-file
+                if entry is not None:
+                    entry.close()
+        yield sink.drain()
+    finally:
+        stop.set()
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """TestClient on the app, with sessions, blobs and locks under a scratch directory."""
+    from fastapi.testclient import TestClient
+    from main import app
+    monkeypatch.chdir(tmp_path)
+    with TestClient(app) as test_client:
+        yield test_client
@@ -0,0 +1,23 @@
+"""
+An unknown ANALYSIS_MODE stops the server at startup instead of silently
+falling through to some mode per upload.
+"""
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def import_image_module(mode: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-c", "import services.image"],
+        cwd=BACKEND_DIR, env=dict(os.environ, ANALYSIS_MODE=mode), capture_output=True, text=True
+    )
+
+def test_unknown_analysis_mode_fails_at_import():
+    result = import_image_module("fast")
+    assert result.returncode != 0
+    assert "ANALYSIS_MODE must be one of full, reduced, quick, not 'fast'" in result.stderr
+
+def test_known_analysis_mode_imports():
+    assert import_image_module("reduced").returncode == 0
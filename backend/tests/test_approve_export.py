@@ -0,0 +1,36 @@
+"""
+Approving an image from the validation page saves its display order, so the
+approved rows of the reports carry it.
+"""
+import csv
+import io
+
+EMAIL = "approver@example.com"
+
+def report_rows(client, endpoint):
+    response = client.get(endpoint, params={"email": EMAIL, "format": "csv"})
+    assert response.status_code == 200, response.text
+    return {row["Image Name"]: row for row in csv.DictReader(io.StringIO(response.content.decode("utf-8-sig")))}
+
+def test_approved_display_order_is_exported(client):
+    from services.data import save_metadata
+    from services.session import get_session_path
+
+    client.post("/auth/login", json={"email": EMAIL}).raise_for_status()
+    save_metadata(get_session_path(EMAIL), [
+        {"sku_id": "SKU1", "image_name": "SKU1_2.jpg", "status": "Pending", "notes": ""},
+        {"sku_id": "SKU1", "image_name": "SKU1_3.jpg", "status": "Pending", "notes": ""},
+    ])
+    # The change the page sends on approve: the order it shows, here derived from the name
+    response = client.post("/validate/bulk-update", json={"email": EMAIL, "changes": [
+        {"image_name": "SKU1_2.jpg", "status": "Approved", "display_order": 2},
+        {"image_name": "SKU1_3.jpg", "status": "Rejected"},
+    ]})
+    assert response.status_code == 200, response.text
+
+    approved = report_rows(client, "/export/approved-excel")
+    assert list(approved) == ["SKU1_2.jpg"]
+    assert approved["SKU1_2.jpg"]["Display Order"] == "2"
+    full = report_rows(client, "/export/excel")
+    assert full["SKU1_2.jpg"]["Display Order"] == "2"
+    assert full["SKU1_3.jpg"]["Display Order"] == ""
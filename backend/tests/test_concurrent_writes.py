@@ -0,0 +1,77 @@
+"""
+Many /validate/bulk-update writers editing the same images at once: every
+write must be applied exactly once and the per-SKU counters must match a
+recount of the records (benchmarks/concurrent_writes.py times the same load).
+"""
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+EMAIL = "writers@example.com"
+WRITERS = 50
+ROUNDS = 4
+SKUS = 5
+STATUSES = ("Approved", "Rejected", "Pending")
+
+def image_name(index: int) -> str:
+    return f"IMG_{index:04d}.jpg"
+
+def writer_changes(writer: int, round_no: int):
+    """
+    Every image is edited by two writers owning one field each. Writer w
+    sets the notes of image w and the display order of image w + 1, the
+    status of image WRITERS + w and the notes of image WRITERS + w + 1
+    (statuses live on images of their own as rejecting clears the order).
+    """
+    return [
+        {"image_name": image_name(writer), "notes": f"writer {writer} round {round_no}"},
+        {"image_name": image_name((writer + 1) % WRITERS), "display_order": round_no + 1},
+        {"image_name": image_name(WRITERS + writer), "status": STATUSES[(writer + round_no) % len(STATUSES)]},
+        {"image_name": image_name(WRITERS + (writer + 1) % WRITERS), "notes": f"writer {writer} round {round_no}"},
+    ]
+
+def test_parallel_bulk_updates(client):
+    from services.data import get_state_version, load_metadata, save_metadata, status_bucket
+    from services.session import get_session_path
+
+    client.post("/auth/login", json={"email": EMAIL}).raise_for_status()
+    session_path = get_session_path(EMAIL)
+    save_metadata(session_path, (
+        {"sku_id": f"SKU{index % SKUS}", "image_name": image_name(index), "status": "Pending", "notes": ""}
+        for index in range(2 * WRITERS)
+    ))
+    version = get_state_version(session_path)
+
+    def write(writer: int):
+        for round_no in range(ROUNDS):
+            response = client.post("/validate/bulk-update", json={"email": EMAIL, "changes": writer_changes(writer, round_no)})
+            assert response.status_code == 200, response.text
+
+    with ThreadPoolExecutor(max_workers=WRITERS) as pool:
+        for future in [pool.submit(write, writer) for writer in range(WRITERS)]:
+            future.result()
+
+    # One version per bulk update, none lost or doubled
+    assert get_state_version(session_path) - version == WRITERS * ROUNDS
+
+    records = {record["image_name"]: record for record in load_metadata(session_path)}
+    last = ROUNDS - 1
+    for index in range(WRITERS):
+        record = records[image_name(index)]
+        assert record["notes"] == f"writer {index} round {last}"
+        assert record["display_order"] == ROUNDS
+        record = records[image_name(WRITERS + index)]
+        assert record["status"] == STATUSES[(index + last) % len(STATUSES)]
+        assert record["notes"] == f"writer {(index - 1) % WRITERS} round {last}"
+
+    recount = {}
+    for record in records.values():
+        counts = recount.setdefault(record["sku_id"], Counter())
+        counts["total"] += 1
+        counts[status_bucket(record)] += 1
+    skus = client.get("/validate/skus", params={"email": EMAIL}).json()
+    assert {
+        sku["sku_id"]: {bucket: sku[bucket] for bucket in ("total", "approved", "rejected", "pending")} for sku in skus
+    } == {
+        sku_id: {bucket: counts[bucket] for bucket in ("total", "approved", "rejected", "pending")}
+        for sku_id, counts in recount.items()
+    }
@@ -0,0 +1,98 @@
+"""
+Near-duplicate search: both pair searches (band columns of the store, and
+bands cut per request) must find exactly the pairs a brute-force comparison
+finds, and cluster members are reported within max_distance.
+"""
+import random
+from itertools import combinations
+
+import pytest
+
+from services.data import load_hashes, save_metadata
+from services.duplicates import (
+    DUPLICATE_DISTANCE_LIMIT, close_pairs, find_duplicates, hash_array, hash_distance, stored_close_pairs
+)
+
+SKUS = 3
+
+def make_records(count: int, seed: int):
+    """Random hashes plus variants a few bits away, some exact copies, some records without a hash."""
+    rng = random.Random(seed)
+    records = []
+    for index in range(count):
+        value = rng.getrandbits(64)
+        records.append({"sku_id": f"SKU{index % SKUS}", "image_name": f"IMG_{index}.jpg", "phash": f"{value:016x}"})
+        for variant in range(rng.randrange(3)):
+            for _ in range(rng.randrange(DUPLICATE_DISTANCE_LIMIT + 1)):
+                value ^= 1 << rng.randrange(64)
+            records.append({
+                "sku_id": f"SKU{rng.randrange(SKUS)}", "image_name": f"IMG_{index}_{variant}.jpg",
+                "phash": f"{value:016x}", "width": rng.randrange(1, 100), "height": 100,
+            })
+    records.append({"sku_id": "SKU0", "image_name": "COPY.jpg", "phash": records[0]["phash"]})
+    records.append({"sku_id": "SKU0", "image_name": "UNHASHED.jpg"})
+    return records
+
+def brute_pairs(phashes, max_distance):
+    names = sorted(set(phashes))
+    return {(a, b) for a, b in combinations(names, 2) if hash_distance(a, b) <= max_distance}
+
+@pytest.fixture
+def session_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "session"
+    path.mkdir()
+    return str(path)
+
+@pytest.mark.parametrize("max_distance", [0, 2, 4, 6, 10])
+def test_close_pairs_match_brute_force(max_distance):
+    names = sorted({record["phash"] for record in make_records(300, max_distance) if "phash" in record})
+    found = {tuple(sorted((names[i], names[j]))) for i, j in close_pairs(hash_array(names), max_distance).tolist()}
+    assert found == brute_pairs(names, max_distance)
+
+@pytest.mark.parametrize("max_distance", [0, 2, 4])
+@pytest.mark.parametrize("sku_id", [None, "SKU1"])
+def test_stored_close_pairs_match_brute_force(session_path, max_distance, sku_id):
+    save_metadata(session_path, make_records(300, max_distance))
+    copies = {}
+    for record_id, phash in load_hashes(session_path, sku_id):
+        copies.setdefault(phash, []).append(record_id)
+    names = list(copies)
+    pairs = stored_close_pairs(session_path, sku_id, copies, hash_array(names), max_distance)
+    found = {tuple(sorted((names[i], names[j]))) for i, j in pairs.tolist()}
+    assert found == brute_pairs(names, max_distance)
+
+@pytest.mark.parametrize("max_distance", [0, 3, 4, 7])
+@pytest.mark.parametrize("sku_id", [None, "SKU1"])
+def test_find_duplicates(session_path, max_distance, sku_id):
+    records = make_records(300, 7)
+    save_metadata(session_path, records)
+    result = find_duplicates(session_path, sku_id, max_distance)
+
+    scope = [record for record in records if sku_id is None or record["sku_id"] == sku_id]
+    phash_of = {record["image_name"]: record.get("phash") for record in scope}
+    assert result["hashed"] == sum(1 for record in scope if "phash" in record)
+    assert result["unhashed"] == len(scope) - result["hashed"]
+
+    seen = set()
+    for cluster in result["clusters"]:
+        names = [image["image_name"] for image in cluster["images"]]
+        assert len(names) > 1 and cluster["keep"] in names
+        assert not seen & set(names)
+        seen.update(names)
+        # Every member joined through the cluster's center, within max_distance of it
+        hashes = {phash_of[name] for name in names}
+        centers = [
+            center for center in hashes
+            if all(hash_distance(center, phash_of[image["image_name"]]) == image["distance"] for image in cluster["images"])
+        ]
+        assert centers
+        assert all(0 <= image["distance"] <= max_distance for image in cluster["images"])
+    # Records sharing a hash always end up in one cluster
+    copies = {}
+    for name, phash in phash_of.items():
+        if phash:
+            copies.setdefault(phash, set()).add(name)
+    for names in copies.values():
+        if len(names) > 1:
+            assert names <= seen
@@ -0,0 +1,235 @@
+"""
+extract_technical_metadata in "full" mode must give the same results as the
+PIL loop it replaced. baseline_extract is a copy of that loop, kept as the
+reference; both run over generated images of every common mode.
+"""
+import os
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw, ImageFilter, ImageStat
+
+from services.image import extract_technical_metadata
+
+COMPARED_FIELDS = (
+    "width", "height", "resolution", "dpi", "size", "format",
+    "color_mode", "background", "watermark", "extraction_status",
+)
+SIZES = ((37, 23), (320, 240), (513, 777), (1200, 900))
+SCENES = ("white_product", "colored_background", "gray_product", "watermark_center", "watermark_corners", "noise", "transparent")
+# Formats that can store each mode
+FORMATS = {
+    "RGB": ("PNG", "JPEG", "TIFF"),
+    "RGBA": ("PNG", "TIFF"),
+    "L": ("PNG", "JPEG", "TIFF"),
+    "P": ("PNG", "TIFF"),
+    "CMYK": ("JPEG", "TIFF"),
+}
+EXTENSIONS = {"PNG": ".png", "JPEG": ".jpg", "TIFF": ".tif"}
+
+def baseline_extract(image_path):
+    """The PIL loop extract_technical_metadata had before the numpy rewrite (unsupported extensions left out)."""
+    try:
+        filesize = os.path.getsize(image_path)
+        filesize_str = f"{filesize / 1024:.2f} KB" if filesize < 1024 * 1024 else f"{filesize / (1024 * 1024):.2f} MB"
+
+        with Image.open(image_path) as img:
+            dpi = img.info.get('dpi')
+            if not dpi:
+                jfif_density = img.info.get('jfif_density')
+                jfif_unit = img.info.get('jfif_unit')
+                if jfif_density and jfif_unit:
+                    if jfif_unit == 1:
+                        dpi = jfif_density
+                    elif jfif_unit == 2:
+                        dpi = (jfif_density[0] * 2.54, jfif_density[1] * 2.54)
+            if not dpi:
+                try:
+                    exif = img.getexif()
+                    if exif:
+                        x_res = exif.get(282)
+                        y_res = exif.get(283)
+                        res_unit = exif.get(296, 2)
+                        if x_res and y_res:
+                            x_dpi = x_res[0] / x_res[1] if isinstance(x_res, tuple) and x_res[1] != 0 else float(x_res)
+                            y_dpi = y_res[0] / y_res[1] if isinstance(y_res, tuple) and y_res[1] != 0 else float(y_res)
+                            if res_unit == 3:
+                                x_dpi *= 2.54
+                                y_dpi *= 2.54
+                            dpi = (x_dpi, y_dpi)
+                except:
+                    pass
+            if not dpi or (isinstance(dpi, tuple) and (dpi[0] <= 1 or dpi[1] <= 1)):
+                dpi = (0, 0)
+            elif isinstance(dpi, (int, float)):
+                dpi = (float(dpi), float(dpi))
+            else:
+                dpi = (float(dpi[0]), float(dpi[1]))
+
+            mode = img.mode
+            w, h = img.size
+            color_desc = mode
+            bands = img.getbands()
+            if mode in ['L', '1']:
+                color_desc = "B&W"
+            elif 'C' in bands and 'M' in bands and 'Y' in bands and 'K' in bands:
+                color_desc = "CMYK"
+            elif mode == 'CMYK':
+                color_desc = "CMYK"
+            elif mode in ['RGB', 'RGBA', 'RGBX', 'RGBa']:
+                hsv_img = img.convert('HSV')
+                stat = ImageStat.Stat(hsv_img)
+                if stat.extrema[1][1] < 30:
+                    color_desc = "B&W"
+                else:
+                    color_desc = "RGB"
+
+            has_bg = "Yes"
+            is_transparent = False
+            if mode in ['RGBA', 'LA'] or 'transparency' in img.info:
+                alpha = img.convert('RGBA').getchannel('A')
+                if alpha.getextrema()[0] < 255:
+                    is_transparent = True
+            if is_transparent:
+                has_bg = "No"
+            else:
+                rgb_img = img.convert('RGB')
+                border_w = max(1, int(w * 0.01))
+                border_h = max(1, int(h * 0.01))
+                edges = [
+                    rgb_img.crop((0, 0, w, border_h)),
+                    rgb_img.crop((0, h - border_h, w, h)),
+                    rgb_img.crop((0, 0, border_w, h)),
+                    rgb_img.crop((w - border_w, 0, w, h))
+                ]
+                white_pixels = 0
+                total_border_pixels = 0
+                for edge in edges:
+                    stat = ImageStat.Stat(edge)
+                    if sum(stat.mean) / 3 > 240:
+                        white_pixels += edge.width * edge.height
+                    total_border_pixels += edge.width * edge.height
+                is_solid_white = (white_pixels / total_border_pixels) > 0.9 if total_border_pixels > 0 else False
+                has_bg = "Yes" if is_solid_white else "No"
+
+            gray = img.convert('L')
+            edges_img = gray.filter(ImageFilter.FIND_EDGES)
+            regions_coords = [
+                (w*0.25, h*0.25, w*0.75, h*0.75),
+                (0, 0, w*0.2, h*0.2),
+                (w*0.8, 0, w, h*0.2),
+                (0, h*0.8, w*0.2, h),
+                (w*0.8, h*0.8, w, h)
+            ]
+            regions_hit = []
+            for i, coords in enumerate(regions_coords):
+                x1, y1, x2, y2 = coords
+                edge_region = edges_img.crop((int(x1), int(y1), int(x2), int(y2)))
+                edge_stat = ImageStat.Stat(edge_region)
+                if edge_stat.mean[0] > 40:
+                    color_region = img.crop((int(x1), int(y1), int(x2), int(y2)))
+                    hsv_region = color_region.convert('HSV')
+                    sat_stat = ImageStat.Stat(hsv_region)
+                    max_saturation = sat_stat.extrema[1][1] if len(sat_stat.extrema) > 1 else 0
+                    if max_saturation < 40:
+                        regions_hit.append(i)
+            if 0 in regions_hit:
+                has_watermark = "Yes"
+            elif len([r for r in regions_hit if r > 0]) >= 3:
+                has_watermark = "Yes"
+            else:
+                has_watermark = "No"
+
+            return {
+                "image_name": os.path.basename(image_path),
+                "width": img.width,
+                "height": img.height,
+                "resolution": f"{img.width}x{img.height}",
+                "dpi": f"{int(dpi[0])} DPI",
+                "size": filesize_str,
+                "format": img.format,
+                "color_mode": color_desc,
+                "background": has_bg,
+                "watermark": has_watermark,
+                "extraction_status": "Extraction Complete!"
+            }
+    except Exception as e:
+        return {
+            "image_name": os.path.basename(image_path) if image_path else "unknown",
+            "width": "N/A", "height": "N/A", "resolution": "N/A", "dpi": "N/A",
+            "size": "N/A", "format": "N/A", "color_mode": "N/A", "background": "N/A", "watermark": "N/A",
+            "extraction_status": f"Error: {str(e)}"
+        }
+
+def _stripes(draw: ImageDraw.ImageDraw, box, fill, step: int):
+    x1, y1, x2, y2 = box
+    for x in range(x1, x2, step):
+        draw.line((x, y1, x, y2), fill=fill)
+
+def render_scene(scene: str, size, seed: int) -> Image.Image:
+    """An RGBA picture of one kind of product shot."""
+    w, h = size
+    rng = np.random.default_rng(seed)
+    if scene == "noise":
+        return Image.fromarray(rng.integers(0, 256, (h, w, 4), dtype=np.uint8)).convert("RGB").convert("RGBA")
+    background = (200, 60, 40, 255) if scene == "colored_background" else (255, 255, 255, 255)
+    img = Image.new("RGBA", size, (0, 0, 0, 0) if scene == "transparent" else background)
+    draw = ImageDraw.Draw(img)
+    product = (w // 5, h // 5, max(w // 5 + 1, w * 4 // 5), max(h // 5 + 1, h * 4 // 5))
+    if scene == "gray_product":
+        draw.ellipse(product, fill=(90, 92, 95, 255))
+    elif scene != "watermark_center":
+        draw.rectangle(product, fill=tuple(int(v) for v in rng.integers(0, 256, 3)) + (255,))
+    step = max(2, min(w, h) // 60)
+    if scene == "watermark_center":
+        _stripes(draw, (w // 4, h // 4, w * 3 // 4, h * 3 // 4), (128, 128, 128, 255), step)
+    if scene == "watermark_corners":
+        for box in (
+            (0, 0, w // 5, h // 5), (w * 4 // 5, 0, w, h // 5),
+            (0, h * 4 // 5, w // 5, h), (w * 4 // 5, h * 4 // 5, w, h),
+        ):
+            _stripes(draw, box, (110, 110, 110, 255), step)
+    return img
+
+def save_as(img: Image.Image, mode: str, fmt: str, path: str, scene: str):
+    if mode == "P" and scene == "transparent":
+        # Palette image whose first entry is transparent
+        img.convert("P", palette=Image.ADAPTIVE, colors=64).save(path, fmt, transparency=0)
+    elif mode == "P":
+        img.convert("RGB").convert("P", palette=Image.ADAPTIVE, colors=64).save(path, fmt)
+    elif mode == "RGBA":
+        img.save(path, fmt)
+    else:
+        img.convert("RGB").convert(mode).save(path, fmt, **({"dpi": (300, 300)} if fmt == "JPEG" else {}))
+
+CASES = [
+    (mode, fmt, size, scene)
+    for mode, formats in FORMATS.items()
+    for fmt in formats
+    for size in SIZES
+    for scene in SCENES
+    if scene != "transparent" or mode in ("RGBA", "P")
+]
+
+@pytest.mark.parametrize("mode,fmt,size,scene", CASES, ids=lambda value: "x".join(map(str, value)) if isinstance(value, tuple) else str(value))
+def test_full_analysis_matches_baseline(tmp_path, mode, fmt, size, scene):
+    path = str(tmp_path / f"{scene}{EXTENSIONS[fmt]}")
+    save_as(render_scene(scene, size, seed=CASES.index((mode, fmt, size, scene))), mode, fmt, path, scene)
+    expected = baseline_extract(path)
+    actual = extract_technical_metadata(path, "full")
+    assert {field: actual[field] for field in COMPARED_FIELDS} == {field: expected[field] for field in COMPARED_FIELDS}
+
+def test_scenes_exercise_every_outcome(tmp_path):
+    """The generated images must cover both answers of every pixel check, or parity says little."""
+    seen = {"color_mode": set(), "background": set(), "watermark": set()}
+    for mode, fmt, size, scene in CASES:
+        if size != SIZES[2]:
+            continue
+        path = str(tmp_path / f"{mode}-{scene}{EXTENSIONS[fmt]}")
+        save_as(render_scene(scene, size, seed=1), mode, fmt, path, scene)
+        result = baseline_extract(path)
+        for field in seen:
+            seen[field].add(result[field])
+    assert seen["color_mode"] >= {"RGB", "B&W", "CMYK", "P"}
+    assert seen["background"] == {"Yes", "No"}
+    assert seen["watermark"] == {"Yes", "No"}
@@ -0,0 +1,91 @@
+"""
+State backends. The PostgreSQL tests run against STATE_DATABASE_URL and are
+skipped unless it names a PostgreSQL database (and psycopg is installed).
+"""
+import json
+import os
+import uuid
+
+import pytest
+
+import services.state as state
+from services.data import drop_session_state, load_metadata, load_sku_counts, patch_records_if, save_metadata
+
+POSTGRES_URL = os.environ.get("STATE_DATABASE_URL", "")
+needs_postgres = pytest.mark.skipif(
+    not POSTGRES_URL.startswith(("postgres://", "postgresql://")), reason="STATE_DATABASE_URL is not a PostgreSQL URL"
+)
+
+RECORDS = [
+    {"sku_id": "SKU 100%", "image_name": "what?.jpg", "status": "Pending", "notes": "50% off?", "display_order": 2},
+    {"sku_id": "SKU 100%", "image_name": "b.jpg", "status": "Pending", "notes": "keep", "display_order": None},
+]
+
+@pytest.mark.parametrize("sql, expected", [
+    ("SELECT id FROM records WHERE session = ? AND id > ?", "SELECT id FROM records WHERE session = %s AND id > %s"),
+    ("SELECT '?', 'it''s ?', \"col?\" WHERE a = ?", "SELECT '?', 'it''s ?', \"col?\" WHERE a = %s"),
+    ("SELECT '100%' WHERE b LIKE 'a%' AND c = ?", "SELECT '100%%' WHERE b LIKE 'a%%' AND c = %s"),
+    ("SELECT 5 % ?", "SELECT 5 %% %s"),
+])
+def test_postgres_placeholders(sql, expected):
+    assert state._postgres_sql(sql) == expected
+
+def check_store(session_path: str):
+    """Round trip of records whose text holds ? and %, and a patch setting fields to None."""
+    save_metadata(session_path, RECORDS)
+    records = load_metadata(session_path)
+    assert [record["image_name"] for record in records] == ["what?.jpg", "b.jpg"]
+    assert records[0]["notes"] == "50% off?"
+
+    with state.get_state().connect(session_path) as conn:
+        rows = conn.execute(
+            "SELECT id, image_name FROM records WHERE session = ? ORDER BY id", (state.get_state().session_key(session_path),)
+        ).fetchall()
+        assert conn.execute("SELECT '?', 'it''s 100%', ?", (7,)).fetchone() == ("?", "it's 100%", 7)
+    record_ids = {name: record_id for record_id, name in rows}
+    updated = patch_records_if(session_path, [
+        (record_ids["what?.jpg"], {"status": "Pending"}, {"status": "Approved", "notes": None, "display_order": None}),
+        (record_ids["b.jpg"], {"status": "Rejected"}, {"notes": "skipped"}),
+    ])
+    assert updated == 1
+    patched, untouched = load_metadata(session_path)
+    # A field patched to None is removed on every backend
+    assert "notes" not in patched and "display_order" not in patched
+    assert patched["status"] == "Approved" and patched["image_name"] == "what?.jpg"
+    assert untouched["notes"] == "keep" and "display_order" in untouched
+
+def test_local_store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    session_path = tmp_path / "session"
+    session_path.mkdir()
+    check_store(str(session_path))
+
+def test_shared_sqlite_store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(state, "_state", state.SharedState(f"sqlite:///{tmp_path / 'state.sqlite'}"))
+    session_path = tmp_path / "session"
+    session_path.mkdir()
+    check_store(str(session_path))
+
+@needs_postgres
+def test_postgres_store(tmp_path, monkeypatch):
+    pytest.importorskip("psycopg")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(state, "_state", state.SharedState(POSTGRES_URL))
+    session_path = tmp_path / f"session-{uuid.uuid4().hex}"
+    session_path.mkdir()
+    try:
+        check_store(str(session_path))
+    finally:
+        drop_session_state(str(session_path))
+
+def test_metadata_json_import(tmp_path, monkeypatch):
+    """A session from before the SQLite store is imported on first access and its JSON file set aside."""
+    monkeypatch.chdir(tmp_path)
+    session_path = tmp_path / "session"
+    session_path.mkdir()
+    (session_path / "metadata.json").write_text(json.dumps(RECORDS))
+    assert [record["image_name"] for record in load_metadata(str(session_path))] == ["what?.jpg", "b.jpg"]
+    assert not (session_path / "metadata.json").exists()
+    assert (session_path / "metadata.json.migrated").exists()
+    assert [(sku["sku_id"], sku["total"], sku["pending"]) for sku in load_sku_counts(str(session_path))] == [("SKU 100%", 2, 2)]
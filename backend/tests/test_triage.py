@@ -0,0 +1,71 @@
+"""
+Auto-triage: which records it touches, and its column-only bulk write, which
+every reader and later writer must see as if the record JSON had been
+patched.
+"""
+import pytest
+
+import services.state as state
+from services.data import apply_image_updates, check_sku_index, load_metadata, load_sku_counts, save_metadata
+from services.triage import load_rules, run_triage
+
+GOOD = {"width": 2000, "height": 2000, "dpi": "300 DPI", "format": "JPEG", "color_mode": "RGB", "background": "Yes", "watermark": "No"}
+
+RECORDS = [
+    {"sku_id": "SKU1", "image_name": "good.jpg", "status": "Pending", **GOOD},
+    {"sku_id": "SKU1", "image_name": "small.jpg", "status": "Pending", "display_order": 3, **GOOD, "width": 200},
+    {"sku_id": "SKU1", "image_name": "unknown.jpg", "status": "Pending", **GOOD, "format": "N/A"},
+    # An Excel row whose image was never uploaded: nothing to check
+    {"sku_id": "SKU2", "image_name": "missing.jpg", "status": "Missing", "notes": "no file"},
+    {"sku_id": "SKU2", "image_name": "approved.jpg", "status": "Approved", "display_order": 1, **GOOD, "width": 200},
+]
+
+@pytest.fixture(params=["local", "shared"])
+def session_path(request, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    if request.param == "shared":
+        monkeypatch.setattr(state, "_state", state.SharedState(f"sqlite:///{tmp_path / 'state.sqlite'}"))
+    path = tmp_path / "session"
+    path.mkdir()
+    save_metadata(str(path), RECORDS)
+    return str(path)
+
+def by_name(session_path):
+    return {record["image_name"]: record for record in load_metadata(session_path)}
+
+def test_triage_leaves_missing_and_decided_records(session_path):
+    report = run_triage(session_path, load_rules())
+    assert report["evaluated"] == 3
+    assert (report["auto_rejected"], report["needs_review"], report["passed"]) == (1, 1, 1)
+
+    records = by_name(session_path)
+    assert records["missing.jpg"] == RECORDS[3]
+    assert records["approved.jpg"] == RECORDS[4]
+    assert records["good.jpg"] == RECORDS[0]
+    small = records["small.jpg"]
+    assert small["status"] == "Rejected" and small["triage"] == "Auto-Rejected"
+    assert small["triage_reasons"] == ["resolution"] and "display_order" not in small
+    unknown = records["unknown.jpg"]
+    assert unknown["status"] == "Pending" and unknown["triage"] == "Needs-Review" and unknown["triage_reasons"] == ["format"]
+
+    assert check_sku_index(session_path)["consistent"]
+    counts = {sku["sku_id"]: (sku["approved"], sku["rejected"], sku["pending"]) for sku in load_sku_counts(session_path)}
+    assert counts == {"SKU1": (0, 1, 2), "SKU2": (1, 0, 1)}
+    # Nothing left to change
+    assert run_triage(session_path, load_rules())["changed"] == 0
+
+def test_triage_write_is_folded_into_later_writes(session_path):
+    run_triage(session_path, load_rules())
+    apply_image_updates(session_path, [("small.jpg", {"notes": "seen"})])
+    small = by_name(session_path)["small.jpg"]
+    assert (small["status"], small["triage"], small["notes"]) == ("Rejected", "Auto-Rejected", "seen")
+
+    # Relaxed rules clear the marks again, including on the record written since
+    report = run_triage(session_path, load_rules({"min_width": None, "formats": None}))
+    assert report["changed"] == report["updated"] == 2
+    records = by_name(session_path)
+    for name in ("small.jpg", "unknown.jpg"):
+        assert records[name]["status"] == "Pending"
+        assert "triage" not in records[name] and "triage_reasons" not in records[name]
+    assert records["small.jpg"]["notes"] == "seen"
+    assert check_sku_index(session_path)["consistent"]
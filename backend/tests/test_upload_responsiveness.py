@@ -0,0 +1,112 @@
+"""
+A slow, large image upload must not hold up other requests: while one
+thread streams a multipart upload to a real server, another keeps reading
+/validate/skus and every read has to come back quickly.
+The upload is three 1600x1600 noise PNGs (about 23 MB) paced over a few
+seconds, scaled down from the 2 GB upload of the original report so the
+test runs in the suite; what matters is that it spans many reads.
+"""
+import io
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+import numpy as np
+import pytest
+from PIL import Image
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EMAIL = "responsive@example.com"
+# Upper bound on a /validate/skus round trip during the upload
+MAX_LATENCY = 1.0
+# The upload body is sent in pieces of PIECE bytes, PIECE_DELAY apart
+PIECE = 256 * 1024
+PIECE_DELAY = 0.02
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+@pytest.fixture
+def server_url(tmp_path):
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR, "--port", str(port), "--log-level", "warning"],
+        cwd=tmp_path, env=dict(os.environ, DERIVATIVES_PREGENERATE="")
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while True:
+        try:
+            httpx.get(url + "/", timeout=2).raise_for_status()
+            break
+        except httpx.HTTPError:
+            if process.poll() is not None or time.time() > deadline:
+                process.kill()
+                pytest.fail("server did not start")
+            time.sleep(0.2)
+    try:
+        yield url
+    finally:
+        process.terminate()
+        process.wait()
+
+def noise_png(seed: int, size=(1600, 1600)) -> bytes:
+    pixels = np.random.default_rng(seed).integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "PNG", compress_level=1)
+    return buffer.getvalue()
+
+def multipart_body(files):
+    boundary = "responsiveness-boundary"
+    parts = [f'--{boundary}\r\nContent-Disposition: form-data; name="email"\r\n\r\n{EMAIL}\r\n'.encode()]
+    for name, data in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="files"; filename="{name}"\r\n'
+            f"Content-Type: image/png\r\n\r\n".encode() + data + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+def test_skus_stay_responsive_during_slow_upload(server_url):
+    httpx.post(server_url + "/auth/login", json={"email": EMAIL}).raise_for_status()
+    body, content_type = multipart_body({f"IMG_{index}.png": noise_png(index) for index in range(3)})
+
+    def paced():
+        for start in range(0, len(body), PIECE):
+            time.sleep(PIECE_DELAY)
+            yield body[start:start + PIECE]
+
+    upload_result = {}
+    def upload():
+        try:
+            response = httpx.post(
+                server_url + "/upload/images", content=paced(), headers={"Content-Type": content_type}, timeout=None
+            )
+            upload_result["status"] = response.status_code
+            upload_result["results"] = response.json().get("results")
+        except Exception as e:
+            upload_result["error"] = e
+
+    uploader = threading.Thread(target=upload)
+    uploader.start()
+    latencies = []
+    with httpx.Client(base_url=server_url, timeout=30) as http:
+        while uploader.is_alive():
+            start = time.perf_counter()
+            http.get("/validate/skus", params={"email": EMAIL}).raise_for_status()
+            latencies.append(time.perf_counter() - start)
+            time.sleep(0.05)
+    uploader.join()
+
+    assert "error" not in upload_result, upload_result.get("error")
+    assert upload_result["status"] == 200
+    assert all(result["meta"]["extraction_status"] == "Extraction Complete!" for result in upload_result["results"])
+    # The upload lasts at least as long as its pacing, so the reads overlapped it
+    assert len(latencies) >= 10
+    assert max(latencies) < MAX_LATENCY, f"slowest /validate/skus took {max(latencies):.2f} s"
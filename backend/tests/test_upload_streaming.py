@@ -0,0 +1,83 @@
+"""
+/upload/images parses its multipart body as it arrives: files go straight
+to the blob store without Starlette spooling the form first, and a
+rejected or broken upload leaves no temporary files behind.
+"""
+import hashlib
+import io
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+EMAIL = "streaming@example.com"
+BOUNDARY = "streaming-boundary"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+
+def png(seed: int) -> bytes:
+    pixels = np.random.default_rng(seed).integers(0, 256, (64, 64, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "PNG")
+    return buffer.getvalue()
+
+def field(name: str, value: str) -> bytes:
+    return f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+
+def file_part(filename: str, data: bytes) -> bytes:
+    return (
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="files"; filename="{filename}"\r\n'
+        f"Content-Type: image/png\r\n\r\n".encode() + data + b"\r\n"
+    )
+
+END = f"--{BOUNDARY}--\r\n".encode()
+
+def temp_uploads():
+    temp_dir = os.path.join("blobs", "tmp")
+    return os.listdir(temp_dir) if os.path.isdir(temp_dir) else []
+
+@pytest.fixture
+def session(client):
+    client.post("/auth/login", json={"email": EMAIL}).raise_for_status()
+    return client
+
+def test_files_stream_to_the_blob_store(session, monkeypatch):
+    from starlette.formparsers import MultiPartParser
+    from services.blobs import blob_path
+
+    async def spooled(self):
+        raise AssertionError("the body was parsed by Starlette")
+    monkeypatch.setattr(MultiPartParser, "parse", spooled)
+
+    images = {"SKU1_1.png": png(1), "SKU1_2.png": png(2)}
+    body = field("email", EMAIL) + b"".join(file_part(name, data) for name, data in images.items()) + END
+    # Sent in small pieces, so parts and boundaries straddle the reads
+    pieces = (body[start:start + 1000] for start in range(0, len(body), 1000))
+    response = session.post("/upload/images", content=pieces, headers={"Content-Type": CONTENT_TYPE})
+    assert response.status_code == 200, response.text
+    assert len(response.json()["results"]) == 2
+    for data in images.values():
+        digest = hashlib.sha256(data).hexdigest()
+        with open(blob_path(digest), "rb") as f:
+            assert f.read() == data
+    assert temp_uploads() == []
+
+def test_email_must_precede_the_files(session):
+    body = file_part("SKU1_1.png", png(1)) + field("email", EMAIL) + END
+    response = session.post("/upload/images", content=body, headers={"Content-Type": CONTENT_TYPE})
+    assert response.status_code == 400
+    assert temp_uploads() == []
+
+def test_no_files(session):
+    response = session.post("/upload/images", content=field("email", EMAIL) + END, headers={"Content-Type": CONTENT_TYPE})
+    assert response.status_code == 422
+
+def test_truncated_body_leaves_no_temp_files(session):
+    body = field("email", EMAIL) + file_part("SKU1_1.png", png(1)) + file_part("SKU1_2.png", png(2))
+    response = session.post("/upload/images", content=body[:-100], headers={"Content-Type": CONTENT_TYPE})
+    assert response.status_code == 400
+    assert temp_uploads() == []
+
+def test_not_multipart(session):
+    response = session.post("/upload/images", json={"email": EMAIL})
+    assert response.status_code == 400
@@ -29,24 +29,129 @@ export const uploadExcel = async (email, file) => {
     return response.data;
 };
 
-export const uploadImages = async (email, files) => {
-    const formData = new FormData();
-    formData.append('email', email);
-    files.forEach((file) => formData.append('files', file));
+// Resumable image uploads: files are sent in chunks that can be retried on
+// their own, several files at a time; each finished file is analyzed by the
+// server while the next ones are still uploading.
+const UPLOAD_PARALLEL_FILES = 3;
+const UPLOAD_PARALLEL_CHUNKS = 2;
+const UPLOAD_RETRIES = 5;
+// localStorage key of upload ids by file, so an upload survives a page reload
+const UPLOADS_STORAGE_KEY = 'resumableUploads';
 
-    const response = await api.post('/upload/images', formData, {
-        headers: { 'Content-Type': 'multipart/form-data' },
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// Network errors and server errors are retried; 4xx answers are final
+const isRetryable = (error) => !error.response || error.response.status >= 500;
+
+const uploadKey = (email, file) => `${email}|${file.name}|${file.size}|${file.lastModified}`;
+
+const storedUploads = () => {
+    try {
+        return JSON.parse(localStorage.getItem(UPLOADS_STORAGE_KEY)) || {};
+    } catch {
+        return {};
+    }
+};
+
+const rememberUpload = (key, uploadId) => {
+    const uploads = storedUploads();
+    if (uploadId) uploads[key] = uploadId;
+    else delete uploads[key];
+    localStorage.setItem(UPLOADS_STORAGE_KEY, JSON.stringify(uploads));
+};
+
+const startUpload = async (email, file, analysisMode) => {
+    const key = uploadKey(email, file);
+    const uploadId = storedUploads()[key];
+    if (uploadId) {
+        try {
+            const response = await api.get(`/upload/resumable/${uploadId}`, { params: { email } });
+            return response.data;
+        } catch (error) {
+            if (error.response?.status !== 404) throw error;
+        }
+    }
+    const response = await api.post('/upload/resumable', {
+        email, filename: file.name, size: file.size, analysis_mode: analysisMode,
     });
+    rememberUpload(key, response.data.upload_id);
     return response.data;
 };
 
-export const getSkus = async (email) => {
-    const response = await api.get(`/validate/skus?email=${encodeURIComponent(email)}`);
+// Sends the chunks the server does not have yet; returns once all arrived
+const sendChunks = async (email, file, status, onBytes) => {
+    const { upload_id: uploadId, chunk_size: chunkSize } = status;
+    const covered = (start, end) => status.ranges.some(([from, to]) => from <= start && end <= to);
+    const offsets = [];
+    for (let offset = 0; offset < file.size; offset += chunkSize) {
+        const end = Math.min(offset + chunkSize, file.size);
+        if (covered(offset, end)) onBytes(end - offset);
+        else offsets.push(offset);
+    }
+    const worker = async () => {
+        while (offsets.length) {
+            const offset = offsets.shift();
+            const end = Math.min(offset + chunkSize, file.size);
+            await api.put(`/upload/resumable/${uploadId}`, file.slice(offset, end), {
+                params: { email, offset },
+                headers: { 'Content-Type': 'application/octet-stream' },
+            });
+            onBytes(end - offset);
+        }
+    };
+    await Promise.all(Array.from({ length: UPLOAD_PARALLEL_CHUNKS }, worker));
+};
+
+const uploadOne = async (email, file, analysisMode, onBytes) => {
+    let status = await startUpload(email, file, analysisMode);
+    for (let attempt = 0; ; attempt++) {
+        // Bytes are reported again on a retry; count them per attempt
+        let sent = 0;
+        try {
+            await sendChunks(email, file, status, (bytes) => { sent += bytes; onBytes(bytes); });
+            break;
+        } catch (error) {
+            onBytes(-sent);
+            if (attempt >= UPLOAD_RETRIES || !isRetryable(error)) throw error;
+            await sleep(1000 * 2 ** attempt);
+            status = (await api.get(`/upload/resumable/${status.upload_id}`, { params: { email } })).data;
+        }
+    }
+    const response = await api.post(`/upload/resumable/${status.upload_id}/finalize`, { email });
+    rememberUpload(uploadKey(email, file), null);
+    return response.data.results;
+};
+
+// options: { analysisMode, onProgress(sentBytes, totalBytes) }; returns
+// { results } like the one-request multipart upload did
+export const uploadImages = async (email, files, { analysisMode = null, onProgress = null } = {}) => {
+    const total = files.reduce((sum, file) => sum + file.size, 0);
+    let sent = 0;
+    const onBytes = (bytes) => {
+        sent += bytes;
+        if (onProgress) onProgress(sent, total);
+    };
+    const results = new Array(files.length);
+    let next = 0;
+    const worker = async () => {
+        while (next < files.length) {
+            const index = next++;
+            results[index] = await uploadOne(email, files[index], analysisMode, onBytes);
+        }
+    };
+    await Promise.all(Array.from({ length: Math.min(UPLOAD_PARALLEL_FILES, files.length) }, worker));
+    return { results: results.flat() };
+};
+
+// params: optional { limit, cursor, fields, status }; with limit or cursor the
+// response is a page: { items, next_cursor }
+export const getSkus = async (email, params = {}) => {
+    const response = await api.get('/validate/skus', { params: { email, ...params } });
     return response.data;
 };
 
-export const getImagesBySku = async (email, skuId) => {
-    const response = await api.get(`/validate/images/${skuId}?email=${encodeURIComponent(email)}`);
+export const getImagesBySku = async (email, skuId, params = {}) => {
+    const response = await api.get(`/validate/images/${skuId}`, { params: { email, ...params } });
     return response.data;
 };
 
@@ -61,8 +166,14 @@ export const updateImageStatus = async (email, imageName, status, displayOrder,
     return response.data;
 };
 
-export const exportExcel = (email) => {
-    window.open(`${API_BASE_URL}/export/excel?email=${encodeURIComponent(email)}`, '_blank');
+// changes: [{ image_name, status?, display_order?, notes? }]; only the fields given are changed
+export const bulkUpdateImages = async (email, changes) => {
+    const response = await api.post('/validate/bulk-update', { email, changes });
+    return response.data;
+};
+
+export const exportExcel = (email, format = 'xlsx') => {
+    window.open(`${API_BASE_URL}/export/excel?email=${encodeURIComponent(email)}&format=${format}`, '_blank');
 };
 
 export const exportZip = (email, sku_id) => {
@@ -73,8 +184,8 @@ export const exportApprovedZip = (email) => {
     window.open(`${API_BASE_URL}/export/approved-zip?email=${encodeURIComponent(email)}`, '_blank');
 };
 
-export const exportApprovedExcel = (email) => {
-    window.open(`${API_BASE_URL}/export/approved-excel?email=${encodeURIComponent(email)}`, '_blank');
+export const exportApprovedExcel = (email, format = 'xlsx') => {
+    window.open(`${API_BASE_URL}/export/approved-excel?email=${encodeURIComponent(email)}&format=${format}`, '_blank');
 };
 
 export const resetSku = async (email, skuId) => {
@@ -82,6 +193,16 @@ export const resetSku = async (email, skuId) => {
     return response.data;
 };
 
+export const runTriage = async (email, rules = null, dryRun = false) => {
+    const response = await api.post('/validate/triage', { email, rules, dry_run: dryRun });
+    return response.data;
+};
+
+export const getTriageRules = async () => {
+    const response = await api.get('/validate/triage/rules');
+    return response.data;
+};
+
 export const processLocalPath = async (email, path, file = null) => {
     const formData = new FormData();
     formData.append('email', email);
@@ -95,10 +216,42 @@ export const processLocalPath = async (email, path, file = null) => {
     return response.data;
 };
 
-export const exportLocalPathExcel = (email) => {
-    window.open(`${API_BASE_URL}/export/local-path-excel?email=${encodeURIComponent(email)}`, '_blank');
+// Starts a background scan; returns { job_id, status }
+export const submitLocalPathJob = async (email, path, file = null) => {
+    const formData = new FormData();
+    formData.append('email', email);
+    formData.append('path', path);
+    if (file) {
+        formData.append('file', file);
+    }
+    const response = await api.post('/upload/local-path/jobs', formData, {
+        headers: { 'Content-Type': 'multipart/form-data' },
+    });
+    return response.data;
+};
+
+export const getJobStatus = async (email, jobId, since = 0) => {
+    const response = await api.get(`/upload/jobs/${jobId}?email=${encodeURIComponent(email)}&since=${since}`);
+    return response.data;
+};
+
+// Server-sent event stream of job progress (for EventSource)
+export const jobEventsUrl = (email, jobId) =>
+    `${API_BASE_URL}/upload/jobs/${jobId}/events?email=${encodeURIComponent(email)}`;
+
+export const cancelJob = async (email, jobId) => {
+    const response = await api.post(`/upload/jobs/${jobId}/cancel`, { email });
+    return response.data;
+};
+
+export const exportLocalPathExcel = (email, format = 'xlsx') => {
+    window.open(`${API_BASE_URL}/export/local-path-excel?email=${encodeURIComponent(email)}&format=${format}`, '_blank');
 };
 
+// Cached thumbnail ('thumb') or large preview ('preview') of a session or local image
+export const derivativeUrl = (path, size = 'thumb', format = 'webp') =>
+    `${API_BASE_URL}/upload/derivative?path=${encodeURIComponent(path)}&size=${size}&format=${format}`;
+
 export const downloadTemplate = (mode = 'project') => {
     window.open(`${API_BASE_URL}/upload/template?mode=${mode}`, '_blank');
 };
@@ -1,6 +1,6 @@
-import React, { useState, useRef } from 'react';
+import React, { useState, useRef, useEffect } from 'react';
 import { useAuth } from '../context/AuthContext';
-import { processLocalPath, exportLocalPathExcel, downloadTemplate } from '../lib/api';
+import { submitLocalPathJob, getJobStatus, jobEventsUrl, cancelJob, exportLocalPathExcel, downloadTemplate } from '../lib/api';
 import { useNavigate } from 'react-router-dom';
 import { motion, AnimatePresence } from 'framer-motion';
 import { FolderOpen, FileSpreadsheet, CheckCircle, AlertCircle, Loader2, ArrowRight, X, Download, HardDrive, Upload as UploadIcon } from 'lucide-react';
@@ -14,8 +14,85 @@ const LocalPathUpload = () => {
     const [status, setStatus] = useState('idle'); // idle, processing, success, error
     const [message, setMessage] = useState('');
     const [processedCount, setProcessedCount] = useState(0);
+    const [job, setJob] = useState(null); // latest job snapshot
+    const [recentResults, setRecentResults] = useState([]);
 
     const excelInputRef = useRef(null);
+    const eventSourceRef = useRef(null);
+    const pollTimerRef = useRef(null);
+    const resultsSeenRef = useRef(0);
+
+    const stopWatching = () => {
+        if (eventSourceRef.current) {
+            eventSourceRef.current.close();
+            eventSourceRef.current = null;
+        }
+        if (pollTimerRef.current) {
+            clearTimeout(pollTimerRef.current);
+            pollTimerRef.current = null;
+        }
+    };
+
+    useEffect(() => stopWatching, []);
+
+    const handleSnapshot = (snapshot) => {
+        setJob(snapshot);
+        if (snapshot.results?.length) {
+            resultsSeenRef.current = snapshot.results_since + snapshot.results.length;
+            setRecentResults((prev) => [...prev, ...snapshot.results].slice(-5));
+        }
+        if (snapshot.status === 'completed' || snapshot.status === 'cancelled') {
+            stopWatching();
+            setProcessedCount(snapshot.results_total);
+            setStatus('success');
+            setMessage(snapshot.message || "Local path processed successfully!");
+        } else if (snapshot.status === 'failed') {
+            stopWatching();
+            setStatus('error');
+            setMessage(snapshot.message || "Processing failed. Please check the path.");
+        }
+    };
+
+    // Fallback when the event stream is unavailable (e.g. buffering proxies)
+    const pollJob = (jobId) => {
+        pollTimerRef.current = setTimeout(async () => {
+            try {
+                const snapshot = await getJobStatus(user, jobId, resultsSeenRef.current);
+                handleSnapshot(snapshot);
+                if (['queued', 'running'].includes(snapshot.status)) pollJob(jobId);
+            } catch (e) {
+                console.error(e);
+                setStatus('error');
+                setMessage(e.response?.data?.detail || "Lost track of the scan job.");
+            }
+        }, 1000);
+    };
+
+    const watchJob = (jobId) => {
+        const source = new EventSource(jobEventsUrl(user, jobId));
+        eventSourceRef.current = source;
+        source.addEventListener('progress', (e) => handleSnapshot(JSON.parse(e.data)));
+        source.onerror = () => {
+            source.close();
+            eventSourceRef.current = null;
+            if (!pollTimerRef.current) pollJob(jobId);
+        };
+    };
+
+    const handleCancel = async () => {
+        if (!job) return;
+        try {
+            await cancelJob(user, job.job_id);
+        } catch (e) {
+            console.error(e);
+        }
+    };
+
+    const formatEta = (seconds) => {
+        if (seconds == null) return '—';
+        if (seconds < 60) return `${Math.ceil(seconds)}s`;
+        return `${Math.floor(seconds / 60)}m ${Math.ceil(seconds % 60)}s`;
+    };
 
     const handleExcelChange = (e) => {
         if (e.target.files[0]) setExcelFile(e.target.files[0]);
@@ -29,11 +106,13 @@ const LocalPathUpload = () => {
         }
 
         try {
+            stopWatching();
             setStatus('processing');
-            const data = await processLocalPath(user, path, excelFile);
-            setProcessedCount(data.count || (data.results ? data.results.length : 0));
-            setStatus('success');
-            setMessage(data.message || "Local path processed successfully!");
+            setJob(null);
+            setRecentResults([]);
+            resultsSeenRef.current = 0;
+            const { job_id } = await submitLocalPathJob(user, path, excelFile);
+            watchJob(job_id);
         } catch (e) {
             console.error(e);
             setStatus('error');
@@ -144,6 +223,32 @@ const LocalPathUpload = () => {
 
                     {/* Status Display */}
                     <AnimatePresence>
+                        {status === 'processing' && job && (
+                            <motion.div initial={{ opacity: 0, y: -10 }} animate={{ opacity: 1, y: 0 }} className="p-4 bg-slate-50 border border-slate-200 rounded-xl text-sm shadow-sm space-y-3">
+                                <div className="flex items-center justify-between font-medium text-slate-600">
+                                    <span>{job.message || (job.status === 'queued' ? 'Waiting to start...' : 'Working...')}</span>
+                                    <span className="font-mono">{job.processed}{job.total != null ? ` / ${job.total}` : ''}</span>
+                                </div>
+                                <div className="w-full h-2 bg-slate-200 rounded-full overflow-hidden">
+                                    <div
+                                        className="h-full bg-emerald-500 transition-all duration-500"
+                                        style={{ width: job.total ? `${Math.min(100, (job.processed / job.total) * 100)}%` : '0%' }}
+                                    />
+                                </div>
+                                <div className="flex items-center justify-between text-xs text-slate-400">
+                                    <span>{job.throughput != null ? `${job.throughput} images/s` : '—'}</span>
+                                    <span>ETA {formatEta(job.eta_seconds)}</span>
+                                </div>
+                                {recentResults.length > 0 && (
+                                    <ul className="text-xs font-mono text-slate-500 space-y-0.5">
+                                        {recentResults.map((r, i) => (
+                                            <li key={`${r.filename}-${i}`} className="truncate">{r.status}: {r.filename}</li>
+                                        ))}
+                                    </ul>
+                                )}
+                            </motion.div>
+                        )}
+
                         {status === 'error' && (
                             <motion.div initial={{ opacity: 0, y: -10 }} animate={{ opacity: 1, y: 0 }} className="p-4 bg-red-50 border border-red-100 text-red-600 rounded-xl flex items-center gap-3 text-sm font-medium shadow-sm">
                                 <AlertCircle className="w-5 h-5 flex-shrink-0" />
@@ -195,6 +300,16 @@ const LocalPathUpload = () => {
                             </div>
                         )}
 
+                        {status === 'processing' && job && (
+                            <button
+                                onClick={handleCancel}
+                                className="w-full py-3 bg-slate-100 hover:bg-red-50 text-slate-600 hover:text-red-600 rounded-xl font-semibold transition-all flex items-center justify-center gap-2"
+                            >
+                                <X className="w-4 h-4" />
+                                Stop Scan (keep processed images)
+                            </button>
+                        )}
+
                         <button
                             onClick={() => navigate('/upload')}
                             className="w-full py-2 text-slate-400 hover:text-slate-600 text-sm font-medium transition-colors"
@@ -13,6 +13,7 @@ const Upload = () => {
     const [imageFiles, setImageFiles] = useState([]);
     const [status, setStatus] = useState('idle'); // idle, uploading_excel, uploading_images, success, error
     const [message, setMessage] = useState('');
+    const [progress, setProgress] = useState(0);
 
     const excelInputRef = useRef(null);
     const imagesInputRef = useRef(null);
@@ -38,7 +39,10 @@ const Upload = () => {
 
             if (imageFiles.length > 0) {
                 setStatus('uploading_images');
-                await uploadImages(user, imageFiles);
+                setProgress(0);
+                await uploadImages(user, imageFiles, {
+                    onProgress: (sent, total) => setProgress(total ? Math.round((sent / total) * 100) : 100),
+                });
             }
 
             setStatus('success');
@@ -177,7 +181,7 @@ const Upload = () => {
 
                             <span className="relative z-20 flex items-center gap-2">
                                 {status === 'uploading_excel' && <><Loader2 className="animate-spin" /> Processing Metadata...</>}
-                                {status === 'uploading_images' && <><Loader2 className="animate-spin" /> Uploading Assets...</>}
+                                {status === 'uploading_images' && <><Loader2 className="animate-spin" /> Uploading Assets... {progress}%</>}
                                 {status === 'idle' && <><UploadIcon className="w-5 h-5" /> Start Processing <ArrowRight className="w-5 h-5 group-hover:translate-x-1 transition-transform" /></>}
                                 {status === 'success' && <><CheckCircle className="w-6 h-6" /> Success!</>}
                                 {status === 'error' && "Retry Upload"}
@@ -1,9 +1,9 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useAuth } from '../context/AuthContext';
-import { getSkus, getImagesBySku, updateImageStatus, exportExcel, exportApprovedExcel, resetSku, API_BASE_URL } from '../lib/api';
+import { getSkus, getImagesBySku, bulkUpdateImages, exportExcel, exportApprovedExcel, resetSku, runTriage, derivativeUrl } from '../lib/api';
 import { motion, AnimatePresence } from 'framer-motion';
-import { Search, ChevronLeft, ChevronRight, Check, X, RotateCcw, Upload, LogOut, CheckCircle, AlertCircle, Download, RefreshCw, ZoomIn, Image, FileSpreadsheet } from 'lucide-react';
+import { Search, ChevronLeft, ChevronRight, Check, X, RotateCcw, Upload, LogOut, CheckCircle, AlertCircle, Download, RefreshCw, ZoomIn, Image, FileSpreadsheet, Sparkles } from 'lucide-react';
 
 const Validation = () => {
     const { user, logout } = useAuth();
@@ -80,7 +80,7 @@ const Validation = () => {
         setLoadingImages(true);
         prevPendingRef.current = null;
         try {
-            const data = await getImagesBySku(user, skuId);
+            const data = await getImagesBySku(user, skuId, { fields: 'card' });
             const processedData = (Array.isArray(data) ? data : []).map(img => {
                 // If display_order is missing, try to extract it from image name (e.g., DEEAT2_2.jpg -> 2)
                 if (img.display_order === null || img.display_order === undefined || img.display_order === '') {
@@ -105,11 +105,15 @@ const Validation = () => {
         ));
 
         try {
+            // Only the changed fields are sent, so edits made elsewhere are kept. Approving
+            // saves the shown order too, which may have been derived from the file name.
+            const change = { image_name: imageName, status: newStatus };
             const currentImg = images.find(img => img.image_name === imageName);
-            if (currentImg) {
-                await updateImageStatus(user, imageName, newStatus, currentImg.display_order, currentImg.notes);
-                loadSkus();
+            if (newStatus === 'Approved' && currentImg && currentImg.display_order != null) {
+                change.display_order = currentImg.display_order;
             }
+            await bulkUpdateImages(user, [change]);
+            loadSkus();
         } catch (error) {
             console.error("Update failed", error);
         }
@@ -119,20 +123,14 @@ const Validation = () => {
         setImages(prev => prev.map(img =>
             img.image_name === imageName ? { ...img, display_order: newOrder } : img
         ));
-        const currentImg = images.find(img => img.image_name === imageName);
-        if (currentImg) {
-            await updateImageStatus(user, imageName, currentImg.status, newOrder, currentImg.notes);
-        }
+        await bulkUpdateImages(user, [{ image_name: imageName, display_order: newOrder }]);
     };
 
     const handleNotesChange = async (imageName, newNotes) => {
         setImages(prev => prev.map(img =>
             img.image_name === imageName ? { ...img, notes: newNotes } : img
         ));
-        const currentImg = images.find(img => img.image_name === imageName);
-        if (currentImg) {
-            await updateImageStatus(user, imageName, currentImg.status, currentImg.display_order, newNotes);
-        }
+        await bulkUpdateImages(user, [{ image_name: imageName, notes: newNotes }]);
     };
 
     const handleReset = async () => {
@@ -155,6 +153,18 @@ const Validation = () => {
         }
     };
 
+    const handleTriage = async () => {
+        try {
+            const result = await runTriage(user);
+            if (selectedSku) await handleSkuSelect(selectedSku);
+            await loadSkus();
+            alert(`Auto-triage checked ${result.evaluated} images: ${result.auto_rejected} rejected, ${result.needs_review} need review.`);
+        } catch (error) {
+            console.error("Auto-triage failed", error);
+            alert("Auto-triage failed. Please try again.");
+        }
+    };
+
     const handleLogout = () => {
         logout();
         navigate('/login');
@@ -253,6 +263,12 @@ const Validation = () => {
                         >
                             <RotateCcw className="w-4 h-4" /> Reset
                         </button>
+                        <button
+                            onClick={handleTriage}
+                            className="px-4 py-2 bg-white text-slate-600 border border-slate-200 rounded-xl hover:bg-slate-50 hover:text-slate-900 transition-all font-medium text-sm flex items-center gap-2 shadow-sm"
+                        >
+                            <Sparkles className="w-4 h-4" /> Auto-triage
+                        </button>
                         <button
                             onClick={() => exportExcel(user)}
                             className="px-5 py-2 bg-emerald-600 hover:bg-emerald-700 text-white rounded-xl font-bold transition-all shadow-md flex items-center gap-2 text-sm relative overflow-hidden group"
@@ -405,7 +421,7 @@ const Validation = () => {
                                 <X className="w-6 h-6" />
                             </button>
                             <img
-                                src={`${API_BASE_URL}/upload/local-image?path=${encodeURIComponent(previewImage.path)}`}
+                                src={derivativeUrl(previewImage.path, 'preview')}
                                 alt={previewImage.name}
                                 className="max-w-full max-h-[85vh] object-contain rounded-lg shadow-2xl border border-white/10"
                             />
@@ -504,7 +520,7 @@ const ImageValidationCard = ({ img, index, onStatusChange, onNotesChange, onOrde
                     {img.image_path ? (
                         <>
                             <img
-                                src={`${API_BASE_URL}/upload/local-image?path=${encodeURIComponent(img.image_path)}`}
+                                src={derivativeUrl(img.image_path, 'thumb')}
                                 alt={img.image_name}
                                 className="max-w-full max-h-full object-contain p-2"
                             />